@@ -1,4 +1,6 @@
+import multiprocessing
 import os
+from pathlib import Path
 from typing import cast
 
 import flet as ft
@@ -10,11 +12,11 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 
-from pathlib import Path
 from src.core.database import Base
+from src.core.database.helpers import create_indexes
 from src.core.database.models import CalcResult, Mode
 from src.ui import App
-from src.utils.constants import dirs, CONFIG_PATH, DATABASE_URL
+from src.utils.constants import CONFIG_PATH, DATABASE_URL, dirs
 
 
 async def main(page: ft.Page) -> None:
@@ -30,6 +32,22 @@ DEFAULT_EXTENSION: blk
 BLOCK_PATH: tdxzs3.cfg
 STOCK_PATH: tdxhy.cfg
 ADDITIONAL_PATH: infoharbor_block.dat
+CALC_ENGINE: bnb
+CALC_WORKERS:
+CALC_BUDGET:
+CALC_REQUIRED: []
+CALC_EXCLUDED: []
+CALC_MAX_SHARED:
+CALC_MAX_JACCARD:
+CALC_COLLAPSE: false
+CALC_PER_BLOCK: false
+EXPORT_RANKING_K: 3
+EXPORT_RANKING_FORMAT: csv
+EXPORT_RANKING_STOCKS: false
+UPDATE_CLEAR: false
+STOCK_EXCLUDE_REGIONS: []
+STOCK_EXCLUDE_PREFIXES: []
+STOCK_EXCLUDE_CODES: []
                 """
             ),
         )
@@ -53,6 +71,7 @@ ADDITIONAL_PATH: infoharbor_block.dat
     )
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_indexes)
 
     async with async_session() as session:
         await session.execute(delete(Mode))
@@ -68,5 +87,7 @@ ADDITIONAL_PATH: infoharbor_block.dat
 
 
 if __name__ == "__main__":
+    # The parallel engine spawns its workers from the frozen executable.
+    multiprocessing.freeze_support()
     Path(dirs.user_data_dir).mkdir(parents=True, exist_ok=True)
     ft.run(main)
@@ -1,6 +1,8 @@
+from .batch import batch_combination_count
 from .combine import get_combination_count
-from .export import export_combinations
+from .export import export_block_best, export_combinations, export_ranking
 from .insertblock import insert_block
+from .lookup import lookup_stock
 from .mode import import_mode_list, insert_mode_item
 from .update import update_data
 
@@ -8,8 +10,12 @@ from .update import update_data
 __all__: list[str] = [
     "update_data",
     "get_combination_count",
+    "batch_combination_count",
     "export_combinations",
+    "export_ranking",
+    "export_block_best",
     "import_mode_list",
     "insert_mode_item",
     "insert_block",
+    "lookup_stock",
 ]
@@ -0,0 +1,174 @@
+import asyncio
+import os
+from collections import Counter
+from math import comb
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.calc import (
+    batch_top_combinations,
+    get_stock_codes,
+    load_block_index,
+)
+from src.core.database import Block
+from src.core.export import write_blk_files
+from src.core.readers import get_modes
+from src.utils.types import CombinationResultDict, Response, StockFilterDict
+
+
+async def batch_combination_count(
+    async_session: async_sessionmaker[AsyncSession],
+    mode_files: List[str | os.PathLike[str]],
+    path: str | os.PathLike[str],
+    top_n: int = 3,
+    k: int = 3,
+    stock_filter: Optional[StockFilterDict] = None,
+) -> Response:
+    """Calculate the top combinations of many mode files in one pass.
+
+    The membership of the union of all mode lists is loaded once and the
+    lists are searched together, see 'batch_top_combinations'. The result
+    of every mode file is written to "ZH{rank}.blk" files in a sub
+    directory of ``path`` named after the file, so the file names must
+    be distinct. The mode list and 'CalcResult' tables are left
+    untouched.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    mode_files : List[str | os.PathLike[str]]
+        Mode files, read with 'get_modes'.
+    path : str | os.PathLike[str]
+        Directory the result directories are created in.
+    top_n : int
+        Number of top combinations per mode file.
+    k : int
+        Number of blocks of a combination.
+    stock_filter : Optional[StockFilterDict]
+        Stocks left out of every count.
+
+    Returns
+    -------
+    Response
+        data maps every mode file path to its number of written
+        combinations, or to an error message.
+
+    """
+    if not 2 <= k <= 6:
+        return Response(
+            code=402,
+            message=f"批量计算: 组合板块数量 {k} 需在 2 到 6 之间",
+            data=None,
+        )
+
+    names: Dict[str, str] = {
+        os.fspath(mode_file): os.path.splitext(os.path.basename(mode_file))[0]
+        for mode_file in mode_files
+    }
+    duplicates = sorted(
+        name for name, count in Counter(names.values()).items() if count > 1
+    )
+    if duplicates:
+        return Response(
+            code=402,
+            message=f"批量计算: 板块文件名重复 {duplicates}",
+            data=None,
+        )
+
+    try:
+        modes: Dict[str, List[str]] = {}
+        for mode_file in names:
+            modes[mode_file] = list(
+                dict.fromkeys(await get_modes(path=mode_file))
+            )
+
+        async with async_session() as session:
+            result = await session.execute(
+                select(Block.id, Block.code).where(
+                    Block.code.in_(
+                        {code for codes in modes.values() for code in codes}
+                    )
+                )
+            )
+            code2id_mapping = {code: id for id, code in result.all()}
+
+        status: Dict[str, int | str] = {}
+        lists: Dict[str, List[str]] = {}
+        for mode_file, codes in modes.items():
+            # Same block order as the mode list built by 'mode2database'.
+            codes = sorted(
+                (code for code in codes if code in code2id_mapping),
+                key=code2id_mapping.__getitem__,
+            )
+            if comb(len(codes), k) <= top_n:
+                status[mode_file] = "需计算的板块数量较少"
+            else:
+                lists[mode_file] = codes
+
+        if not lists:
+            return Response(
+                code=401,
+                message="批量计算: 无可计算的板块文件",
+                data=status,
+            )
+
+        union = list(
+            dict.fromkeys(code for codes in lists.values() for code in codes)
+        )
+        position = {code: i for i, code in enumerate(union)}
+        index = await load_block_index(
+            async_session=async_session,
+            blocks=union,
+            stock_filter=stock_filter,
+        )
+        rows = [
+            np.array([position[code] for code in codes])
+            for codes in lists.values()
+        ]
+        rankings = await asyncio.to_thread(
+            batch_top_combinations,
+            index,
+            rows,
+            top_n,
+            k,
+        )
+
+        for (mode_file, codes), list_rows, ranking in zip(
+            lists.items(), rows, rankings
+        ):
+            ret: List[CombinationResultDict] = []
+            for combo, count in ranking:
+                ret.append(
+                    {
+                        "blocks": [codes[i] for i in combo],
+                        "count": count,
+                        "stocks": await get_stock_codes(
+                            async_session=async_session,
+                            stock_ids=index.intersection(
+                                list_rows[list(combo)]
+                            ),
+                        ),
+                    }
+                )
+
+            save_dir = os.path.join(path, names[mode_file])
+            os.makedirs(save_dir, exist_ok=True)
+            await write_blk_files(path=save_dir, results=ret)
+            status[mode_file] = len(ret)
+
+        return Response(
+            code=200,
+            message="SUCCESS",
+            data=status,
+        )
+
+    except Exception as e:
+        return Response(
+            code=401,
+            message=f"批量计算: 计算过程中出现错误 {e}",
+            data=None,
+        )
@@ -0,0 +1,90 @@
+from .batch import batch_top_combinations
+from .bitset import bitset_top_combinations
+from .cache import load_cached_result, result_cache_key, store_cached_result
+from .collapse import CollapsedIndex, collapse_duplicates, equivalent_codes
+from .diversity import diverse_top_combinations, select_diverse
+from .filters import is_empty_filter
+from .incremental import (
+    RANKING_DEPTH,
+    CalcState,
+    load_state,
+    save_state,
+    update_state,
+)
+from .index import (
+    BlockIndex,
+    get_stock_codes,
+    get_stock_labels,
+    load_block_index,
+)
+from .lookup import StockLookup, load_lookup, save_lookup
+from .matrix import incidence_matrix, matrix_top_combinations, pair_counts
+from .minhash import (
+    build_signatures,
+    load_signatures,
+    minhash_top_combinations,
+)
+from .options import CalcOptions, CalcRanking
+from .overlap import load_pair_overlaps
+from .parallel import parallel_top_combinations
+from .perblock import get_block_best, per_block_top_combinations
+from .progress import CalcCancelled, CalcProgress
+from .ranking import iter_combination_counts, iter_ranking
+from .search import (
+    anytime_top_combinations,
+    bnb_top_combinations,
+    constrained_top_combinations,
+    iter_top_combinations,
+    search_combinations,
+)
+from .sql import sql_combination_count, sql_join_combination_count
+
+
+__all__: list[str] = [
+    "BlockIndex",
+    "load_block_index",
+    "get_stock_codes",
+    "get_stock_labels",
+    "bitset_top_combinations",
+    "incidence_matrix",
+    "pair_counts",
+    "load_pair_overlaps",
+    "matrix_top_combinations",
+    "bnb_top_combinations",
+    "anytime_top_combinations",
+    "constrained_top_combinations",
+    "iter_top_combinations",
+    "diverse_top_combinations",
+    "select_diverse",
+    "collapse_duplicates",
+    "equivalent_codes",
+    "CollapsedIndex",
+    "search_combinations",
+    "parallel_top_combinations",
+    "per_block_top_combinations",
+    "get_block_best",
+    "batch_top_combinations",
+    "minhash_top_combinations",
+    "build_signatures",
+    "load_signatures",
+    "sql_combination_count",
+    "sql_join_combination_count",
+    "is_empty_filter",
+    "load_cached_result",
+    "store_cached_result",
+    "result_cache_key",
+    "CalcOptions",
+    "CalcRanking",
+    "CalcProgress",
+    "CalcCancelled",
+    "iter_combination_counts",
+    "iter_ranking",
+    "RANKING_DEPTH",
+    "CalcState",
+    "load_state",
+    "save_state",
+    "update_state",
+    "StockLookup",
+    "load_lookup",
+    "save_lookup",
+]
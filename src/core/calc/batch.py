@@ -0,0 +1,112 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from .index import BlockIndex
+from .kernels import TopN
+from .matrix import incidence_matrix
+
+
+def batch_top_combinations(
+    index: BlockIndex,
+    lists: List[np.ndarray],
+    top_n: int = 3,
+    k: int = 3,
+) -> List[List[Tuple[Tuple[int, ...], int]]]:
+    """Branch-and-bound search of the top combinations of many mode lists at once.
+
+    ``index`` holds the union of the blocks of all lists. The search of
+    'bnb_top_combinations' runs once over the union in block size order,
+    carrying the lists which contain every block of the current branch.
+    Block sizes and the matrix product counting the last two blocks are
+    computed once per branch and shared by all those lists, each of which
+    keeps its own top-N and pruning threshold.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the union of the lists.
+    lists : List[np.ndarray]
+        Rows of ``index`` of every mode list, in mode list order.
+    top_n : int
+        Number of top combinations to keep per list.
+    k : int
+        Number of blocks of a combination.
+
+    Returns
+    -------
+    List[List[Tuple[Tuple[int, ...], int]]]
+        For every list, (mode list position combination, common stock
+        count) pairs, best first.
+
+    """
+    n = index.n_blocks
+    order = np.argsort(-index.counts, kind="stable")
+    incidence = incidence_matrix(index)[:, order]
+    column = np.empty(n, dtype=np.intp)
+    column[order] = np.arange(n)
+
+    # Membership and mode list position of every column, per list.
+    masks = np.zeros((len(lists), n), dtype=bool)
+    local = np.full((len(lists), n), -1, dtype=np.intp)
+    for i, rows in enumerate(lists):
+        masks[i, column[rows]] = True
+        local[i, column[rows]] = np.arange(len(rows))
+
+    tops = [TopN(top_n) for _ in lists]
+
+    def extend(
+        prefix: List[int], common: np.ndarray, active: List[int]
+    ) -> None:
+        start = prefix[-1] + 1 if prefix else 0
+        candidates = incidence[common, start:]
+        sizes = np.rint(candidates.sum(axis=0)).astype(np.int64)
+        thresholds = np.array([tops[i].threshold for i in active])
+
+        if len(prefix) == k - 2:
+            usable = masks[active, start:] & (sizes >= thresholds[:, None])
+            rest = np.flatnonzero(usable.any(axis=0))
+            if len(rest) < 2:
+                return
+
+            masked = candidates[:, rest]
+            products = np.rint(masked.T @ masked).astype(np.int64)
+            for i, row in zip(active, usable[:, rest]):
+                cols = np.flatnonzero(row)
+                if len(cols) < 2:
+                    continue
+
+                sub = products[np.ix_(cols, cols)]
+                second, third = np.nonzero(
+                    np.triu(sub >= tops[i].threshold, k=1)
+                )
+                combos = np.column_stack(
+                    [np.full_like(second, block) for block in prefix]
+                    + [rest[cols[second]] + start, rest[cols[third]] + start]
+                )
+                tops[i].push_batch(
+                    sub[second, third],
+                    np.sort(local[i][combos], axis=1),
+                )
+            return
+
+        stop = n - start - (k - len(prefix) - 1)
+        for offset in np.argsort(-sizes[:stop], kind="stable"):
+            if sizes[offset] < thresholds.min():
+                break
+
+            block = start + int(offset)
+            live = [
+                i
+                for i in active
+                if masks[i, block] and sizes[offset] >= tops[i].threshold
+            ]
+            if live:
+                extend(
+                    prefix + [block],
+                    common & (incidence[:, block] > 0),
+                    live,
+                )
+
+    extend([], np.ones(incidence.shape[0], dtype=bool), list(range(len(lists))))
+    return [top.results() for top in tops]
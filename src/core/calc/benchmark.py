@@ -0,0 +1,176 @@
+"""Benchmark of the combination engines on a synthetic dataset.
+
+Run with ``python -m src.core.calc.benchmark --blocks 60 --engines sql sql_join bnb``.
+The first engine is the reference, the recall of every engine is the
+share of the reference combinations it found.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.calc import build_signatures
+from src.core.combine import get_combination_count
+from src.core.database import (
+    Block,
+    CalcResult,
+    Mode,
+    Stock,
+    create_async_session,
+    stock_block_association,
+)
+
+
+async def populate_synthetic(
+    async_session: async_sessionmaker[AsyncSession],
+    n_blocks: int,
+    n_stocks: int,
+    clusters: int = 0,
+    seed: int = 0,
+) -> None:
+    """Fill an empty database with random blocks of skewed sizes and use all as mode list.
+
+    With ``clusters``, stocks belong to one of that many sectors and every
+    block draws most of its stocks from two sectors, like industry and
+    concept blocks do.
+    """
+    rng = np.random.default_rng(seed)
+    density = np.broadcast_to(
+        rng.beta(0.6, 6.0, size=n_blocks),
+        (n_stocks, n_blocks),
+    )
+    if clusters:
+        sector = rng.integers(0, clusters, size=n_stocks)
+        focus = rng.integers(0, clusters, size=(2, n_blocks))
+        density = np.where(
+            (sector[:, None] == focus[0]) | (sector[:, None] == focus[1]),
+            rng.uniform(0.2, 0.8, size=n_blocks),
+            density / 4,
+        )
+    membership = rng.random((n_stocks, n_blocks)) < density
+    stock_pos, block_pos = np.nonzero(membership)
+
+    async with async_session() as session:
+        await session.execute(
+            insert(Block.__table__),
+            [
+                {"id": i + 1, "code": f"88{i:04d}", "name": f"板块{i}"}
+                for i in range(n_blocks)
+            ],
+        )
+        await session.execute(
+            insert(Stock.__table__),
+            [
+                {"id": i + 1, "code": f"{i:06d}", "region": int(i % 3)}
+                for i in range(n_stocks)
+            ],
+        )
+        await session.execute(
+            insert(stock_block_association),
+            [
+                {"stock_id": int(s) + 1, "block_id": int(b) + 1}
+                for s, b in zip(stock_pos, block_pos)
+            ],
+        )
+        await session.execute(
+            insert(Mode.__table__),
+            [
+                {
+                    "code": f"88{i:04d}",
+                    "name": f"板块{i}",
+                    "count": int(membership[:, i].sum()),
+                }
+                for i in range(n_blocks)
+            ],
+        )
+        await session.commit()
+
+    await build_signatures(async_session=async_session)
+
+
+async def run(
+    n_blocks: int,
+    n_stocks: int,
+    k: int,
+    top_n: int,
+    engines: List[str],
+    clusters: int = 0,
+) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        async_session = await create_async_session(
+            f"sqlite+aiosqlite:///{os.path.join(tmp, 'benchmark.db')}"
+        )
+        await populate_synthetic(async_session, n_blocks, n_stocks, clusters)
+
+        reference = None
+        print(
+            f"blocks={n_blocks} stocks={n_stocks} clusters={clusters} "
+            f"k={k} top_n={top_n}"
+        )
+        for engine in engines:
+            start = time.perf_counter()
+            response = await get_combination_count(
+                async_session=async_session,
+                top_n=top_n,
+                engine=engine,  # pyright: ignore
+                k=k,
+                incremental=False,
+                cache=False,
+            )
+            elapsed = time.perf_counter() - start
+
+            async with async_session() as session:
+                result = await session.execute(
+                    select(CalcResult.blocks, CalcResult.count).order_by(
+                        CalcResult.id
+                    )
+                )
+                ranking = [(tuple(blocks), count) for blocks, count in result]
+
+            if reference is None:
+                reference = ranking
+            found = {blocks for blocks, _ in ranking}
+            recall = sum(blocks in found for blocks, _ in reference) / max(
+                len(reference), 1
+            )
+            status = "ok" if response["code"] == 200 else response["message"]
+            print(
+                f"{engine:>10} {elapsed:10.3f}s "
+                f"match={ranking == reference} recall={recall:.2f} {status}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--blocks", type=int, default=60)
+    parser.add_argument("--stocks", type=int, default=5000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--clusters", type=int, default=0)
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        default=["sql", "sql_join", "matrix", "bnb"],
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        run(
+            n_blocks=args.blocks,
+            n_stocks=args.stocks,
+            k=args.k,
+            top_n=args.top_n,
+            engines=args.engines,
+            clusters=args.clusters,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
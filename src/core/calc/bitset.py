@@ -0,0 +1,54 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .index import BlockIndex
+from .kernels import TopN, popcount
+from .progress import CalcProgress
+
+
+def bitset_top_combinations(
+    index: BlockIndex,
+    top_n: int = 3,
+    k: int = 3,
+    progress: Optional[CalcProgress] = None,
+) -> List[Tuple[Tuple[int, ...], int]]:
+    """Rank every block triplet with AND + popcount over packed bitsets.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    top_n : int
+        Number of top combinations to keep.
+    k : int
+        Number of blocks of a combination, only 3 is supported.
+    progress : Optional[CalcProgress]
+        Receives the number of counted triplets, cancels the calculation.
+
+    Returns
+    -------
+    List[Tuple[Tuple[int, ...], int]]
+        (block index triplet, common stock count) pairs, best first.
+
+    """
+    if k != 3:
+        raise ValueError(f"bitset engine only supports k=3, got {k}")
+
+    bits = index.bits
+    n = index.n_blocks
+    top = TopN(top_n)
+
+    for i in range(n - 2):
+        for j in range(i + 1, n - 1):
+            pair = bits[i] & bits[j]
+            counts = popcount(pair & bits[j + 1 :])
+            tails = np.arange(j + 1, n)
+            combos = np.column_stack(
+                (np.full_like(tails, i), np.full_like(tails, j), tails)
+            )
+            top.push_batch(counts, combos)
+            if progress is not None:
+                progress.advance(len(tails), top.best)
+
+    return top.results()
@@ -0,0 +1,57 @@
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.database import cache2database, helpers
+from src.utils.constants import CALC_CACHE_MAX_SIZE
+from src.utils.types import CachedResultDict, CombinationResultDict
+
+
+async def load_cached_result(
+    async_session: async_sessionmaker[AsyncSession],
+    key: Optional[str],
+) -> Optional[CachedResultDict]:
+    """Return the cached result of ``key``, None on a miss or without a key."""
+    if key is None:
+        return None
+
+    return await helpers.get_cached_result(
+        async_session=async_session,
+        key=key,
+    )
+
+
+async def store_cached_result(
+    async_session: async_sessionmaker[AsyncSession],
+    key: Optional[str],
+    result: List[CombinationResultDict],
+    equivalents: Dict[str, List[str]],
+    optimal: bool,
+) -> None:
+    """Cache a proven optimal result under ``key``, evicting old entries."""
+    if key is None or not optimal:
+        return
+
+    await cache2database(
+        async_session=async_session,
+        key=key,
+        result={"result": result, "equivalents": equivalents},
+        max_size=CALC_CACHE_MAX_SIZE,
+    )
+
+
+def result_cache_key(
+    blocks: List[str],
+    version: int,
+    **params: Any,
+) -> str:
+    """Content address of a calculation of ``blocks`` on a dataset version.
+
+    The mode blocks are sorted so the key does not depend on the order
+    they were added in, the other parameters are taken as they are.
+    """
+    return helpers.calc_cache_key(
+        blocks=sorted(blocks),
+        version=version,
+        **params,
+    )
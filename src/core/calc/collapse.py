@@ -0,0 +1,116 @@
+from math import comb
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from .index import BlockIndex
+
+
+def collapse_duplicates(index: BlockIndex) -> Tuple[BlockIndex, np.ndarray]:
+    """Keep one representative of every group of blocks with equal stock sets.
+
+    A combination holding two blocks of a group counts the same stocks
+    as one with fewer blocks, and swapping a block for another of its
+    group leaves the count unchanged, so only the representatives need
+    to be enumerated. The packed bitset of a block is its sorted stock
+    set, blocks are grouped by sorting the bitset rows with 'np.unique'.
+    The first block of every group in mode list order is its
+    representative.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+
+    Returns
+    -------
+    Tuple[BlockIndex, np.ndarray]
+        Index of the representatives in mode list order, and the row of
+        the collapsed index of every block of ``index``.
+
+    """
+    _, first, inverse = np.unique(
+        index.bits,
+        axis=0,
+        return_index=True,
+        return_inverse=True,
+    )
+    # Renumber the groups by their first block.
+    order = np.argsort(first)
+    rank = np.empty(len(first), dtype=np.intp)
+    rank[order] = np.arange(len(first))
+
+    reps = first[order]
+    collapsed = BlockIndex(
+        codes=[index.codes[i] for i in reps],
+        stock_ids=index.stock_ids,
+        bits=index.bits[reps],
+    )
+    return collapsed, rank[inverse.reshape(-1)]
+
+
+def equivalent_codes(
+    index: BlockIndex,
+    groups: np.ndarray,
+) -> Dict[str, List[str]]:
+    """Map every representative with duplicates to all codes of its group."""
+    codes: Dict[int, List[str]] = {}
+    for code, group in zip(index.codes, groups):
+        codes.setdefault(int(group), []).append(code)
+
+    return {
+        members[0]: members for members in codes.values() if len(members) > 1
+    }
+
+
+class CollapsedIndex:
+    """Mode list collapsed to one representative per group of equal blocks.
+
+    ``full`` holds the blocks left after the exclusions, ``index`` the
+    representatives and ``groups`` the row of ``index`` of every block of
+    ``full``, see 'collapse_duplicates'. ``position`` maps every kept
+    block code to the row standing for it and ``members`` every row to
+    the codes of its group, in mode list order.
+    """
+
+    def __init__(self, index: BlockIndex, excluded: Sequence[str]) -> None:
+        kept = [i for i, code in enumerate(index.codes) if code not in excluded]
+        self.full = BlockIndex(
+            codes=[index.codes[i] for i in kept],
+            stock_ids=index.stock_ids,
+            bits=index.bits[kept],
+        )
+        self.index, self.groups = collapse_duplicates(self.full)
+        self.position: Dict[str, int] = {
+            code: int(row) for code, row in zip(self.full.codes, self.groups)
+        }
+        self.members: Dict[int, List[str]] = {}
+        for code, row in self.position.items():
+            self.members.setdefault(row, []).append(code)
+
+    def codes(self, combo: Sequence[int], required: Sequence[str]) -> List[str]:
+        """Block codes of a combination of rows, as the user asked for them.
+
+        A row stands for the required block of its group when there is
+        one, so a required block is never replaced by its representative.
+        """
+        chosen = {self.position[code]: code for code in required}
+        return [chosen.get(row, self.index.codes[row]) for row in combo]
+
+    def equivalents(self, codes: Iterable[str]) -> Dict[str, List[str]]:
+        """Map every code standing for other blocks to all codes of its group."""
+        return {
+            code: self.members[self.position[code]]
+            for code in codes
+            if len(self.members[self.position[code]]) > 1
+        }
+
+    def summary(self, k: int) -> Dict[str, Any]:
+        """Block and search space sizes before and after, and the groups."""
+        return {
+            "blocks": self.full.n_blocks,
+            "unique": self.index.n_blocks,
+            "space": comb(self.full.n_blocks, k),
+            "collapsed_space": comb(self.index.n_blocks, k),
+            "equivalents": equivalent_codes(self.full, self.groups),
+        }
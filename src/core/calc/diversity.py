@@ -0,0 +1,148 @@
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .index import BlockIndex
+from .kernels import popcount
+from .progress import CalcProgress
+from .search import iter_top_combinations
+
+
+def select_diverse(
+    ranking: Iterable[Tuple[Tuple[int, ...], int]],
+    index: BlockIndex,
+    top_n: int = 3,
+    max_shared: Optional[int] = None,
+    max_jaccard: Optional[float] = None,
+    on_keep: Optional[Callable[[Tuple[int, ...]], None]] = None,
+) -> List[Tuple[Tuple[int, ...], int]]:
+    """Greedily pick diverse combinations from a ranking streamed best first.
+
+    A combination is kept when it shares at most ``max_shared`` blocks
+    and has a stock Jaccard similarity of at most ``max_jaccard`` with
+    every combination kept before it. The stream is consumed only until
+    ``top_n`` combinations are kept, and every check is against at most
+    ``top_n`` combinations.
+
+    Parameters
+    ----------
+    ranking : Iterable[Tuple[Tuple[int, ...], int]]
+        (block index combination, common stock count) pairs, best first.
+    index : BlockIndex
+        Packed membership of the mode list.
+    top_n : int
+        Number of combinations to keep.
+    max_shared : Optional[int]
+        Most blocks shared with a kept combination, unbounded when omitted.
+    max_jaccard : Optional[float]
+        Highest stock Jaccard similarity with a kept combination,
+        unbounded when omitted.
+    on_keep : Optional[Callable[[Tuple[int, ...]], None]]
+        Called with every kept combination.
+
+    Returns
+    -------
+    List[Tuple[Tuple[int, ...], int]]
+        The kept pairs, best first.
+
+    """
+    selected: List[Tuple[Tuple[int, ...], int]] = []
+    stocks: List[np.ndarray] = []
+
+    for combo, count in ranking:
+        if len(selected) == top_n:
+            break
+
+        common = np.bitwise_and.reduce(index.bits[list(combo)], axis=0)
+        diverse = True
+        for (other, other_count), other_common in zip(selected, stocks):
+            shared_blocks = len(set(combo) & set(other))
+            if max_shared is not None and shared_blocks > max_shared:
+                diverse = False
+                break
+
+            if max_jaccard is not None:
+                shared = int(popcount(common & other_common))
+                union = count + other_count - shared
+                if union and shared / union > max_jaccard:
+                    diverse = False
+                    break
+
+        if diverse:
+            selected.append((combo, count))
+            stocks.append(common)
+            if on_keep is not None:
+                on_keep(combo)
+
+    return selected
+
+
+def diverse_top_combinations(
+    index: BlockIndex,
+    top_n: int = 3,
+    k: int = 3,
+    max_shared: Optional[int] = None,
+    max_jaccard: Optional[float] = None,
+    required: Sequence[int] = (),
+    excluded: Sequence[int] = (),
+    progress: Optional[CalcProgress] = None,
+) -> List[Tuple[Tuple[int, ...], int]]:
+    """Top combinations under a diversity constraint, see 'select_diverse'.
+
+    The candidates are streamed best first by 'iter_top_combinations',
+    whose rounds lower the threshold of the branch-and-bound search only
+    while the greedy selection rejects candidates, and the search stops
+    once ``top_n`` combinations are kept. With ``max_shared`` of 0 the
+    blocks of every kept combination leave the search.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    top_n : int
+        Number of combinations to keep.
+    k : int
+        Number of blocks of a combination.
+    max_shared : Optional[int]
+        Most blocks shared with a kept combination, unbounded when omitted.
+    max_jaccard : Optional[float]
+        Highest stock Jaccard similarity with a kept combination,
+        unbounded when omitted.
+    required : Sequence[int]
+        Block indices every combination contains, at most k.
+    excluded : Sequence[int]
+        Block indices no combination contains.
+    progress : Optional[CalcProgress]
+        Receives the number of searched combinations, cancels the search.
+
+    Returns
+    -------
+    List[Tuple[Tuple[int, ...], int]]
+        (block index combination, common stock count) pairs, best first.
+
+    """
+    excluded = list(excluded)
+    if max_shared is not None and len(required) > max_shared:
+        # Every other combination shares the required blocks.
+        top_n = min(top_n, 1)
+
+    def keep(combo: Tuple[int, ...]) -> None:
+        # Nothing holding a block of a kept combination can be kept.
+        if max_shared == 0:
+            excluded.extend(combo)
+
+    return select_diverse(
+        iter_top_combinations(
+            index,
+            k,
+            depth=max(top_n, 1),
+            required=required,
+            excluded=excluded,
+            progress=progress,
+        ),
+        index=index,
+        top_n=top_n,
+        max_shared=max_shared,
+        max_jaccard=max_jaccard,
+        on_keep=keep,
+    )
@@ -0,0 +1,64 @@
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import ColumnElement, or_
+
+from src.core.database import Stock
+from src.utils.types import StockFilterDict
+
+
+def is_empty_filter(stock_filter: Optional[StockFilterDict]) -> bool:
+    return not stock_filter or not any(stock_filter.values())
+
+
+def compile_stock_mask(
+    codes: np.ndarray,
+    regions: np.ndarray,
+    stock_filter: Optional[StockFilterDict],
+) -> np.ndarray:
+    """Compile the filter rules into a mask of the stocks kept in the counts.
+
+    Parameters
+    ----------
+    codes : np.ndarray
+        Code of every stock.
+    regions : np.ndarray
+        Region of every stock.
+    stock_filter : Optional[StockFilterDict]
+        Excluded regions, code prefixes and codes.
+
+    Returns
+    -------
+    np.ndarray
+        Boolean array, False for the excluded stocks.
+
+    """
+    keep = np.ones(len(codes), dtype=bool)
+    if is_empty_filter(stock_filter):
+        return keep
+
+    assert stock_filter is not None
+    codes = codes.astype(str)
+    keep &= ~np.isin(regions, stock_filter.get("regions", []))
+    keep &= ~np.isin(codes, stock_filter.get("codes", []))
+    for prefix in stock_filter.get("prefixes", []):
+        keep &= ~np.char.startswith(codes, prefix)
+    return keep
+
+
+def stock_filter_condition(
+    stock_filter: Optional[StockFilterDict],
+) -> Optional[ColumnElement[bool]]:
+    """Return the SQL condition selecting the excluded 'Stock' rows, if any."""
+    if is_empty_filter(stock_filter):
+        return None
+
+    assert stock_filter is not None
+    return or_(
+        Stock.region.in_(stock_filter.get("regions", [])),
+        Stock.code.in_(stock_filter.get("codes", [])),
+        *[
+            Stock.code.startswith(prefix, autoescape=True)
+            for prefix in stock_filter.get("prefixes", [])
+        ],
+    )
@@ -0,0 +1,211 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.database import helpers, state2database
+from src.utils.constants import CALC_STATE_MAX_COUNT
+from src.utils.types import CalcStateDict, StockFilterDict
+
+from .index import BlockIndex
+from .kernels import TopN
+from .matrix import incidence_matrix
+from .search import search_combinations
+
+
+# Number of ranked combinations kept between runs, more than the exported
+# top-N so that removing blocks rarely empties the ranking.
+RANKING_DEPTH: int = 32
+
+
+class CalcState:
+    """Ranking of the previous calculation, kept to update it incrementally.
+
+    ``ranking`` holds the best ``depth`` combinations of ``codes`` as block
+    codes, best first. ``complete`` tells whether it holds every
+    combination of the space. States are stored in the database, one per
+    k and stock filter, see 'load_state' and 'save_state'.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        k: int,
+        codes: List[str],
+        ranking: List[Tuple[Tuple[str, ...], int]],
+        complete: bool,
+        stock_filter: Optional[StockFilterDict] = None,
+    ) -> None:
+        self.version = version
+        self.k = k
+        self.codes = codes
+        self.ranking = ranking
+        self.complete = complete
+        self.stock_filter = stock_filter
+
+    @classmethod
+    def from_ranking(
+        cls,
+        version: int,
+        k: int,
+        index: BlockIndex,
+        ranking: List[Tuple[Tuple[int, ...], int]],
+        depth: int,
+        stock_filter: Optional[StockFilterDict] = None,
+    ) -> "CalcState":
+        return cls(
+            version=version,
+            k=k,
+            codes=list(index.codes),
+            ranking=[
+                (tuple(index.codes[i] for i in combo), count)
+                for combo, count in ranking
+            ],
+            complete=len(ranking) < depth,
+            stock_filter=stock_filter,
+        )
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: CalcStateDict,
+        stock_filter: Optional[StockFilterDict] = None,
+    ) -> "CalcState":
+        return cls(
+            version=data["version"],
+            k=data["k"],
+            codes=data["codes"],
+            ranking=[(tuple(combo), count) for combo, count in data["ranking"]],
+            complete=data["complete"],
+            stock_filter=stock_filter,
+        )
+
+    def to_dict(self) -> CalcStateDict:
+        return {
+            "version": self.version,
+            "k": self.k,
+            "codes": self.codes,
+            "ranking": [(list(combo), count) for combo, count in self.ranking],
+            "complete": self.complete,
+        }
+
+    def positions(self, index: BlockIndex) -> List[Tuple[Tuple[int, ...], int]]:
+        """Return the ranking as block positions of ``index``."""
+        position = {code: i for i, code in enumerate(index.codes)}
+        return [
+            (tuple(sorted(position[code] for code in combo)), count)
+            for combo, count in self.ranking
+        ]
+
+
+def state_key(k: int, stock_filter: Optional[StockFilterDict] = None) -> str:
+    """Content address of the parameters a state depends on besides the data."""
+    return helpers.calc_cache_key(k=k, stock_filter=stock_filter or None)
+
+
+async def load_state(
+    async_session: async_sessionmaker[AsyncSession],
+    version: int,
+    k: int,
+    stock_filter: Optional[StockFilterDict] = None,
+) -> Optional[CalcState]:
+    """Return the previous ranking if it was computed on the same data and k."""
+    data = await helpers.get_calc_state(
+        async_session=async_session,
+        key=state_key(k, stock_filter),
+    )
+    if data is None or data["version"] != version or data["k"] != k:
+        return None
+    return CalcState.from_dict(data, stock_filter=stock_filter)
+
+
+async def save_state(
+    async_session: async_sessionmaker[AsyncSession],
+    state: CalcState,
+) -> None:
+    """Store ``state``, keeping the CALC_STATE_MAX_COUNT last used states."""
+    await state2database(
+        async_session=async_session,
+        key=state_key(state.k, state.stock_filter),
+        state=state.to_dict(),
+        max_count=CALC_STATE_MAX_COUNT,
+    )
+
+
+def update_state(
+    state: CalcState,
+    index: BlockIndex,
+    top_n: int,
+    depth: int = RANKING_DEPTH,
+) -> Optional[CalcState]:
+    """Bring the previous ranking up to date with the blocks of ``index``.
+
+    Combinations containing removed blocks are dropped. The remaining
+    ranking seeds the min-heap, then only the combinations containing at
+    least one added block are searched and merged into it.
+
+    Parameters
+    ----------
+    state : CalcState
+        Ranking of the previous calculation.
+    index : BlockIndex
+        Packed membership of the current mode list.
+    top_n : int
+        Number of top combinations that must be exact afterwards.
+    depth : int
+        Number of ranked combinations kept in the new state.
+
+    Returns
+    -------
+    Optional[CalcState]
+        The updated state, None when too few combinations are known to
+        be exact after the removals and a full calculation is needed.
+
+    """
+    previous = set(state.codes)
+    removed = previous - set(index.codes)
+    added = [i for i, code in enumerate(index.codes) if code not in previous]
+
+    kept = [
+        (combo, count)
+        for combo, count in state.ranking
+        if not removed.intersection(combo)
+    ]
+
+    position = {code: i for i, code in enumerate(index.codes)}
+    top = TopN(depth)
+    for combo, count in kept:
+        top.push(count, tuple(sorted(position[code] for code in combo)))
+
+    if added:
+        others = [i for i, code in enumerate(index.codes) if code in previous]
+        order = np.array(added + others)
+        search_combinations(
+            incidence=incidence_matrix(index)[:, order],
+            order=order,
+            top=top,
+            k=state.k,
+            first=np.arange(len(added)),
+        )
+
+    ranking = top.results()
+    if not state.complete:
+        # Combinations left out of the previous ranking count at most its
+        # last count, and may tie with it ahead of ranked ones, so only the
+        # combinations counting more are known to be exact.
+        cutoff = state.ranking[-1][1] if state.ranking else -1
+        ranking = [(combo, count) for combo, count in ranking if count > cutoff]
+        if len(ranking) < top_n:
+            return None
+
+    return CalcState(
+        version=state.version,
+        k=state.k,
+        codes=list(index.codes),
+        ranking=[
+            (tuple(index.codes[i] for i in combo), count)
+            for combo, count in ranking
+        ],
+        complete=state.complete and len(ranking) < depth,
+        stock_filter=state.stock_filter,
+    )
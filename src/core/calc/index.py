@@ -0,0 +1,194 @@
+import itertools
+from typing import List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.database import Block, Stock, stock_block_association
+from src.utils.types import StockFilterDict
+
+from .filters import compile_stock_mask, is_empty_filter
+from .kernels import popcount
+
+
+def pack_membership(
+    stock_pos: np.ndarray,
+    block_pos: np.ndarray,
+    n_blocks: int,
+    n_stocks: int,
+) -> np.ndarray:
+    """Pack (stock, block) membership pairs into one bitset per block.
+
+    Parameters
+    ----------
+    stock_pos : np.ndarray
+        Dense stock position of every membership pair.
+    block_pos : np.ndarray
+        Dense block position of every membership pair.
+    n_blocks : int
+        Number of bitset rows.
+    n_stocks : int
+        Number of stock positions, padded to whole uint64 words.
+
+    Returns
+    -------
+    np.ndarray
+        Array with shape (n_blocks, n_words) and dtype uint64.
+
+    """
+    n_words = max((n_stocks + 63) // 64, 1)
+    bits = np.zeros((n_blocks, n_words), dtype=np.uint64)
+    stock_pos = stock_pos.astype(np.uint64)
+    np.bitwise_or.at(
+        bits,
+        (block_pos, (stock_pos >> np.uint64(6)).astype(np.intp)),
+        np.left_shift(np.uint64(1), stock_pos & np.uint64(63)),
+    )
+    return bits
+
+
+class BlockIndex:
+    """In-memory block membership of the mode list.
+
+    Row ``i`` of ``bits`` is the packed stock set of ``codes[i]`` and bit
+    ``j`` of a row stands for the stock ``stock_ids[j]``.
+    """
+
+    def __init__(
+        self,
+        codes: List[str],
+        stock_ids: np.ndarray,
+        bits: np.ndarray,
+    ) -> None:
+        self.codes = codes
+        self.stock_ids = stock_ids
+        self.bits = bits
+        self.counts: np.ndarray = popcount(bits)
+
+    @property
+    def n_blocks(self) -> int:
+        return len(self.codes)
+
+    def common_positions(self, combo: Sequence[int]) -> np.ndarray:
+        """Return the stock positions shared by every block of ``combo``."""
+        common = np.bitwise_and.reduce(self.bits[list(combo)], axis=0)
+        positions = np.flatnonzero(
+            np.unpackbits(common.view(np.uint8), bitorder="little")
+        )
+        return positions[positions < len(self.stock_ids)]
+
+    def intersection(self, combo: Sequence[int]) -> np.ndarray:
+        """Return the stock ids shared by every block of ``combo``."""
+        return self.stock_ids[self.common_positions(combo)]
+
+
+async def load_block_index(
+    async_session: async_sessionmaker[AsyncSession],
+    blocks: List[str],
+    stock_filter: Optional[StockFilterDict] = None,
+) -> BlockIndex:
+    """Load 'stock_block_association' of the given blocks once into a BlockIndex.
+
+    The stock filter is compiled once into a packed mask ANDed into every
+    block bitset, so the engines count the kept stocks only at no cost.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    blocks : List[str]
+        Block codes, the row order of the index follows this list.
+    stock_filter : Optional[StockFilterDict]
+        Stocks left out of every count.
+
+    Returns
+    -------
+    BlockIndex
+        Packed membership bitsets of the blocks.
+
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            select(Block.id, Block.code).where(Block.code.in_(blocks))
+        )
+        code2id_mapping = {code: id for id, code in result.all()}
+
+        block_ids = [code2id_mapping[code] for code in blocks]
+        result = await session.execute(
+            select(
+                stock_block_association.c.stock_id,
+                stock_block_association.c.block_id,
+            ).where(stock_block_association.c.block_id.in_(block_ids))
+        )
+        rows = result.all()
+        # Rows are flattened, numpy is slow to convert Row objects.
+        pairs = np.fromiter(
+            itertools.chain.from_iterable(rows),
+            dtype=np.int64,
+            count=2 * len(rows),
+        ).reshape(-1, 2)
+
+        stock_ids, stock_pos = np.unique(pairs[:, 0], return_inverse=True)
+        keep = None
+        if not is_empty_filter(stock_filter):
+            result = await session.execute(
+                select(Stock.id, Stock.code, Stock.region).where(
+                    Stock.id.in_([int(stock_id) for stock_id in stock_ids])
+                )
+            )
+            stocks = {id: (code, region) for id, code, region in result.all()}
+            keep = compile_stock_mask(
+                codes=np.array([stocks[int(i)][0] for i in stock_ids]),
+                regions=np.array([stocks[int(i)][1] for i in stock_ids]),
+                stock_filter=stock_filter,
+            )
+
+    order = np.argsort(block_ids)
+    block_pos = np.searchsorted(np.sort(block_ids), pairs[:, 1])
+    bits = pack_membership(
+        stock_pos=stock_pos,
+        block_pos=order[block_pos],
+        n_blocks=len(blocks),
+        n_stocks=len(stock_ids),
+    )
+    if keep is not None:
+        bits &= pack_membership(
+            stock_pos=np.flatnonzero(keep),
+            block_pos=np.zeros(int(keep.sum()), dtype=np.intp),
+            n_blocks=1,
+            n_stocks=len(stock_ids),
+        )
+    return BlockIndex(codes=list(blocks), stock_ids=stock_ids, bits=bits)
+
+
+async def get_stock_codes(
+    async_session: async_sessionmaker[AsyncSession],
+    stock_ids: np.ndarray,
+) -> List[str]:
+    """Return sorted "{region}{code}" strings of the given stock ids."""
+    async with async_session() as session:
+        result = await session.execute(
+            select(Stock.region, Stock.code).where(
+                Stock.id.in_([int(stock_id) for stock_id in stock_ids])
+            )
+        )
+        return sorted(f"{region}{code}" for region, code in result.all())
+
+
+async def get_stock_labels(
+    async_session: async_sessionmaker[AsyncSession],
+    stock_ids: np.ndarray,
+) -> np.ndarray:
+    """Return the "{region}{code}" string of every stock id, in the same order."""
+    async with async_session() as session:
+        result = await session.execute(
+            select(Stock.id, Stock.region, Stock.code).where(
+                Stock.id.in_([int(stock_id) for stock_id in stock_ids])
+            )
+        )
+        labels = {id: f"{region}{code}" for id, region, code in result.all()}
+
+    return np.array(
+        [labels[int(stock_id)] for stock_id in stock_ids], dtype=object
+    )
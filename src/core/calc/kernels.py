@@ -0,0 +1,93 @@
+import heapq
+from typing import List, Set, Tuple
+
+import numpy as np
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Count set bits of packed bitsets along the last axis.
+
+    Parameters
+    ----------
+    words : np.ndarray
+        Packed uint64 bitsets, one bitset per row.
+
+    Returns
+    -------
+    np.ndarray
+        Number of set bits of every row.
+
+    """
+    return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+
+
+class TopN:
+    """Bounded ranking of block combinations kept in a min-heap.
+
+    Combinations are ranked by count descending, ties are broken by the
+    combination indices ascending, which is the order of
+    ``itertools.combinations`` over the mode list.
+    """
+
+    def __init__(self, n: int) -> None:
+        self.n = n
+        self._heap: List[Tuple[int, Tuple[int, ...]]] = []
+        self._members: Set[Tuple[int, ...]] = set()
+
+    @property
+    def threshold(self) -> int:
+        """Smallest count a combination needs to enter the ranking."""
+        if len(self._heap) < self.n:
+            return -1
+        return self._heap[0][0]
+
+    @property
+    def best(self) -> int:
+        """Largest count of the ranking, -1 when it is empty."""
+        if not self._heap:
+            return -1
+        return max(self._heap)[0]
+
+    def push(self, count: int, combo: Tuple[int, ...]) -> None:
+        """Push a combination, ignored when it is already ranked."""
+        key = tuple(-i for i in combo)
+        if key in self._members:
+            return
+
+        item = (count, key)
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, item)
+        elif item > self._heap[0]:
+            self._members.discard(heapq.heapreplace(self._heap, item)[1])
+        else:
+            return
+        self._members.add(key)
+
+    def push_batch(self, counts: np.ndarray, combos: np.ndarray) -> None:
+        """Push a batch of combinations.
+
+        Parameters
+        ----------
+        counts : np.ndarray
+            Common stock count of every combination.
+        combos : np.ndarray
+            Sorted block indices of every combination, one combination per row.
+
+        """
+        candidates = np.flatnonzero(counts >= self.threshold)
+        if len(candidates) > self.n:
+            kth = np.partition(counts[candidates], -self.n)[-self.n]
+            candidates = candidates[counts[candidates] >= kth]
+            keys = [combos[candidates, i] for i in range(combos.shape[1])]
+            order = np.lexsort(keys[::-1] + [-counts[candidates]])
+            candidates = candidates[order[: self.n]]
+
+        for index in candidates:
+            self.push(int(counts[index]), tuple(int(i) for i in combos[index]))
+
+    def results(self) -> List[Tuple[Tuple[int, ...], int]]:
+        """Return the ranking as (combination, count) pairs, best first."""
+        return [
+            (tuple(-i for i in combo), count)
+            for count, combo in sorted(self._heap, reverse=True)
+        ]
@@ -0,0 +1,118 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .index import BlockIndex
+from .search import bnb_top_combinations
+
+
+class StockLookup:
+    """Inverted index of the mode list, the packed block set of every stock.
+
+    Row ``j`` of ``masks`` has bit ``i`` set when the stock
+    ``index.stock_ids[j]`` belongs to the block ``index.codes[i]``.
+    """
+
+    def __init__(self, index: BlockIndex, version: int) -> None:
+        self.index = index
+        self.version = version
+
+        unpacked = np.unpackbits(
+            index.bits.view(np.uint8),
+            axis=1,
+            bitorder="little",
+        )[:, : len(index.stock_ids)]
+        n_words = max((index.n_blocks + 63) // 64, 1)
+        packed = np.zeros((len(index.stock_ids), n_words * 8), dtype=np.uint8)
+        packed[:, : (index.n_blocks + 7) // 8] = np.packbits(
+            unpacked.T,
+            axis=1,
+            bitorder="little",
+        )
+        self.masks: np.ndarray = packed.view(np.uint64)
+        self._rows = {int(id): row for row, id in enumerate(index.stock_ids)}
+
+    def _mask(self, stock_id: int) -> Optional[np.ndarray]:
+        row = self._rows.get(stock_id)
+        return None if row is None else self.masks[row]
+
+    def blocks(self, stock_id: int) -> np.ndarray:
+        """Return the positions of the mode blocks containing the stock."""
+        mask = self._mask(stock_id)
+        if mask is None:
+            return np.empty(0, dtype=np.intp)
+
+        positions = np.flatnonzero(
+            np.unpackbits(mask.view(np.uint8), bitorder="little")
+        )
+        return positions[positions < self.index.n_blocks]
+
+    def contains(self, stock_id: int, combo: Sequence[int]) -> bool:
+        """Whether every block of ``combo`` contains the stock."""
+        mask = self._mask(stock_id)
+        if mask is None:
+            return False
+
+        combo = np.asarray(combo, dtype=np.intp)
+        words = mask[combo >> 6] >> (combo & 63).astype(np.uint64)
+        return bool(np.all(words & np.uint64(1)))
+
+    def ranking(
+        self,
+        stock_id: int,
+        top_n: int = 3,
+        k: int = 3,
+    ) -> List[Tuple[Tuple[int, ...], int]]:
+        """Top k-block combinations containing the stock.
+
+        Only the blocks containing the stock can form such a combination,
+        so the search runs on those rows of the index.
+
+        Parameters
+        ----------
+        stock_id : int
+            Stock id.
+        top_n : int
+            Number of top combinations to keep.
+        k : int
+            Number of blocks of a combination.
+
+        Returns
+        -------
+        List[Tuple[Tuple[int, ...], int]]
+            (block index combination, common stock count) pairs, best
+            first.
+
+        """
+        rows = self.blocks(stock_id)
+        if len(rows) < k:
+            return []
+
+        sub = BlockIndex(
+            codes=[self.index.codes[i] for i in rows],
+            stock_ids=self.index.stock_ids,
+            bits=self.index.bits[rows],
+        )
+        return [
+            (tuple(int(rows[i]) for i in combo), count)
+            for combo, count in bnb_top_combinations(sub, top_n, k)
+        ]
+
+
+_LOOKUP: Optional[StockLookup] = None
+
+
+def load_lookup(version: int, codes: List[str]) -> Optional[StockLookup]:
+    """Return the inverted index of the mode list if it is still current."""
+    if (
+        _LOOKUP is None
+        or _LOOKUP.version != version
+        or _LOOKUP.index.codes != codes
+    ):
+        return None
+    return _LOOKUP
+
+
+def save_lookup(lookup: Optional[StockLookup]) -> None:
+    global _LOOKUP
+    _LOOKUP = lookup
@@ -0,0 +1,86 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .index import BlockIndex
+from .kernels import TopN
+from .progress import CalcProgress
+
+
+def incidence_matrix(index: BlockIndex) -> np.ndarray:
+    """Unpack the block bitsets into a stock x block incidence matrix.
+
+    The matrix is stored as float32 so that products run through BLAS,
+    counts stay exact as long as they are below 2**24.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+
+    Returns
+    -------
+    np.ndarray
+        Array with shape (n_stocks, n_blocks).
+
+    """
+    unpacked = np.unpackbits(
+        index.bits.view(np.uint8),
+        axis=1,
+        bitorder="little",
+    )[:, : len(index.stock_ids)]
+    return np.ascontiguousarray(unpacked.T, dtype=np.float32)
+
+
+def pair_counts(incidence: np.ndarray) -> np.ndarray:
+    """Co-membership count of every block pair, computed as B^T B."""
+    return np.rint(incidence.T @ incidence).astype(np.int64)
+
+
+def matrix_top_combinations(
+    index: BlockIndex,
+    top_n: int = 3,
+    k: int = 3,
+    progress: Optional[CalcProgress] = None,
+) -> List[Tuple[Tuple[int, ...], int]]:
+    """Rank every block triplet with incidence matrix products.
+
+    For every third block ``c`` the rows of the stocks outside ``c`` are
+    masked out, so ``(B * B[:, c])^T B`` holds the triplet counts of all
+    pairs ``a < b < c`` in one product.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    top_n : int
+        Number of top combinations to keep.
+    k : int
+        Number of blocks of a combination, only 3 is supported.
+    progress : Optional[CalcProgress]
+        Receives the number of counted triplets, cancels the calculation.
+
+    Returns
+    -------
+    List[Tuple[Tuple[int, ...], int]]
+        (block index triplet, common stock count) pairs, best first.
+
+    """
+    if k != 3:
+        raise ValueError(f"matrix engine only supports k=3, got {k}")
+
+    incidence = incidence_matrix(index)
+    top = TopN(top_n)
+
+    for c in range(2, index.n_blocks):
+        rows = incidence[:, c] > 0
+        masked = incidence[rows, :c]
+        products = np.rint(masked.T @ masked).astype(np.int64)
+
+        first, second = np.triu_indices(c, k=1)
+        combos = np.column_stack((first, second, np.full_like(first, c)))
+        top.push_batch(products[first, second], combos)
+        if progress is not None:
+            progress.advance(len(first), top.best)
+
+    return top.results()
@@ -0,0 +1,240 @@
+import itertools
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.database import (
+    Block,
+    BlockSignature,
+    signatures2database,
+    stock_block_association,
+)
+
+from .index import BlockIndex
+from .kernels import TopN, popcount
+from .progress import CalcProgress
+
+
+# Number of hash functions of a signature.
+NUM_PERM: int = 128
+
+# Number of combinations kept at every level of the beam search, four
+# times more estimated candidates are verified exactly.
+SHORTLIST: int = 2048
+
+
+_EMPTY = np.uint32(0xFFFFFFFF)
+_MULTIPLIERS, _OFFSETS = np.random.default_rng(0x5EED).integers(
+    1, 2**63, size=(2, NUM_PERM), dtype=np.uint64
+)
+_MULTIPLIERS |= np.uint64(1)
+
+
+def stock_hashes(stock_ids: np.ndarray, perm: int) -> np.ndarray:
+    """Multiply-shift hash number ``perm`` of every stock id, as uint32."""
+    with np.errstate(over="ignore"):
+        mixed = stock_ids.astype(np.uint64) * _MULTIPLIERS[perm]
+        mixed += _OFFSETS[perm]
+    return (mixed >> np.uint64(32)).astype(np.uint32)
+
+
+def minhash_signatures(
+    stock_ids: np.ndarray,
+    block_pos: np.ndarray,
+    n_blocks: int,
+) -> np.ndarray:
+    """Compute the MinHash signature of every block from membership pairs.
+
+    Parameters
+    ----------
+    stock_ids : np.ndarray
+        Stock id of every membership pair.
+    block_pos : np.ndarray
+        Block position of every membership pair.
+    n_blocks : int
+        Number of signatures.
+
+    Returns
+    -------
+    np.ndarray
+        Array with shape (n_blocks, NUM_PERM) and dtype uint32, empty
+        blocks hold 0xFFFFFFFF.
+
+    """
+    signatures = np.full((n_blocks, NUM_PERM), _EMPTY, dtype=np.uint32)
+    if len(block_pos) == 0:
+        return signatures
+
+    order = np.argsort(block_pos, kind="stable")
+    stock_ids, block_pos = stock_ids[order], block_pos[order]
+    starts = np.flatnonzero(np.diff(block_pos, prepend=-1))
+    for perm in range(NUM_PERM):
+        signatures[block_pos[starts], perm] = np.minimum.reduceat(
+            stock_hashes(stock_ids, perm),
+            starts,
+        )
+    return signatures
+
+
+async def build_signatures(
+    async_session: async_sessionmaker[AsyncSession],
+    block_ids: Optional[List[int]] = None,
+) -> None:
+    """Compute and store the MinHash signature of the given or all blocks."""
+    clear = block_ids is None
+    async with async_session() as session:
+        if block_ids is None:
+            result = await session.execute(select(Block.id))
+            block_ids = [id for (id,) in result.all()]
+
+        result = await session.execute(
+            select(
+                stock_block_association.c.stock_id,
+                stock_block_association.c.block_id,
+            ).where(stock_block_association.c.block_id.in_(block_ids))
+        )
+        rows = result.all()
+        # Rows are flattened, numpy is slow to convert Row objects.
+        pairs = np.fromiter(
+            itertools.chain.from_iterable(rows),
+            dtype=np.int64,
+            count=2 * len(rows),
+        ).reshape(-1, 2)
+
+    ids = np.array(block_ids, dtype=np.int64)
+    order = np.argsort(ids)
+    block_pos = order[np.searchsorted(ids[order], pairs[:, 1])]
+    signatures = minhash_signatures(pairs[:, 0], block_pos, len(ids))
+
+    await signatures2database(
+        async_session=async_session,
+        signatures={
+            int(id): signature.tobytes()
+            for id, signature in zip(ids, signatures)
+        },
+        clear=clear,
+    )
+
+
+async def load_signatures(
+    async_session: async_sessionmaker[AsyncSession],
+    blocks: List[str],
+) -> Optional[np.ndarray]:
+    """Return the stored signatures of the blocks, None when one is missing."""
+    async with async_session() as session:
+        result = await session.execute(
+            select(Block.code, BlockSignature.signature)
+            .join(BlockSignature, BlockSignature.block_id == Block.id)
+            .where(Block.code.in_(blocks))
+        )
+        stored = dict(result.all())
+
+    if len(stored) < len(blocks):
+        return None
+    return np.stack(
+        [np.frombuffer(stored[code], dtype=np.uint32) for code in blocks]
+    )
+
+
+def minhash_top_combinations(
+    index: BlockIndex,
+    top_n: int = 3,
+    k: int = 3,
+    signatures: Optional[np.ndarray] = None,
+    shortlist: int = SHORTLIST,
+    progress: Optional[CalcProgress] = None,
+) -> List[Tuple[Tuple[int, ...], int]]:
+    """Approximate top combinations from MinHash signatures, verified exactly.
+
+    The intersection of a block set is estimated as its Jaccard
+    similarity, the share of hash functions on which all signatures
+    agree, times its union size, estimated from the minimum hash values.
+    A beam search extends the combinations of the beam by one block,
+    shortlists the ``4 * shortlist`` best estimates, counts their common
+    stocks exactly with the bitsets and keeps the ``shortlist`` best as
+    the next beam, from pairs up to k blocks. Combinations missed by the
+    estimates are lost, the counts returned are exact.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    top_n : int
+        Number of top combinations to keep.
+    k : int
+        Number of blocks of a combination.
+    signatures : Optional[np.ndarray]
+        MinHash signatures of the blocks of ``index``, computed from it
+        when omitted.
+    shortlist : int
+        Number of combinations kept at every level.
+    progress : Optional[CalcProgress]
+        Advanced at every level by the number of estimated combinations,
+        with the best count of the level, cancels the search.
+
+    Returns
+    -------
+    List[Tuple[Tuple[int, ...], int]]
+        (block index combination, common stock count) pairs, best first.
+
+    """
+    n = index.n_blocks
+    if signatures is None:
+        members = np.flatnonzero(
+            np.unpackbits(
+                index.bits.view(np.uint8),
+                axis=1,
+                bitorder="little",
+            )
+        )
+        block_pos, stock_pos = np.divmod(members, index.bits.shape[1] * 64)
+        signatures = minhash_signatures(
+            index.stock_ids[stock_pos], block_pos, n
+        )
+
+    beam = np.arange(n)[:, None]
+    for _ in range(2, k + 1):
+        rows: List[np.ndarray] = []
+        extra: List[np.ndarray] = []
+        estimates: List[np.ndarray] = []
+        # Every combination is extended with the blocks after its last one.
+        for row, combo in enumerate(beam):
+            start = combo[-1] + 1
+            if start == n:
+                continue
+
+            first = signatures[combo[0]]
+            agree = np.all(signatures[combo] == first, axis=0)
+            low = signatures[combo].min(axis=0)
+            tail = signatures[start:]
+
+            jaccard = ((tail == first) & agree).sum(axis=1) / NUM_PERM
+            # The minimum hash of a union of u stocks is about 2**32 / u.
+            lows = np.minimum(tail, low).sum(axis=1, dtype=np.uint64)
+            union = (NUM_PERM - 1) * 2.0**32 / np.maximum(lows, 1)
+
+            rows.append(np.full(n - start, row))
+            extra.append(np.arange(start, n))
+            estimates.append(jaccard * union)
+
+        if not rows:
+            return []
+
+        best = np.argsort(-np.concatenate(estimates), kind="stable")
+        best = best[: 4 * shortlist]
+        candidates = np.column_stack(
+            (beam[np.concatenate(rows)[best]], np.concatenate(extra)[best])
+        )
+        counts = popcount(np.bitwise_and.reduce(index.bits[candidates], axis=1))
+        beam = candidates[np.argsort(-counts, kind="stable")[:shortlist]]
+        if progress is not None:
+            progress.advance(
+                sum(len(row) for row in rows),
+                int(counts.max(initial=-1)),
+            )
+
+    top = TopN(top_n)
+    top.push_batch(counts, candidates)
+    return top.results()
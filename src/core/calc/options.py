@@ -0,0 +1,173 @@
+from dataclasses import dataclass, field, replace
+from math import comb
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from src.utils.types import CalcEngine, StockFilterDict
+
+
+# Engines counting with SQL statements instead of the in-memory index.
+SQL_ENGINE_NAMES: Tuple[str, ...] = ("sql_join", "sql")
+
+# Engines whose ranking is an approximation.
+APPROXIMATE_ENGINES: Tuple[str, ...] = ("minhash",)
+
+# How the ranking of the in-memory index is searched, by precedence.
+CalcMode = Literal["diverse", "constrained", "per_block", "budget", "engine"]
+
+
+@dataclass
+class CalcOptions:
+    """Parameters of one calculation, see 'get_combination_count'.
+
+    ``required`` and ``excluded`` hold block codes, the other fields the
+    parameters of the same name.
+    """
+
+    top_n: int = 3
+    engine: CalcEngine = "bnb"
+    k: int = 3
+    workers: Optional[int] = None
+    incremental: bool = True
+    cache: bool = True
+    budget: Optional[float] = None
+    required: List[str] = field(default_factory=list)
+    excluded: List[str] = field(default_factory=list)
+    stock_filter: Optional[StockFilterDict] = None
+    max_shared: Optional[int] = None
+    max_jaccard: Optional[float] = None
+    collapse: bool = False
+    per_block: bool = False
+
+    @property
+    def sql(self) -> bool:
+        return self.engine in SQL_ENGINE_NAMES
+
+    @property
+    def constrained(self) -> bool:
+        return bool(self.required or self.excluded)
+
+    @property
+    def diverse(self) -> bool:
+        return self.max_shared is not None or self.max_jaccard is not None
+
+    @property
+    def mode(self) -> CalcMode:
+        if self.diverse:
+            return "diverse"
+        if self.constrained:
+            return "constrained"
+        if self.per_block:
+            return "per_block"
+        if self.budget is not None:
+            return "budget"
+        return "engine"
+
+    @property
+    def exact_search(self) -> bool:
+        """Whether the ranking is the plain top-N of the whole space.
+
+        Only such a ranking can seed or reuse the incremental state.
+        """
+        return not (self.collapse or self.constrained or self.diverse)
+
+    @property
+    def exact_engine(self) -> bool:
+        return self.engine not in APPROXIMATE_ENGINES
+
+    @property
+    def incremental_search(self) -> bool:
+        return (
+            self.incremental
+            and self.exact_search
+            and self.exact_engine
+            and not self.per_block
+        )
+
+    @property
+    def cached(self) -> bool:
+        return self.cache and not self.sql and not self.per_block
+
+    def for_blocks(self, blocks: List[str]) -> "CalcOptions":
+        """Drop repeated required and unknown excluded block codes."""
+        return replace(
+            self,
+            required=list(dict.fromkeys(self.required)),
+            excluded=[code for code in set(self.excluded) if code in blocks],
+        )
+
+    def validate(self, blocks: List[str]) -> Optional[str]:
+        """Return the error message of invalid options, None when valid."""
+        if not 2 <= self.k <= 6:
+            return f"计算: 组合板块数量 {self.k} 需在 2 到 6 之间"
+
+        return self._validate_features() or self._validate_bounds(blocks)
+
+    def _validate_features(self) -> Optional[str]:
+        unsupported = {
+            "必选或排除板块": self.constrained,
+            "结果去重": self.diverse,
+            "合并重复板块": self.collapse,
+        }
+        for feature, used in unsupported.items():
+            if used and self.sql:
+                return f"计算: {self.engine} 引擎不支持{feature}"
+
+        if self.per_block and (self.sql or self.constrained or self.diverse):
+            return "计算: 各板块最优组合不支持SQL引擎、必选排除板块或结果去重"
+        return None
+
+    def _validate_bounds(self, blocks: List[str]) -> Optional[str]:
+        if (
+            self.max_shared is not None and not 0 <= self.max_shared < self.k
+        ) or (self.max_jaccard is not None and not 0 <= self.max_jaccard <= 1):
+            return (
+                f"计算: 共享板块数 {self.max_shared} "
+                f"或相似度 {self.max_jaccard} 错误"
+            )
+
+        missing = [code for code in self.required if code not in blocks]
+        if (
+            missing
+            or len(self.required) > self.k
+            or set(self.required) & set(self.excluded)
+        ):
+            return (
+                f"计算: 必选板块 {self.required} "
+                f"或排除板块 {self.excluded} 错误"
+            )
+        return None
+
+    def space(self, n_blocks: int, n_required: int) -> int:
+        """Number of combinations searched among ``n_blocks`` blocks."""
+        return comb(n_blocks - n_required, self.k - n_required)
+
+    def too_small(self, space: int) -> bool:
+        # A constrained subspace may hold fewer combinations than top_n.
+        return space == 0 or (space <= self.top_n and not self.constrained)
+
+    def cache_params(self) -> Dict[str, Any]:
+        """Parameters the cached result depends on besides the mode list."""
+        return {
+            "k": self.k,
+            "top_n": self.top_n,
+            "required": sorted(self.required),
+            "excluded": sorted(self.excluded),
+            "stock_filter": self.stock_filter or None,
+            "max_shared": self.max_shared,
+            "max_jaccard": self.max_jaccard,
+            "collapse": self.collapse,
+        }
+
+
+@dataclass
+class CalcRanking:
+    """Ranking searched on the in-memory index.
+
+    ``ranking`` holds (block index combination, common stock count) pairs,
+    best first, ``optimal`` whether it is proven exact and ``per_block``
+    the best pair of every block when it was asked for.
+    """
+
+    ranking: List[Tuple[Tuple[int, ...], int]]
+    optimal: bool = True
+    per_block: Optional[List[Optional[Tuple[Tuple[int, ...], int]]]] = None
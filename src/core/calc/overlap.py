@@ -0,0 +1,69 @@
+import itertools
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.database import Block, BlockPairOverlap
+
+
+async def load_pair_overlaps(
+    async_session: async_sessionmaker[AsyncSession],
+    blocks: List[str],
+) -> Optional[np.ndarray]:
+    """Read the overlap of every pair of the blocks from 'BlockPairOverlap'.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    blocks : List[str]
+        Block codes, the row order of the matrix follows this list.
+
+    Returns
+    -------
+    Optional[np.ndarray]
+        Symmetric array with shape (n_blocks, n_blocks) and dtype int64
+        holding the block sizes on its diagonal, None when the table was
+        never filled.
+
+    """
+    async with async_session() as session:
+        filled = await session.scalar(select(BlockPairOverlap.block_a).limit(1))
+        if filled is None:
+            return None
+
+        result = await session.execute(
+            select(Block.id, Block.code).where(Block.code.in_(blocks))
+        )
+        code2id_mapping = {code: id for id, code in result.all()}
+
+        block_ids = [code2id_mapping[code] for code in blocks]
+        result = await session.execute(
+            select(
+                BlockPairOverlap.block_a,
+                BlockPairOverlap.block_b,
+                BlockPairOverlap.overlap,
+            ).where(
+                BlockPairOverlap.block_a.in_(block_ids),
+                BlockPairOverlap.block_b.in_(block_ids),
+            )
+        )
+        records = result.all()
+        # Rows are flattened, numpy is slow to convert Row objects.
+        rows = np.fromiter(
+            itertools.chain.from_iterable(records),
+            dtype=np.int64,
+            count=3 * len(records),
+        ).reshape(-1, 3)
+
+    ids = np.array(block_ids, dtype=np.int64)
+    order = np.argsort(ids)
+    first = order[np.searchsorted(ids[order], rows[:, 0])]
+    second = order[np.searchsorted(ids[order], rows[:, 1])]
+
+    overlaps = np.zeros((len(blocks), len(blocks)), dtype=np.int64)
+    overlaps[first, second] = rows[:, 2]
+    overlaps[second, first] = rows[:, 2]
+    return overlaps
@@ -0,0 +1,182 @@
+import concurrent.futures
+import multiprocessing
+import os
+import time
+from math import comb
+from multiprocessing import shared_memory
+from multiprocessing.synchronize import Event
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .index import BlockIndex
+from .kernels import TopN
+from .matrix import incidence_matrix
+from .progress import CalcCancelled, CalcProgress
+from .search import search_combinations
+
+
+# Seconds between two checks of the progress while waiting for the shards,
+# and between two checks of the cancel event inside a worker.
+POLL_INTERVAL: float = 0.2
+
+# Shards per worker process, more shards report the progress more often.
+SHARDS_PER_WORKER: int = 8
+
+# Cancel event of the calculation, set by '_init_worker' in every worker.
+_CANCEL: Optional[Event] = None
+
+
+class _ShardProgress(CalcProgress):
+    """Progress of a worker, cancelled when the shared ``event`` is set.
+
+    The event lives in another process, so it is only checked every
+    ``interval`` seconds.
+    """
+
+    def __init__(self, event: Event) -> None:
+        super().__init__(interval=POLL_INTERVAL)
+        self.event = event
+
+    def advance(self, done: int, best: int) -> None:
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            if self.event.is_set():
+                self.cancel()
+        super().advance(done, best)
+
+
+def _init_worker(cancel: Event) -> None:
+    global _CANCEL
+    _CANCEL = cancel
+
+
+def _search_shard(
+    shm_name: str,
+    shape: Tuple[int, int],
+    order: np.ndarray,
+    top_n: int,
+    k: int,
+    first: np.ndarray,
+) -> List[Tuple[Tuple[int, ...], int]]:
+    """Worker entry: search the combinations starting with ``first`` blocks."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    incidence = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    top = TopN(top_n)
+    try:
+        search_combinations(
+            incidence=incidence,
+            order=order,
+            top=top,
+            k=k,
+            first=first,
+            progress=None if _CANCEL is None else _ShardProgress(_CANCEL),
+        )
+    except CalcCancelled:
+        return []
+    finally:
+        del incidence
+        shm.close()
+
+    return top.results()
+
+
+def parallel_top_combinations(
+    index: BlockIndex,
+    top_n: int = 3,
+    k: int = 3,
+    workers: Optional[int] = None,
+    progress: Optional[CalcProgress] = None,
+) -> List[Tuple[Tuple[int, ...], int]]:
+    """Branch-and-bound search sharded by first block over a process pool.
+
+    The incidence matrix is placed once in shared memory and mapped
+    read-only by every worker. The search is split into
+    ``SHARDS_PER_WORKER`` shards per worker, shard ``i`` of ``s`` holds
+    the combinations whose first block (in block size order) is ``i``,
+    ``i + s``, ... and keeps its own top-N, the partial rankings are
+    merged as the shards are done. Workers are spawned, not forked, so
+    they never inherit the threads and locks of the calling process.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    top_n : int
+        Number of top combinations to keep.
+    k : int
+        Number of blocks of a combination.
+    workers : Optional[int]
+        Number of worker processes, the CPU count when omitted.
+    progress : Optional[CalcProgress]
+        Advanced when a shard is done. On cancel the pending shards are
+        dropped and running workers stop at their next check of the
+        shared cancel event.
+
+    Returns
+    -------
+    List[Tuple[Tuple[int, ...], int]]
+        (block index combination, common stock count) pairs, best first.
+
+    """
+    workers = max(min(workers or os.cpu_count() or 1, index.n_blocks), 1)
+    order = np.argsort(-index.counts, kind="stable")
+    incidence = incidence_matrix(index)[:, order]
+
+    shm = shared_memory.SharedMemory(create=True, size=max(incidence.nbytes, 1))
+    shared = np.ndarray(incidence.shape, dtype=np.float32, buffer=shm.buf)
+    shared[:] = incidence
+    top = TopN(top_n)
+
+    n = index.n_blocks
+    n_shards = min(workers * SHARDS_PER_WORKER, n)
+    context = multiprocessing.get_context("spawn")
+    cancel = context.Event()
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(cancel,),
+    )
+
+    try:
+        futures = {}
+        for shard in range(n_shards):
+            first = np.arange(shard, n, n_shards)
+            future = executor.submit(
+                _search_shard,
+                shm.name,
+                incidence.shape,
+                order,
+                top_n,
+                k,
+                first,
+            )
+            futures[future] = sum(comb(n - int(f) - 1, k - 1) for f in first)
+
+        pending = set(futures)
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending,
+                timeout=POLL_INTERVAL,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                for combo, count in future.result():
+                    top.push(count, combo)
+
+            if progress is not None:
+                progress.advance(
+                    sum(futures[future] for future in done),
+                    top.best,
+                )
+
+    finally:
+        cancel.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        del shared
+        shm.close()
+        shm.unlink()
+
+    return top.results()
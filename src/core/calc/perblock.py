@@ -0,0 +1,242 @@
+from math import comb
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.utils.types import BlockBestDict
+
+from .collapse import CollapsedIndex
+from .index import BlockIndex, get_stock_labels
+from .kernels import TopN
+from .matrix import incidence_matrix
+from .progress import CalcProgress
+
+
+def per_block_top_combinations(
+    index: BlockIndex,
+    top_n: int = 3,
+    k: int = 3,
+    progress: Optional[CalcProgress] = None,
+) -> Tuple[
+    List[Tuple[Tuple[int, ...], int]],
+    List[Optional[Tuple[Tuple[int, ...], int]]],
+]:
+    """Search the top combinations and the best one of every block at once.
+
+    The combinations are walked in mode list order, the last two blocks
+    of every branch counted in one matrix product like in
+    'iter_combination_counts'. Every counted batch feeds the top-N and
+    the best count of each of its blocks, a block only takes a later
+    combination when it is strictly better, so ties are broken by the
+    combination indices ascending as in 'TopN'. A branch is cut when its
+    intersection is below the N-th best count and not above the best
+    count of any block it may still hold, and the matrix product skips
+    the blocks none of whose pairs can improve a count.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    top_n : int
+        Number of top combinations to keep.
+    k : int
+        Number of blocks of a combination.
+    progress : Optional[CalcProgress]
+        Receives the number of searched combinations, cancels the search.
+
+    Returns
+    -------
+    Tuple[List[Tuple[Tuple[int, ...], int]], List[Optional[Tuple[Tuple[int, ...], int]]]]
+        The (block index combination, common stock count) pairs of the
+        top-N, best first, and the best pair containing every block, None
+        for the blocks of no combination.
+
+    """
+    search = _PerBlockSearch(index, top_n, k, progress)
+    search.extend([], np.ones(search.incidence.shape[0], dtype=bool))
+    return search.results()
+
+
+class _PerBlockSearch:
+    """State of 'per_block_top_combinations', the top-N and best per block."""
+
+    def __init__(
+        self,
+        index: BlockIndex,
+        top_n: int,
+        k: int,
+        progress: Optional[CalcProgress],
+    ) -> None:
+        self.n = index.n_blocks
+        self.k = k
+        self.n_stocks = len(index.stock_ids)
+        self.progress = progress
+        self.incidence = incidence_matrix(index)
+        self.top = TopN(top_n)
+        self.best = np.full(self.n, -1, dtype=np.int64)
+        self.best_combos = np.zeros((self.n, k), dtype=np.intp)
+
+    def advance(self, done: int) -> None:
+        if self.progress is not None:
+            self.progress.advance(done, self.top.best)
+
+    def useless(self, bound: int, blocks: List[int], start: int) -> bool:
+        best = self.best
+        floor = min(
+            best[blocks].min(initial=bound),
+            best[start:].min(initial=bound),
+        )
+        return bound < self.top.threshold and bound <= floor
+
+    def extend(self, prefix: List[int], common: np.ndarray) -> None:
+        start = prefix[-1] + 1 if prefix else 0
+        if len(prefix) == self.k - 2:
+            self.advance(comb(self.n - start, 2))
+            self.count_pairs(prefix, self.incidence[common, start:], start)
+            return
+
+        remaining = self.k - len(prefix)
+        for block in range(start, self.n - (remaining - 1)):
+            child = common & (self.incidence[:, block] > 0)
+            if self.useless(int(child.sum()), prefix + [block], block + 1):
+                self.advance(comb(self.n - block - 1, remaining - 1))
+                continue
+
+            self.extend(prefix + [block], child)
+
+    def pair_blocks(
+        self,
+        prefix: List[int],
+        sizes: np.ndarray,
+        start: int,
+    ) -> np.ndarray:
+        """Offsets of the blocks from ``start`` worth pairing after ``prefix``."""
+        best = self.best[start:]
+        floor = self.best[prefix].min(initial=self.n_stocks)
+        needy = sizes > best
+        # Pairs of two kept blocks are the only ones which can enter the
+        # top-N or improve the best count of one of their blocks.
+        keep = needy | (sizes > floor) | (sizes >= self.top.threshold)
+        if needy.any():
+            needy_best = np.sort(best[needy])
+            # The best count of another needy block than itself.
+            other = np.where(
+                needy & (best == needy_best[0]),
+                needy_best[1] if len(needy_best) > 1 else sizes.max(),
+                needy_best[0],
+            )
+            keep |= sizes > other
+        return np.flatnonzero(keep)
+
+    def count_pairs(
+        self,
+        prefix: List[int],
+        candidates: np.ndarray,
+        start: int,
+    ) -> None:
+        """Count the last two blocks of every combination after ``prefix``."""
+        sizes = np.rint(candidates.sum(axis=0)).astype(np.int64)
+        rest = self.pair_blocks(prefix, sizes, start)
+        if len(rest) < 2:
+            return
+
+        masked = candidates[:, rest]
+        products = np.rint(masked.T @ masked).astype(np.int64)
+        np.fill_diagonal(products, -1)
+        blocks = rest + start
+
+        second, third = np.triu_indices(len(rest), k=1)
+        counts = products[second, third]
+        combos = np.column_stack(
+            [np.full_like(second, block) for block in prefix]
+            + [blocks[second], blocks[third]]
+        )
+        self.top.push_batch(counts, combos)
+
+        # Pairs are in mode list order, argmax returns the first tie.
+        first = int(np.argmax(counts))
+        for block in prefix:
+            if counts[first] > self.best[block]:
+                self.best[block] = counts[first]
+                self.best_combos[block] = combos[first]
+
+        partner = np.argmax(products, axis=1)
+        value = products[np.arange(len(rest)), partner]
+        better = np.flatnonzero(value > self.best[blocks])
+        self.best[blocks[better]] = value[better]
+        self.best_combos[blocks[better]] = np.sort(
+            np.column_stack(
+                [np.full_like(better, block) for block in prefix]
+                + [blocks[better], blocks[partner[better]]]
+            ),
+            axis=1,
+        )
+
+    def results(
+        self,
+    ) -> Tuple[
+        List[Tuple[Tuple[int, ...], int]],
+        List[Optional[Tuple[Tuple[int, ...], int]]],
+    ]:
+        per_block: List[Optional[Tuple[Tuple[int, ...], int]]] = [
+            (tuple(int(i) for i in combo), int(count)) if count >= 0 else None
+            for combo, count in zip(self.best_combos, self.best)
+        ]
+        return self.top.results(), per_block
+
+
+async def get_block_best(
+    async_session: async_sessionmaker[AsyncSession],
+    index: BlockIndex,
+    per_block: List[Optional[Tuple[Tuple[int, ...], int]]],
+    collapsed: Optional[CollapsedIndex] = None,
+) -> List[BlockBestDict]:
+    """Turn the best pair of every block into BlockBest rows, in block order.
+
+    On a collapsed index every block of a group takes the best pair of
+    the group, with the block itself in place of its representative.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    index : BlockIndex
+        Packed membership the pairs were searched on.
+    per_block : List[Optional[Tuple[Tuple[int, ...], int]]]
+        Best pair of every block of ``index``, from
+        'per_block_top_combinations'.
+    collapsed : Optional[CollapsedIndex]
+        Groups ``index`` was collapsed from, None when it was not.
+
+    Returns
+    -------
+    List[BlockBestDict]
+        One row per block of some combination.
+
+    """
+    labels = await get_stock_labels(
+        async_session=async_session,
+        stock_ids=index.stock_ids,
+    )
+    rows = list(enumerate(index.codes))
+    if collapsed is not None:
+        rows = [
+            (collapsed.position[code], code) for code in collapsed.full.codes
+        ]
+
+    best: List[BlockBestDict] = []
+    for row, code in rows:
+        pair = per_block[row]
+        if pair is None:
+            continue
+        combo, count = pair
+        best.append(
+            {
+                "block": code,
+                "blocks": [code if i == row else index.codes[i] for i in combo],
+                "count": count,
+                "stocks": sorted(labels[index.common_positions(combo)]),
+            }
+        )
+    return best
@@ -0,0 +1,81 @@
+import threading
+import time
+from typing import Callable, Optional
+
+from src.utils.types import CalcProgressDict
+
+
+class CalcCancelled(Exception):
+    """Raised inside an engine when its calculation was cancelled."""
+
+
+class CalcProgress:
+    """Progress of a running calculation, shared with the thread running it.
+
+    Engines call ``advance`` with the number of combinations they have
+    counted or pruned since the previous call. ``callback`` receives a
+    report at most every ``interval`` seconds. ``cancel`` may be called
+    from any thread, the engine then raises 'CalcCancelled' at its next
+    call to ``advance``.
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[CalcProgressDict], None]] = None,
+        interval: float = 0.5,
+    ) -> None:
+        self.callback = callback
+        self.interval = interval
+        self.total = 0
+        self.done = 0
+        self._cancelled = threading.Event()
+        self._start = self._last = time.perf_counter()
+
+    def start(self, total: int) -> None:
+        """Reset the counters for a search space of ``total`` combinations."""
+        self.total = total
+        self.done = 0
+        self._start = self._last = time.perf_counter()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def advance(self, done: int, best: int) -> None:
+        """Account ``done`` more combinations and report if it is time to.
+
+        Parameters
+        ----------
+        done : int
+            Number of combinations counted or pruned since the last call.
+        best : int
+            Best common stock count found so far, -1 when none.
+
+        Raises
+        ------
+        CalcCancelled
+            When ``cancel`` was called.
+
+        """
+        if self._cancelled.is_set():
+            raise CalcCancelled()
+
+        self.done += done
+        now = time.perf_counter()
+        if self.callback is not None and now - self._last >= self.interval:
+            self._last = now
+            self.callback(self.report(best))
+
+    def report(self, best: int) -> CalcProgressDict:
+        elapsed = time.perf_counter() - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        return {
+            "done": self.done,
+            "total": self.total,
+            "rate": rate,
+            "eta": (self.total - self.done) / rate if rate > 0 else None,
+            "best": best,
+        }
@@ -0,0 +1,135 @@
+import heapq
+import os
+import tempfile
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from .index import BlockIndex
+from .matrix import incidence_matrix
+
+
+# Number of combinations sorted in memory before they are spilled to disk.
+RUN_SIZE: int = 1_000_000
+
+# Number of rows read at once from every spilled run while merging.
+READ_SIZE: int = 65_536
+
+
+def iter_combination_counts(
+    index: BlockIndex,
+    k: int = 3,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Enumerate the count of every k-block combination batch by batch.
+
+    Every batch holds the combinations sharing their first k - 2 blocks,
+    counted in one matrix product over the stocks of those blocks.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    k : int
+        Number of blocks of a combination.
+
+    Yields
+    ------
+    Tuple[np.ndarray, np.ndarray]
+        Block indices with shape (m, k) and common stock counts with shape (m,).
+
+    """
+    n = index.n_blocks
+    incidence = incidence_matrix(index)
+
+    def walk(
+        prefix: List[int],
+        common: np.ndarray,
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        start = prefix[-1] + 1 if prefix else 0
+        if len(prefix) == k - 2:
+            masked = incidence[common, start:]
+            products = np.rint(masked.T @ masked).astype(np.int64)
+            second, third = np.triu_indices(n - start, k=1)
+            combos = np.column_stack(
+                [np.full_like(second, block) for block in prefix]
+                + [second + start, third + start]
+            )
+            yield combos, products[second, third]
+            return
+
+        for block in range(start, n - (k - len(prefix) - 1)):
+            yield from walk(
+                prefix + [block], common & (incidence[:, block] > 0)
+            )
+
+    yield from walk([], np.ones(len(index.stock_ids), dtype=bool))
+
+
+def _sort_run(rows: np.ndarray) -> np.ndarray:
+    """Sort rows of (block indices..., count) by count descending, then indices."""
+    keys = [rows[:, i] for i in range(rows.shape[1] - 2, -1, -1)]
+    return rows[np.lexsort(keys + [-rows[:, -1]])]
+
+
+def _read_run(path: str) -> Iterator[Tuple[int, ...]]:
+    rows = np.load(path, mmap_mode="r")
+    for start in range(0, len(rows), READ_SIZE):
+        for row in np.asarray(rows[start : start + READ_SIZE]).tolist():
+            yield tuple(row)
+
+
+def iter_ranking(
+    index: BlockIndex,
+    k: int = 3,
+    run_size: int = RUN_SIZE,
+) -> Iterator[Tuple[Tuple[int, ...], int]]:
+    """Stream the complete ranking of all k-block combinations, best first.
+
+    Memory stays bounded by ``run_size``: the combinations are sorted in
+    runs which are spilled to temporary files and merged lazily.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    k : int
+        Number of blocks of a combination.
+    run_size : int
+        Number of combinations sorted in memory at once.
+
+    Yields
+    ------
+    Tuple[Tuple[int, ...], int]
+        (block index combination, common stock count) pairs.
+
+    """
+    with tempfile.TemporaryDirectory(
+        prefix="tdx-ranking-",
+        ignore_cleanup_errors=True,
+    ) as tmp:
+        runs: List[str] = []
+        buffer: List[np.ndarray] = []
+        buffered = 0
+
+        def spill() -> None:
+            path = os.path.join(tmp, f"run{len(runs)}.npy")
+            np.save(path, _sort_run(np.concatenate(buffer)))
+            runs.append(path)
+            buffer.clear()
+
+        for combos, counts in iter_combination_counts(index, k):
+            buffer.append(np.column_stack((combos, counts)).astype(np.int32))
+            buffered += len(counts)
+            if buffered >= run_size:
+                spill()
+                buffered = 0
+
+        if buffer:
+            spill()
+
+        merged = heapq.merge(
+            *[_read_run(path) for path in runs],
+            key=lambda row: (-row[-1], row[:-1]),
+        )
+        for row in merged:
+            yield row[:-1], row[-1]
@@ -0,0 +1,488 @@
+import time
+from math import comb
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .index import BlockIndex
+from .kernels import TopN
+from .matrix import incidence_matrix, pair_counts
+from .progress import CalcProgress
+
+
+class _DeadlineReached(Exception):
+    pass
+
+
+def bnb_top_combinations(
+    index: BlockIndex,
+    top_n: int = 3,
+    k: int = 3,
+    progress: Optional[CalcProgress] = None,
+) -> List[Tuple[Tuple[int, ...], int]]:
+    """Branch-and-bound depth-first search of the top k-block combinations.
+
+    Blocks are visited from the largest to the smallest, so good
+    combinations are found early and the N-th best count kept in the
+    min-heap rises fast. The search carries the stock intersection of the
+    chosen blocks down the tree, and since a combination can not hold more
+    stocks than any of its sub-combinations, a branch whose intersection is
+    below the N-th best count is cut. The last two blocks of every branch
+    are counted in one matrix product over the stocks of the intersection.
+    Only strictly smaller bounds are pruned, which keeps ties and the
+    result identical to the exhaustive engines.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    top_n : int
+        Number of top combinations to keep.
+    k : int
+        Number of blocks of a combination.
+    progress : Optional[CalcProgress]
+        Receives the number of searched combinations, cancels the search.
+
+    Returns
+    -------
+    List[Tuple[Tuple[int, ...], int]]
+        (block index combination, common stock count) pairs, best first.
+
+    """
+    order = np.argsort(-index.counts, kind="stable")
+    top = TopN(top_n)
+    search_combinations(
+        incidence=incidence_matrix(index)[:, order],
+        order=order,
+        top=top,
+        k=k,
+        progress=progress,
+    )
+    return top.results()
+
+
+def search_combinations(
+    incidence: np.ndarray,
+    order: np.ndarray,
+    top: TopN,
+    k: int,
+    first: Optional[np.ndarray] = None,
+    progress: Optional[CalcProgress] = None,
+    deadline: Optional[float] = None,
+    fixed: Sequence[int] = (),
+    common: Optional[np.ndarray] = None,
+) -> bool:
+    """Run the depth-first search of 'bnb_top_combinations' into ``top``.
+
+    Parameters
+    ----------
+    incidence : np.ndarray
+        Stock x block incidence matrix with columns sorted by block size.
+    order : np.ndarray
+        Block index of every column of ``incidence``.
+    top : TopN
+        Ranking the combinations are pushed into.
+    k : int
+        Number of blocks of a combination.
+    first : Optional[np.ndarray]
+        Columns allowed as the first block of a combination, all columns
+        when omitted. Used to shard the search space.
+    progress : Optional[CalcProgress]
+        Advanced by every counted or pruned combination, cancels the search.
+    deadline : Optional[float]
+        'time.perf_counter' value at which the search stops, unbounded when
+        omitted.
+    fixed : Sequence[int]
+        Block indices contained in every combination, not among the
+        columns of ``incidence``. The search picks the other k - len(fixed)
+        blocks, at least 2.
+    common : Optional[np.ndarray]
+        Boolean mask of the stocks shared by the ``fixed`` blocks.
+
+    Returns
+    -------
+    bool
+        True when the search space was exhausted, so ``top`` is exact.
+
+    """
+    if common is None:
+        common = np.ones(incidence.shape[0], dtype=bool)
+
+    search = _DepthFirstSearch(
+        incidence=incidence,
+        order=order,
+        top=top,
+        k=k - len(fixed),
+        first=first,
+        progress=progress,
+        deadline=deadline,
+        fixed=fixed,
+    )
+    try:
+        search.extend([], common)
+    except _DeadlineReached:
+        return False
+
+    return True
+
+
+class _DepthFirstSearch:
+    """Search of 'search_combinations', ``k`` counts the free blocks only."""
+
+    def __init__(
+        self,
+        incidence: np.ndarray,
+        order: np.ndarray,
+        top: TopN,
+        k: int,
+        first: Optional[np.ndarray],
+        progress: Optional[CalcProgress],
+        deadline: Optional[float],
+        fixed: Sequence[int],
+    ) -> None:
+        self.incidence = incidence
+        self.order = order
+        self.top = top
+        self.k = k
+        self.n = incidence.shape[1]
+        self.progress = progress
+        self.deadline = deadline
+        self.fixed = fixed
+        self.allowed = np.ones(self.n, dtype=bool)
+        if first is not None:
+            self.allowed[:] = False
+            self.allowed[first] = True
+
+    def advance(self, done: int) -> None:
+        """Report ``done`` counted or pruned combinations, may cancel."""
+        if self.progress is not None:
+            self.progress.advance(done, self.top.best)
+
+    def advance_pruned(self, blocks: Sequence[int], depth: int) -> None:
+        """Report the combinations below every block of ``blocks`` as done."""
+        if self.progress is not None:
+            self.advance(sum(comb(self.n - int(b) - 1, depth) for b in blocks))
+
+    def check_deadline(self) -> None:
+        """Stop the search once the anytime budget is spent."""
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise _DeadlineReached()
+
+    def extend(self, prefix: List[int], common: np.ndarray) -> None:
+        self.check_deadline()
+
+        start = prefix[-1] + 1 if prefix else 0
+        candidates = self.incidence[common, start:]
+        sizes = np.rint(candidates.sum(axis=0)).astype(np.int64)
+
+        if len(prefix) == self.k - 2:
+            self.advance(comb(self.n - start, 2))
+            self.count_pairs(prefix, candidates, sizes, start)
+            return
+
+        depth = self.k - len(prefix) - 1
+        stop = self.n - start - depth
+        offsets = np.argsort(-sizes[:stop], kind="stable")
+        for i, offset in enumerate(offsets):
+            if sizes[offset] < self.top.threshold:
+                self.advance_pruned(start + offsets[i:], depth)
+                break
+
+            block = start + int(offset)
+            if prefix or self.allowed[block]:
+                self.extend(
+                    prefix + [block],
+                    common & (self.incidence[:, block] > 0),
+                )
+            else:
+                self.advance_pruned([block], depth)
+
+    def count_pairs(
+        self,
+        prefix: List[int],
+        candidates: np.ndarray,
+        sizes: np.ndarray,
+        start: int,
+    ) -> None:
+        """Count the last two blocks of every combination after ``prefix``."""
+        top = self.top
+        rest = np.flatnonzero(sizes >= top.threshold)
+        if len(rest) < 2:
+            return
+
+        masked = candidates[:, rest]
+        rest += start
+        products = np.rint(masked.T @ masked).astype(np.int64)
+        selected = np.triu(products >= top.threshold, k=1)
+        if not prefix:
+            selected &= self.allowed[rest][:, None]
+
+        second, third = np.nonzero(selected)
+        combos = np.column_stack(
+            [np.full_like(second, block) for block in prefix]
+            + [rest[second], rest[third]]
+        )
+        combos = np.column_stack(
+            [self.order[combos]]
+            + [np.full_like(second, block) for block in self.fixed]
+        )
+        top.push_batch(
+            products[second, third],
+            np.sort(combos, axis=1),
+        )
+
+
+def constrained_top_combinations(
+    index: BlockIndex,
+    top_n: int = 3,
+    k: int = 3,
+    required: Sequence[int] = (),
+    excluded: Sequence[int] = (),
+    progress: Optional[CalcProgress] = None,
+) -> List[Tuple[Tuple[int, ...], int]]:
+    """Top k-block combinations containing every required block and no excluded one.
+
+    Only the constrained subspace is enumerated: the required blocks are
+    intersected once, then the search of 'bnb_top_combinations' picks the
+    k - len(required) other blocks among the remaining ones, starting from
+    that intersection. One required block of a triplet leaves a single
+    matrix product over its stocks.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    top_n : int
+        Number of top combinations to keep.
+    k : int
+        Number of blocks of a combination.
+    required : Sequence[int]
+        Block indices every combination contains, at most k.
+    excluded : Sequence[int]
+        Block indices no combination contains.
+    progress : Optional[CalcProgress]
+        Receives the number of searched combinations, cancels the search.
+
+    Returns
+    -------
+    List[Tuple[Tuple[int, ...], int]]
+        (block index combination, common stock count) pairs, best first.
+
+    """
+    top = TopN(top_n)
+    _search_constrained(index, top, k, required, excluded, progress)
+    return top.results()
+
+
+def _search_constrained(
+    index: BlockIndex,
+    top: TopN,
+    k: int,
+    required: Sequence[int],
+    excluded: Sequence[int],
+    progress: Optional[CalcProgress],
+) -> None:
+    """Run the search of 'constrained_top_combinations' into ``top``."""
+    incidence = incidence_matrix(index)
+    common = np.all(incidence[:, list(required)] > 0, axis=1)
+    free = np.setdiff1d(
+        np.arange(index.n_blocks),
+        np.concatenate([required, excluded]).astype(np.intp),
+    )
+    order = free[np.argsort(-index.counts[free], kind="stable")]
+
+    if k - len(required) < 2:
+        if k == len(required):
+            combos = np.array([sorted(required)])
+        else:
+            combos = np.column_stack(
+                [order] + [np.full_like(order, block) for block in required]
+            )
+        counts = np.rint(incidence[common][:, combos].prod(axis=2).sum(axis=0))
+        top.push_batch(counts.astype(np.int64), np.sort(combos, axis=1))
+        if progress is not None:
+            progress.advance(len(combos), top.best)
+        return
+
+    search_combinations(
+        incidence=incidence[:, order],
+        order=order,
+        top=top,
+        k=k,
+        progress=progress,
+        fixed=list(required),
+        common=common,
+    )
+
+
+class _TopNAfter(TopN):
+    """'TopN' of the combinations ranked after ``cursor`` only."""
+
+    def __init__(
+        self,
+        n: int,
+        cursor: Optional[Tuple[Tuple[int, ...], int]],
+    ) -> None:
+        super().__init__(n)
+        self.cursor = cursor
+
+    def push_batch(self, counts: np.ndarray, combos: np.ndarray) -> None:
+        if self.cursor is not None:
+            last, count = self.cursor
+            after = counts < count
+            tied = np.flatnonzero(counts == count)
+            if len(tied):
+                after[tied] = [
+                    tuple(combo) > last for combo in combos[tied].tolist()
+                ]
+            counts, combos = counts[after], combos[after]
+        super().push_batch(counts, combos)
+
+
+def iter_top_combinations(
+    index: BlockIndex,
+    k: int = 3,
+    depth: int = 3,
+    required: Sequence[int] = (),
+    excluded: Sequence[int] = (),
+    progress: Optional[CalcProgress] = None,
+) -> Iterator[Tuple[Tuple[int, ...], int]]:
+    """Stream the ranking of 'constrained_top_combinations' lazily.
+
+    The ranking is searched in rounds of the branch-and-bound search:
+    every round keeps the next ``depth`` combinations ranked after the
+    last one streamed, so its threshold is lowered to theirs, and the
+    depth doubles from one round to the next. Taking the first m
+    combinations costs about the search of the top 2m, and nothing is
+    searched past the round the consumer stops in. ``excluded`` is read
+    at every round, the consumer may exclude more blocks while it takes
+    the combinations.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    k : int
+        Number of blocks of a combination.
+    depth : int
+        Number of combinations searched by the first round.
+    required : Sequence[int]
+        Block indices every combination contains, at most k.
+    excluded : Sequence[int]
+        Block indices no combination contains.
+    progress : Optional[CalcProgress]
+        Restarted by every round, which ends with the whole space done.
+        Cancels the search.
+
+    Yields
+    ------
+    Tuple[Tuple[int, ...], int]
+        (block index combination, common stock count) pairs, best first.
+
+    """
+    cursor: Optional[Tuple[Tuple[int, ...], int]] = None
+    while True:
+        if cursor is not None and progress is not None:
+            progress.start(progress.total)
+        top = _TopNAfter(depth, cursor)
+        _search_constrained(index, top, k, required, excluded, progress)
+        if progress is not None:
+            # Combinations holding a block excluded since the start.
+            progress.advance(max(progress.total - progress.done, 0), top.best)
+        ranking = top.results()
+        yield from ranking
+        if len(ranking) < depth:
+            return
+        cursor = ranking[-1]
+        depth *= 2
+
+
+def anytime_top_combinations(
+    index: BlockIndex,
+    top_n: int = 3,
+    k: int = 3,
+    budget: float = 2.0,
+    progress: Optional[CalcProgress] = None,
+    overlaps: Optional[np.ndarray] = None,
+) -> Tuple[List[Tuple[Tuple[int, ...], int]], bool]:
+    """Best-first search of the top k-block combinations within a time budget.
+
+    The block pairs are first taken by decreasing overlap, grown greedily
+    with the block keeping the most common stocks, and every last block is
+    counted in one product. These seeds raise the N-th best count before
+    the exact search of 'bnb_top_combinations' runs on the remaining time,
+    which proves the ranking optimal if it finishes.
+
+    Parameters
+    ----------
+    index : BlockIndex
+        Packed membership of the mode list.
+    top_n : int
+        Number of top combinations to keep.
+    k : int
+        Number of blocks of a combination.
+    budget : float
+        Seconds the search may run.
+    progress : Optional[CalcProgress]
+        Receives the number of searched combinations, cancels the search.
+    overlaps : Optional[np.ndarray]
+        Pair overlaps of the blocks of ``index`` read from the database,
+        see 'load_pair_overlaps', computed from it when omitted.
+
+    Returns
+    -------
+    Tuple[List[Tuple[Tuple[int, ...], int]], bool]
+        (block index combination, common stock count) pairs, best first,
+        and whether the ranking is proven optimal.
+
+    """
+    deadline = time.perf_counter() + budget
+    order = np.argsort(-index.counts, kind="stable")
+    incidence = incidence_matrix(index)[:, order]
+    n = incidence.shape[1]
+    top = TopN(top_n)
+
+    if overlaps is None:
+        overlaps = pair_counts(incidence)
+    else:
+        overlaps = overlaps[np.ix_(order, order)]
+    first, second = np.triu_indices(n, k=1)
+    pairs = np.argsort(-overlaps[first, second], kind="stable")[:n]
+    for pair in pairs:
+        a, b = int(first[pair]), int(second[pair])
+        if overlaps[a, b] < top.threshold:
+            break
+        # Seeding goes on past the deadline until the ranking is full.
+        if time.perf_counter() >= deadline and top.threshold >= 0:
+            break
+
+        prefix = [a, b]
+        common = (incidence[:, a] > 0) & (incidence[:, b] > 0)
+        if k == 2:
+            top.push(int(overlaps[a, b]), tuple(sorted(order[prefix])))
+            continue
+
+        while True:
+            sizes = np.rint(incidence[common].sum(axis=0)).astype(np.int64)
+            sizes[prefix] = -1
+            if len(prefix) == k - 1:
+                rest = np.flatnonzero(sizes >= 0)
+                combos = np.column_stack(
+                    [np.full_like(rest, block) for block in prefix] + [rest]
+                )
+                top.push_batch(sizes[rest], np.sort(order[combos], axis=1))
+                break
+
+            block = int(np.argmax(sizes))
+            prefix.append(block)
+            common &= incidence[:, block] > 0
+
+    optimal = search_combinations(
+        incidence=incidence,
+        order=order,
+        top=top,
+        k=k,
+        progress=progress,
+        deadline=deadline,
+    )
+    return top.results(), optimal
@@ -0,0 +1,325 @@
+from itertools import combinations, islice
+from typing import Dict, List, Optional
+
+from sqlalchemy import ColumnElement, Select, and_, case, func, select, true
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.database import (
+    Block,
+    BlockPairOverlap,
+    Stock,
+    stock_block_association,
+)
+from src.utils.types import CombinationResultDict, StockFilterDict
+
+from .filters import is_empty_filter, stock_filter_condition
+from .progress import CalcProgress
+
+
+async def get_block_ids(
+    async_session: async_sessionmaker[AsyncSession],
+    blocks: List[str],
+) -> Dict[str, int]:
+    async with async_session() as session:
+        block_info_stmt = select(Block.id, Block.code).where(
+            Block.code.in_(blocks)
+        )
+        block_info_result = await session.execute(block_info_stmt)
+        block_info_query = block_info_result.all()
+
+    return {code: id for id, code in block_info_query}
+
+
+def kept_stocks(
+    stock_id: ColumnElement[int],
+    stock_filter: Optional[StockFilterDict],
+) -> ColumnElement[bool]:
+    """Condition on a stock id column leaving out the filtered stocks."""
+    excluded = stock_filter_condition(stock_filter)
+    if excluded is None:
+        return true()
+    return stock_id.not_in(select(Stock.id).where(excluded))
+
+
+async def get_common_stocks(
+    session: AsyncSession,
+    id_combo: List[int],
+    stock_filter: Optional[StockFilterDict] = None,
+) -> List[str]:
+    """Return sorted "{region}{code}" strings of the stocks shared by the blocks."""
+    stmt_common = (
+        select(stock_block_association.c.stock_id)
+        .filter(stock_block_association.c.block_id.in_(id_combo))
+        .filter(kept_stocks(stock_block_association.c.stock_id, stock_filter))
+        .group_by(stock_block_association.c.stock_id)
+        .having(func.count(stock_block_association.c.block_id) == len(id_combo))
+    )
+    result = await session.execute(stmt_common)
+
+    common_stock_ids = [row[0] for row in result.all()]
+
+    stock_info_stmt = select(Stock.region, Stock.code).where(
+        Stock.id.in_(common_stock_ids)
+    )
+
+    stock_info_result = await session.execute(stock_info_stmt)
+
+    return sorted(
+        [f"{region}{code}" for region, code in stock_info_result.all()]
+    )
+
+
+async def sql_combination_count(
+    async_session: async_sessionmaker[AsyncSession],
+    blocks: List[str],
+    top_n: int = 3,
+    k: int = 3,
+    progress: Optional[CalcProgress] = None,
+    stock_filter: Optional[StockFilterDict] = None,
+) -> List[CombinationResultDict]:
+    """Reference engine running one GROUP BY query per block combination.
+
+    It is kept to cross-check the results of the in-memory engines.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    blocks : List[str]
+        Block codes of the mode list.
+    top_n : int
+        Number of top combinations to return.
+    k : int
+        Number of blocks of a combination.
+    progress : Optional[CalcProgress]
+        Advanced after every query, cancels the calculation.
+    stock_filter : Optional[StockFilterDict]
+        Stocks left out of every count.
+
+    Returns
+    -------
+    List[CombinationResultDict]
+        Top combinations, best first.
+
+    """
+    block_tuple = list(combinations(blocks, k))
+    code2id_mapping = await get_block_ids(async_session, blocks)
+
+    results: dict = {}
+    best = -1
+
+    async with async_session() as session:
+        for code_combo in block_tuple:
+            id_combo = [code2id_mapping[code] for code in code_combo]
+            stmt = (
+                select(stock_block_association.c.stock_id)
+                .filter(stock_block_association.c.block_id.in_(id_combo))
+                .filter(
+                    kept_stocks(
+                        stock_block_association.c.stock_id,
+                        stock_filter,
+                    )
+                )
+                .group_by(stock_block_association.c.stock_id)
+                .having(func.count(stock_block_association.c.block_id) == k)
+            )
+            result = await session.execute(stmt)
+            common_stock_count = len(result.fetchall())
+            results[code_combo] = common_stock_count
+            best = max(best, common_stock_count)
+            if progress is not None:
+                progress.advance(1, best)
+
+    combination: List[tuple] = sorted(
+        results.items(), key=lambda item: item[1], reverse=True
+    )
+
+    ret: List[CombinationResultDict] = []
+
+    async with async_session() as session:
+        for code_combo, count in combination[:top_n]:
+            id_combo = [code2id_mapping[code] for code in code_combo]
+            ret.append(
+                {
+                    "blocks": list(code_combo),
+                    "count": count,
+                    "stocks": await get_common_stocks(
+                        session,
+                        id_combo,
+                        stock_filter,
+                    ),
+                }
+            )
+
+    return ret
+
+
+async def sql_join_combination_count(
+    async_session: async_sessionmaker[AsyncSession],
+    blocks: List[str],
+    top_n: int = 3,
+    k: int = 3,
+    progress: Optional[CalcProgress] = None,
+    stock_filter: Optional[StockFilterDict] = None,
+) -> List[CombinationResultDict]:
+    """Engine sending the whole ranking to SQLite as one statement.
+
+    'stock_block_association' is self-joined k times on the stock id,
+    restricted to the mode blocks in increasing mode list position, then
+    grouped by block combination and ordered by count. The mode list
+    position breaks ties like the reference engine. Combinations without
+    any common stock have no joined row, when fewer than ``top_n`` have
+    one the result is padded with zero counts in mode list order, like
+    the reference engine. Pairs without a stock filter are read from
+    'BlockPairOverlap' once it is filled.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    blocks : List[str]
+        Block codes of the mode list.
+    top_n : int
+        Number of top combinations to return.
+    k : int
+        Number of blocks of a combination.
+    progress : Optional[CalcProgress]
+        Only checked for cancellation before the statement runs.
+    stock_filter : Optional[StockFilterDict]
+        Stocks left out of every count.
+
+    Returns
+    -------
+    List[CombinationResultDict]
+        Top combinations, best first.
+
+    """
+    if progress is not None:
+        progress.advance(0, -1)
+
+    code2id_mapping = await get_block_ids(async_session, blocks)
+    id2code_mapping = {id: code for code, id in code2id_mapping.items()}
+    block_ids = [code2id_mapping[code] for code in blocks]
+    position = {id: i for i, id in enumerate(block_ids)}
+
+    stmt = None
+    if k == 2 and is_empty_filter(stock_filter):
+        async with async_session() as session:
+            filled = await session.scalar(
+                select(BlockPairOverlap.block_a).limit(1)
+            )
+        if filled is not None:
+            stmt = pair_overlap_statement(block_ids, position, top_n)
+
+    if stmt is None:
+        stmt = join_statement(block_ids, position, top_n, k, stock_filter)
+
+    ret: List[CombinationResultDict] = []
+
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        for row in result.all():
+            id_combo = list(row[:k])
+            ret.append(
+                {
+                    "blocks": [id2code_mapping[id] for id in id_combo],
+                    "count": row[k],
+                    "stocks": await get_common_stocks(
+                        session,
+                        id_combo,
+                        stock_filter,
+                    ),
+                }
+            )
+
+    return ret + zero_count_combinations(ret, blocks, top_n, k)
+
+
+def zero_count_combinations(
+    ranking: List[CombinationResultDict],
+    blocks: List[str],
+    top_n: int,
+    k: int,
+) -> List[CombinationResultDict]:
+    """First combinations missing from ``ranking``, which share no stock.
+
+    ``ranking`` holds every combination with a common stock when it is
+    shorter than ``top_n``, the others follow in 'combinations' order.
+    """
+    ranked = {frozenset(row["blocks"]) for row in ranking}
+    missing = (
+        combo
+        for combo in combinations(blocks, k)
+        if frozenset(combo) not in ranked
+    )
+    return [
+        {"blocks": list(combo), "count": 0, "stocks": []}
+        for combo in islice(missing, max(top_n - len(ranking), 0))
+    ]
+
+
+def pair_overlap_statement(
+    block_ids: List[int],
+    position: Dict[int, int],
+    top_n: int,
+) -> Select:
+    """Top block pairs read from 'BlockPairOverlap', in mode list order."""
+    positions = [
+        case(position, value=BlockPairOverlap.block_a),
+        case(position, value=BlockPairOverlap.block_b),
+    ]
+    first = case(
+        (positions[0] < positions[1], BlockPairOverlap.block_a),
+        else_=BlockPairOverlap.block_b,
+    )
+    second = case(
+        (positions[0] < positions[1], BlockPairOverlap.block_b),
+        else_=BlockPairOverlap.block_a,
+    )
+    return (
+        select(first, second, BlockPairOverlap.overlap)
+        .where(
+            BlockPairOverlap.block_a.in_(block_ids),
+            BlockPairOverlap.block_b.in_(block_ids),
+            BlockPairOverlap.block_a != BlockPairOverlap.block_b,
+        )
+        .order_by(
+            BlockPairOverlap.overlap.desc(),
+            func.min(*positions),
+            func.max(*positions),
+        )
+        .limit(top_n)
+    )
+
+
+def join_statement(
+    block_ids: List[int],
+    position: Dict[int, int],
+    top_n: int,
+    k: int,
+    stock_filter: Optional[StockFilterDict],
+) -> Select:
+    """Top k-block combinations counted by self-joining the associations."""
+    aliases = [stock_block_association.alias(f"a{i}") for i in range(k)]
+    positions = [case(position, value=alias.c.block_id) for alias in aliases]
+    count = func.count().label("count")
+
+    joined = aliases[0]
+    for alias in aliases[1:]:
+        joined = joined.join(
+            alias,
+            alias.c.stock_id == aliases[0].c.stock_id,
+        )
+
+    return (
+        select(*[alias.c.block_id for alias in aliases], count)
+        .select_from(joined)
+        .where(
+            and_(*[alias.c.block_id.in_(block_ids) for alias in aliases]),
+            and_(*[a < b for a, b in zip(positions, positions[1:])]),
+            kept_stocks(aliases[0].c.stock_id, stock_filter),
+        )
+        .group_by(*[alias.c.block_id for alias in aliases])
+        .order_by(count.desc(), *positions)
+        .limit(top_n)
+    )
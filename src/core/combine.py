@@ -1,33 +1,561 @@
-from itertools import combinations
-from typing import List
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from sqlalchemy import func, select
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from src.core.calc import (
+    RANKING_DEPTH,
+    BlockIndex,
+    CalcCancelled,
+    CalcOptions,
+    CalcProgress,
+    CalcRanking,
+    CalcState,
+    CollapsedIndex,
+    StockLookup,
+    anytime_top_combinations,
+    bitset_top_combinations,
+    bnb_top_combinations,
+    constrained_top_combinations,
+    diverse_top_combinations,
+    get_block_best,
+    get_stock_codes,
+    is_empty_filter,
+    load_block_index,
+    load_cached_result,
+    load_pair_overlaps,
+    load_signatures,
+    load_state,
+    matrix_top_combinations,
+    minhash_top_combinations,
+    parallel_top_combinations,
+    per_block_top_combinations,
+    result_cache_key,
+    save_lookup,
+    save_state,
+    sql_combination_count,
+    sql_join_combination_count,
+    store_cached_result,
+    update_state,
+)
 from src.core.database import (
-    Block,
     Mode,
-    Stock,
+    block_best2database,
+    equivalents2database,
+    helpers,
     result2database,
-    stock_block_association,
 )
-from src.utils.types import CombinationResultDict, Response
+from src.utils.types import (
+    CalcEngine,
+    CombinationResultDict,
+    Response,
+    StockFilterDict,
+)
+
+
+ENGINES: Dict[str, Callable] = {
+    "bnb": bnb_top_combinations,
+    "parallel": parallel_top_combinations,
+    "bitset": bitset_top_combinations,
+    "matrix": matrix_top_combinations,
+    "minhash": minhash_top_combinations,
+}
+
+SQL_ENGINES: Dict[str, Callable] = {
+    "sql_join": sql_join_combination_count,
+    "sql": sql_combination_count,
+}
+
+
+async def _parallel_args(
+    async_session: async_sessionmaker[AsyncSession],
+    index: BlockIndex,
+    options: CalcOptions,
+) -> Dict[str, Any]:
+    return {"workers": options.workers}
+
+
+async def _minhash_args(
+    async_session: async_sessionmaker[AsyncSession],
+    index: BlockIndex,
+    options: CalcOptions,
+) -> Dict[str, Any]:
+    # Stored signatures cover every stock, a filtered run builds its own.
+    if not is_empty_filter(options.stock_filter):
+        return {}
+
+    return {
+        "signatures": await load_signatures(
+            async_session=async_session,
+            blocks=index.codes,
+        )
+    }
+
+
+# Extra keyword arguments of the engines needing more than the index.
+ENGINE_ARGS: Dict[
+    str,
+    Callable[
+        [async_sessionmaker[AsyncSession], BlockIndex, CalcOptions],
+        Awaitable[Dict[str, Any]],
+    ],
+] = {
+    "parallel": _parallel_args,
+    "minhash": _minhash_args,
+}
+
+
+async def _rank_diverse(
+    async_session: async_sessionmaker[AsyncSession],
+    index: BlockIndex,
+    options: CalcOptions,
+    rows: Dict[str, List[int]],
+    progress: Optional[CalcProgress],
+) -> CalcRanking:
+    ranking = await asyncio.to_thread(
+        diverse_top_combinations,
+        index,
+        options.top_n,
+        options.k,
+        options.max_shared,
+        options.max_jaccard,
+        progress=progress,
+        **rows,
+    )
+    return CalcRanking(ranking=ranking)
+
+
+async def _rank_constrained(
+    async_session: async_sessionmaker[AsyncSession],
+    index: BlockIndex,
+    options: CalcOptions,
+    rows: Dict[str, List[int]],
+    progress: Optional[CalcProgress],
+) -> CalcRanking:
+    ranking = await asyncio.to_thread(
+        constrained_top_combinations,
+        index,
+        options.top_n,
+        options.k,
+        progress=progress,
+        **rows,
+    )
+    return CalcRanking(ranking=ranking)
+
+
+async def _rank_per_block(
+    async_session: async_sessionmaker[AsyncSession],
+    index: BlockIndex,
+    options: CalcOptions,
+    rows: Dict[str, List[int]],
+    progress: Optional[CalcProgress],
+) -> CalcRanking:
+    ranking, per_block = await asyncio.to_thread(
+        per_block_top_combinations,
+        index,
+        max(options.top_n, RANKING_DEPTH),
+        options.k,
+        progress=progress,
+    )
+    return CalcRanking(ranking=ranking, per_block=per_block)
+
+
+async def _rank_budget(
+    async_session: async_sessionmaker[AsyncSession],
+    index: BlockIndex,
+    options: CalcOptions,
+    rows: Dict[str, List[int]],
+    progress: Optional[CalcProgress],
+) -> CalcRanking:
+    overlaps = None
+    if is_empty_filter(options.stock_filter):
+        overlaps = await load_pair_overlaps(
+            async_session=async_session,
+            blocks=index.codes,
+        )
+    ranking, optimal = await asyncio.to_thread(
+        anytime_top_combinations,
+        index,
+        max(options.top_n, RANKING_DEPTH),
+        options.k,
+        options.budget,
+        progress=progress,
+        overlaps=overlaps,
+    )
+    return CalcRanking(ranking=ranking, optimal=optimal)
+
+
+async def _rank_engine(
+    async_session: async_sessionmaker[AsyncSession],
+    index: BlockIndex,
+    options: CalcOptions,
+    rows: Dict[str, List[int]],
+    progress: Optional[CalcProgress],
+) -> CalcRanking:
+    kwargs: Dict[str, Any] = {}
+    if options.engine in ENGINE_ARGS:
+        kwargs = await ENGINE_ARGS[options.engine](
+            async_session,
+            index,
+            options,
+        )
+
+    ranking = await asyncio.to_thread(
+        ENGINES[options.engine],
+        index,
+        max(options.top_n, RANKING_DEPTH),
+        options.k,
+        progress=progress,
+        **kwargs,
+    )
+    return CalcRanking(ranking=ranking, optimal=options.exact_engine)
+
+
+# Search of the ranking by 'CalcOptions.mode'.
+RANKERS: Dict[
+    str,
+    Callable[
+        [
+            async_sessionmaker[AsyncSession],
+            BlockIndex,
+            CalcOptions,
+            Dict[str, List[int]],
+            Optional[CalcProgress],
+        ],
+        Awaitable[CalcRanking],
+    ],
+] = {
+    "diverse": _rank_diverse,
+    "constrained": _rank_constrained,
+    "per_block": _rank_per_block,
+    "budget": _rank_budget,
+    "engine": _rank_engine,
+}
+
+
+async def _rank(
+    async_session: async_sessionmaker[AsyncSession],
+    index: BlockIndex,
+    options: CalcOptions,
+    rows: Dict[str, List[int]],
+    version: int,
+    progress: Optional[CalcProgress],
+) -> CalcRanking:
+    """Search the ranking, or update the one of the previous calculation."""
+    depth = max(options.top_n, RANKING_DEPTH)
+    state = None
+    if options.incremental_search:
+        state = await load_state(
+            async_session=async_session,
+            version=version,
+            k=options.k,
+            stock_filter=options.stock_filter,
+        )
+    if state is not None:
+        state = await asyncio.to_thread(
+            update_state,
+            state,
+            index,
+            options.top_n,
+            depth,
+        )
+
+    if state is not None:
+        ranked = CalcRanking(ranking=state.positions(index))
+    else:
+        ranked = await RANKERS[options.mode](
+            async_session,
+            index,
+            options,
+            rows,
+            progress,
+        )
+        if ranked.optimal and options.exact_search:
+            state = CalcState.from_ranking(
+                version=version,
+                k=options.k,
+                index=index,
+                ranking=ranked.ranking,
+                depth=depth,
+                stock_filter=options.stock_filter,
+            )
+
+    if state is not None:
+        await save_state(async_session=async_session, state=state)
+    ranked.ranking = ranked.ranking[: options.top_n]
+    return ranked
+
+
+async def _result_rows(
+    async_session: async_sessionmaker[AsyncSession],
+    index: BlockIndex,
+    collapsed: Optional[CollapsedIndex],
+    options: CalcOptions,
+    ranking: List[Tuple[Tuple[int, ...], int]],
+) -> List[CombinationResultDict]:
+    """CalcResult rows of the ranking, with the block codes the user asked for."""
+    ret: List[CombinationResultDict] = []
+    for combo, count in ranking:
+        if collapsed is None:
+            codes = [index.codes[i] for i in combo]
+        else:
+            codes = collapsed.codes(combo, options.required)
+        ret.append(
+            {
+                "blocks": codes,
+                "count": count,
+                "stocks": await get_stock_codes(
+                    async_session=async_session,
+                    stock_ids=index.intersection(combo),
+                ),
+            }
+        )
+    return ret
+
+
+async def _index_combination_count(
+    async_session: async_sessionmaker[AsyncSession],
+    blocks: List[str],
+    options: CalcOptions,
+    version: int,
+    progress: Optional[CalcProgress],
+) -> Response:
+    """Calculate on the in-memory index, data holds the rows to store."""
+    index = await load_block_index(
+        async_session=async_session,
+        blocks=blocks,
+        stock_filter=options.stock_filter,
+    )
+    if is_empty_filter(options.stock_filter):
+        save_lookup(StockLookup(index=index, version=version))
+
+    data: Dict[str, Any] = {"equivalents": {}}
+    collapsed = None
+    position = {code: i for i, code in enumerate(index.codes)}
+    excluded_rows = [position[code] for code in options.excluded]
+    if options.collapse:
+        collapsed = CollapsedIndex(index=index, excluded=options.excluded)
+        index, position = collapsed.index, collapsed.position
+        excluded_rows = []
+        data["collapse"] = collapsed.summary(options.k)
+
+    required_rows = list(
+        dict.fromkeys(position[code] for code in options.required)
+    )
+    if len(required_rows) < len(options.required):
+        return Response(
+            code=402,
+            message=f"计算: 必选板块 {options.required} 中有股票相同的板块",
+            data=None,
+        )
+
+    if options.collapse:
+        space = options.space(index.n_blocks, len(required_rows))
+        if options.too_small(space):
+            return Response(
+                code=401,
+                message="去重后需计算的板块数量较少，请添加板块",
+                data=None,
+            )
+        if progress is not None:
+            progress.start(space)
+
+    ranked = await _rank(
+        async_session=async_session,
+        index=index,
+        options=options,
+        rows={"required": required_rows, "excluded": excluded_rows},
+        version=version,
+        progress=progress,
+    )
+
+    ret = await _result_rows(
+        async_session=async_session,
+        index=index,
+        collapsed=collapsed,
+        options=options,
+        ranking=ranked.ranking,
+    )
+    if collapsed is not None:
+        data["equivalents"] = collapsed.equivalents(
+            code for row in ret for code in row["blocks"]
+        )
+
+    if ranked.per_block is not None:
+        data["best"] = await get_block_best(
+            async_session=async_session,
+            index=index,
+            per_block=ranked.per_block,
+            collapsed=collapsed,
+        )
+
+    return Response(
+        code=200,
+        message="SUCCESS",
+        data={"result": ret, "optimal": ranked.optimal, **data},
+    )
+
+
+async def _calc_combination_count(
+    async_session: async_sessionmaker[AsyncSession],
+    blocks: List[str],
+    options: CalcOptions,
+    progress: Optional[CalcProgress],
+) -> Response:
+    """Look the result up in the cache, or calculate it with the engine."""
+    version = await helpers.get_dataset_version(
+        async_session=async_session,
+    )
+    key = None
+    if options.cached:
+        key = result_cache_key(
+            blocks=blocks,
+            version=version,
+            **options.cache_params(),
+        )
+
+    cached = await load_cached_result(
+        async_session=async_session,
+        key=key,
+    )
+    if cached is not None:
+        return Response(
+            code=200,
+            message="SUCCESS",
+            data={**cached, "optimal": True},
+        )
+
+    if options.sql:
+        ret = await SQL_ENGINES[options.engine](
+            async_session=async_session,
+            blocks=blocks,
+            top_n=options.top_n,
+            k=options.k,
+            progress=progress,
+            stock_filter=options.stock_filter,
+        )
+        return Response(
+            code=200,
+            message="SUCCESS",
+            data={"result": ret, "equivalents": {}, "optimal": True},
+        )
+
+    response = await _index_combination_count(
+        async_session=async_session,
+        blocks=blocks,
+        options=options,
+        version=version,
+        progress=progress,
+    )
+    if response["code"] == 200:
+        await store_cached_result(
+            async_session=async_session,
+            key=key,
+            result=response["data"]["result"],
+            equivalents=response["data"]["equivalents"],
+            optimal=response["data"]["optimal"],
+        )
+    return response
 
 
 async def get_combination_count(
     async_session: async_sessionmaker[AsyncSession],
     top_n: int = 3,
+    engine: CalcEngine = "bnb",
+    k: int = 3,
+    workers: Optional[int] = None,
+    incremental: bool = True,
+    cache: bool = True,
+    progress: Optional[CalcProgress] = None,
+    budget: Optional[float] = None,
+    required: Optional[List[str]] = None,
+    excluded: Optional[List[str]] = None,
+    stock_filter: Optional[StockFilterDict] = None,
+    max_shared: Optional[int] = None,
+    max_jaccard: Optional[float] = None,
+    collapse: bool = False,
+    per_block: bool = False,
 ) -> Response:
     """Get count of combinations for a given path.
 
     Args:
         async_session: Database session factory
         top_n: Number of top combinations to return (default: 3)
+        engine: "bnb" for the pruned top-N search, "parallel" for the same
+            search sharded over a process pool, "matrix" for incidence
+            matrix products, "bitset" for AND + popcount over packed
+            bitsets, "minhash" for an approximate search shortlisting
+            combinations from the MinHash signatures, "sql_join" for one
+            self-join statement in SQLite, "sql" for the per-combination
+            query reference engine
+            (default: "bnb")
+        k: Number of blocks of a combination, from 2 to 6 (default: 3),
+            "matrix" and "bitset" only support 3
+        workers: Number of processes of the "parallel" engine (default:
+            CPU count)
+        incremental: Update the ranking of the previous calculation when
+            only mode blocks were added or removed since (default: True)
+        cache: Look up and store the result in the persistent calc cache,
+            keyed by the mode blocks, k, top_n and dataset version
+            (default: True)
+        progress: Receives periodic progress reports and cancels the
+            calculation when its 'cancel' is called, the previous
+            CalcResult rows are then kept (default: None)
+        budget: Seconds the calculation may run. When set, a full
+            calculation by the in-memory engines is replaced by the anytime
+            search, which returns the best combinations found in time
+            (default: None, exact)
+        required: Block codes every combination must contain, at most k.
+            Only the constrained combinations are searched, the engine,
+            budget and incremental state are then not used (default: None)
+        excluded: Block codes no combination may contain (default: None)
+        stock_filter: Regions, code prefixes and codes of the stocks left
+            out of every count (default: None)
+        max_shared: Most blocks a result may share with every better
+            result, from 0 to k - 1 (default: None)
+        max_jaccard: Highest stock Jaccard similarity a result may have
+            with every better result, from 0 to 1 (default: None). With
+            either one, results are picked greedily from the ranking and
+            the budget and incremental state are not used
+        collapse: Enumerate one representative of every group of blocks
+            with equal stock sets, so no combination holds two blocks of
+            a group and each result stands for all combinations of the
+            equivalent blocks. A result shows the required block of a
+            group, else its first block, and the groups of its blocks are
+            stored in the CalcEquivalent table. Excluded blocks are
+            dropped before the grouping, the incremental state is not
+            used (default: False)
+        per_block: Also find the best combination containing every block
+            of the mode list in the same search and store them in the
+            BlockBest table. The engine, budget, cache lookup and
+            incremental state are then not used (default: False)
 
     Returns:
-        Response object containing combination count data
+        Response object, data["optimal"] tells whether the result is
+        proven optimal. With collapse and unless the result was cached,
+        data["collapse"] holds the block and search space sizes before
+        and after and maps every representative to its equivalent block
+        codes
     """
 
+    options = CalcOptions(
+        top_n=top_n,
+        engine=engine,
+        k=k,
+        workers=workers,
+        incremental=incremental,
+        cache=cache,
+        budget=budget,
+        required=required or [],
+        excluded=excluded or [],
+        stock_filter=stock_filter,
+        max_shared=max_shared,
+        max_jaccard=max_jaccard,
+        collapse=collapse,
+        per_block=per_block,
+    )
+
     try:
         async with async_session() as session:
             stmt = select(Mode.code)
@@ -41,88 +569,60 @@ async def get_combination_count(
             data=None,
         )
 
-    try:
-        block_tuple = list(combinations(blocks, 3))
+    options = options.for_blocks(blocks)
+    error = options.validate(blocks)
+    if error is not None:
+        return Response(code=402, message=error, data=None)
 
-        if len(block_tuple) <= 3:
+    try:
+        space = options.space(
+            len(blocks) - len(options.excluded),
+            len(options.required),
+        )
+        if options.too_small(space):
             return Response(
                 code=401,
                 message="需计算的板块数量较少，请添加板块",
                 data=None,
             )
 
-        async with async_session() as session:
-            block_info_stmt = select(Block.id, Block.code).where(
-                Block.code.in_(blocks)
-            )
-            block_info_result = await session.execute(block_info_stmt)
-            block_info_query = block_info_result.all()
-
-        code2id_mapping = {code: id for id, code in block_info_query}
-
-        results: dict = {}
-
-        async with async_session() as session:
-            for code_triplet in block_tuple:
-                id_triplet = [code2id_mapping[code] for code in code_triplet]
-                stmt = (
-                    select(stock_block_association.c.stock_id)
-                    .filter(stock_block_association.c.block_id.in_(id_triplet))
-                    .group_by(stock_block_association.c.stock_id)
-                    .having(func.count(stock_block_association.c.block_id) == 3)
-                )
-                result = await session.execute(stmt)
-                common_stock_count = len(result.fetchall())
-                results[code_triplet] = common_stock_count
+        if progress is not None:
+            progress.start(space)
 
-        combination: List[tuple] = sorted(
-            results.items(), key=lambda item: item[1], reverse=True
+        response = await _calc_combination_count(
+            async_session=async_session,
+            blocks=blocks,
+            options=options,
+            progress=progress,
         )
+        if response["code"] != 200:
+            return response
 
-        ret: List[CombinationResultDict] = []
-
-        async with async_session() as session:
-            for code_triplet, count in combination[:top_n]:
-                id_triplet = [code2id_mapping[code] for code in code_triplet]
-                stmt_common = (
-                    select(stock_block_association.c.stock_id)
-                    .filter(stock_block_association.c.block_id.in_(id_triplet))
-                    .group_by(stock_block_association.c.stock_id)
-                    .having(func.count(stock_block_association.c.block_id) == 3)
-                )
-                result = await session.execute(stmt_common)
-
-                common_stock_ids = [row[0] for row in result.all()]
-
-                stock_info_stmt = select(Stock.region, Stock.code).where(
-                    Stock.id.in_(common_stock_ids)
-                )
-
-                stock_info_result = await session.execute(stock_info_stmt)
-
-                common_stock_codes_with_region: List[str] = sorted(
-                    [
-                        f"{region}{code}"
-                        for region, code in stock_info_result.all()
-                    ]
-                )
-
-                ret.append(
-                    {
-                        "blocks": list(code_triplet),
-                        "count": count,
-                        "stocks": common_stock_codes_with_region,
-                    }
-                )
-
+        data = response["data"]
         await result2database(
             async_session=async_session,
-            result=ret,
+            result=data.pop("result"),
+        )
+        await equivalents2database(
+            async_session=async_session,
+            equivalents=data.pop("equivalents"),
         )
+        if options.per_block:
+            await block_best2database(
+                async_session=async_session,
+                result=data.pop("best"),
+            )
 
         return Response(
             code=200,
             message="SUCCESS",
+            data=data,
+        )
+
+    except CalcCancelled:
+        return Response(
+            code=403,
+            message="计算已取消",
             data=None,
         )
 
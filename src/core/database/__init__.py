@@ -2,15 +2,31 @@ from .helpers import create_async_session
 from .models import (
     Base,
     Block,
+    BlockBest,
+    BlockPairOverlap,
+    BlockSignature,
+    CalcCache,
+    CalcEquivalent,
+    CalcRankingState,
     CalcResult,
+    Meta,
     Mode,
+    SourceFile,
     Stock,
     stock_block_association,
 )
 from .populate_database import (
+    block_best2database,
+    bump_dataset_version,
+    cache2database,
+    equivalents2database,
     insert_block2mode,
     mode2database,
+    overlaps2database,
     result2database,
+    signatures2database,
+    source_files2database,
+    state2database,
     update_database,
 )
 
@@ -21,6 +37,8 @@ __all__: list[str] = [
     "Base",
     "Block",
     "CalcResult",
+    "CalcCache",
+    "Meta",
     "mode2database",
     "Mode",
     "create_async_session",
@@ -28,4 +46,18 @@ __all__: list[str] = [
     "stock_block_association",
     "insert_block2mode",
     "result2database",
+    "bump_dataset_version",
+    "cache2database",
+    "BlockSignature",
+    "signatures2database",
+    "BlockBest",
+    "block_best2database",
+    "CalcEquivalent",
+    "equivalents2database",
+    "CalcRankingState",
+    "state2database",
+    "BlockPairOverlap",
+    "overlaps2database",
+    "SourceFile",
+    "source_files2database",
 ]
@@ -1,12 +1,17 @@
 import asyncio
-from typing import Dict, List
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
 from sqlalchemy import (
     URL,
     distinct,
     func,
     select,
+    update,
 )
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_sessionmaker,
@@ -15,8 +20,22 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.ext.asyncio.engine import AsyncEngine
 from sqlalchemy.orm import Session
 
-from src.core.database.models import Base, Block, Stock, stock_block_association
-from src.utils.types import Status
+from src.core.database.models import (
+    Base,
+    Block,
+    CalcCache,
+    CalcRankingState,
+    Meta,
+    SourceFile,
+    Stock,
+    stock_block_association,
+)
+from src.utils.types import (
+    CachedResultDict,
+    CalcStateDict,
+    SourceFileDict,
+    Status,
+)
 
 
 async def create_async_session(
@@ -35,10 +54,18 @@ async def create_async_session(
     )
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_indexes)
 
     return async_session
 
 
+def create_indexes(conn: Connection) -> None:
+    """Create indexes added after a table already existed in the database."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
 def get_block_list(session: Session) -> list:
     blocks_code: List[Dict[str, str]] = [
         {
@@ -136,3 +163,80 @@ async def get_status(
             "block_valid_count": 0,
             "calc": 0,
         }
+
+
+async def get_dataset_version(
+    async_session: async_sessionmaker[AsyncSession],
+) -> int:
+    """Return the dataset version bumped by every data update."""
+    async with async_session() as session:
+        value = await session.scalar(
+            select(Meta.value).where(Meta.key == "dataset_version")
+        )
+    return int(value) if value else 0
+
+
+async def get_source_files(
+    async_session: async_sessionmaker[AsyncSession],
+) -> Dict[str, SourceFileDict]:
+    """Return the manifest of the TDX files loaded last, by file name."""
+    async with async_session() as session:
+        result = await session.execute(select(SourceFile))
+        records = result.scalars().all()
+
+    return {
+        record.name: {
+            "name": record.name,
+            "size": record.size,
+            "mtime_ns": record.mtime_ns,
+            "digest": record.digest,
+            "content": record.content,
+        }
+        for record in records
+    }
+
+
+def calc_cache_key(**params: Any) -> str:
+    """Content address of a calculation, the sha256 of its parameters."""
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def get_cached_result(
+    async_session: async_sessionmaker[AsyncSession],
+    key: str,
+) -> Optional[CachedResultDict]:
+    """Return the cached calculation result of ``key`` and mark it as used."""
+    async with async_session() as session:
+        result = await session.scalar(
+            select(CalcCache.result).where(CalcCache.key == key)
+        )
+        if result is not None:
+            await session.execute(
+                update(CalcCache)
+                .where(CalcCache.key == key)
+                .values(accessed_at=datetime.now())
+            )
+            await session.commit()
+
+    return result
+
+
+async def get_calc_state(
+    async_session: async_sessionmaker[AsyncSession],
+    key: str,
+) -> Optional[CalcStateDict]:
+    """Return the incremental calculation state of ``key`` and mark it as used."""
+    async with async_session() as session:
+        state = await session.scalar(
+            select(CalcRankingState.state).where(CalcRankingState.key == key)
+        )
+        if state is not None:
+            await session.execute(
+                update(CalcRankingState)
+                .where(CalcRankingState.key == key)
+                .values(accessed_at=datetime.now())
+            )
+            await session.commit()
+
+    return state
@@ -6,7 +6,9 @@ from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     String,
     Table,
     func,
@@ -37,6 +39,8 @@ stock_block_association = Table(
         primary_key=True,
         nullable=False,
     ),
+    # The primary key leads with stock_id, lookups by block need their own.
+    Index("ix_stock_block_association_block_stock", "block_id", "stock_id"),
 )
 
 
@@ -99,3 +103,65 @@ class CalcResult(Base):
     blocks = Column(JSON, nullable=False)
     stocks = Column(JSON, nullable=False)
     count = Column(Integer, nullable=False)
+
+
+class BlockBest(Base):
+    __tablename__: str = "block_best"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    block = Column(String, nullable=False, index=True)
+    blocks = Column(JSON, nullable=False)
+    stocks = Column(JSON, nullable=False)
+    count = Column(Integer, nullable=False)
+
+
+class CalcEquivalent(Base):
+    __tablename__: str = "calc_equivalent"
+    block = Column(String, primary_key=True)
+    codes = Column(JSON, nullable=False)
+
+
+class CalcRankingState(Base):
+    __tablename__: str = "calc_state"
+    key = Column(String(64), primary_key=True)
+    state = Column(JSON, nullable=False)
+    accessed_at = Column(DateTime, default=datetime.now, index=True)
+
+
+class Meta(Base):
+    __tablename__: str = "meta"
+    key = Column(String(100), primary_key=True)
+    value = Column(String, nullable=False)
+
+
+class CalcCache(Base):
+    __tablename__: str = "calc_cache"
+    key = Column(String(64), primary_key=True)
+    result = Column(JSON, nullable=False)
+    size = Column(Integer, nullable=False)
+    accessed_at = Column(DateTime, default=datetime.now, index=True)
+
+
+class BlockPairOverlap(Base):
+    __tablename__: str = "block_pair_overlap"
+    block_a = Column(Integer, ForeignKey("blocks.id"), primary_key=True)
+    block_b = Column(Integer, ForeignKey("blocks.id"), primary_key=True)
+    overlap = Column(Integer, nullable=False)
+
+    # Pairs are stored once with block_a <= block_b, the diagonal holds
+    # the block sizes, lookups by the second block need their own index.
+    __table_args__ = (Index("ix_block_pair_overlap_block_b", "block_b"),)
+
+
+class SourceFile(Base):
+    __tablename__: str = "source_file"
+    name = Column(String(100), primary_key=True)
+    size = Column(Integer, nullable=False)
+    mtime_ns = Column(Integer, nullable=False)
+    digest = Column(String(64), nullable=False)
+    content = Column(JSON)
+
+
+class BlockSignature(Base):
+    __tablename__: str = "block_signature"
+    block_id = Column(Integer, ForeignKey("blocks.id"), primary_key=True)
+    signature = Column(LargeBinary, nullable=False)
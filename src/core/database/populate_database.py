@@ -1,25 +1,67 @@
-from typing import Dict, List, cast
+import itertools
+import json
+import warnings
+from datetime import datetime
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    cast,
+)
 
-from sqlalchemy import delete, select
+import numpy as np
+import pandas as pd
+from sqlalchemy import (
+    and_,
+    bindparam,
+    delete,
+    func,
+    or_,
+    select,
+    update,
+)
 from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import selectinload
+from sqlalchemy.sql.elements import ColumnElement
 
 import src.core.database.helpers as helpers
 from src.core.database.models import (
     Block,
+    BlockBest,
+    BlockPairOverlap,
+    BlockSignature,
+    CalcCache,
+    CalcEquivalent,
+    CalcRankingState,
     CalcResult,
+    Meta,
     Mode,
+    SourceFile,
     Stock,
     stock_block_association,
 )
-from src.utils.types import CombinationResultDict, StockDict
+from src.utils.types import (
+    AdditionBlockDict,
+    BlockBestDict,
+    CachedResultDict,
+    CalcStateDict,
+    CombinationResultDict,
+    DatabaseDiffDict,
+    SourceFileDict,
+    StockColumnsDict,
+    StockDict,
+)
 
 
 async def clear_database(
     async_session: async_sessionmaker[AsyncSession],
 ) -> None:
-    """clear tables [blocks, stocks, stock_block_association, mode]
+    """clear tables [blocks, stocks, stock_block_association, mode, source_file]
 
     Parameters
         ----------
@@ -28,6 +70,7 @@ async def clear_database(
 
     """
     async with async_session() as session:
+        await session.execute(delete(SourceFile))
         await session.execute(delete(stock_block_association))
         await session.execute(delete(Stock))
         await session.execute(delete(Block))
@@ -97,6 +140,65 @@ async def stocks2database(
         # b2 = b1.scalar_one()
 
 
+async def stock_columns2database(
+    async_session: async_sessionmaker[AsyncSession],
+    data: StockColumnsDict,
+) -> None:
+    """Bulk load the columnar stocks of 'get_stock_columns' and their associations.
+
+    Stock and block ids are read back with one query each and joined to
+    the association pairs as arrays, instead of one query per stock.
+    Known stocks keep their ids and only get their region updated.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    data : StockColumnsDict
+        Stock codes, regions and (stock position, block code) pairs.
+
+    """
+    stmt = insert(Stock)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Stock.code],
+        set_={
+            "region": stmt.excluded.region,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    async with async_session() as session:
+        await session.execute(
+            stmt,
+            [
+                {"code": code, "region": region}
+                for code, region in zip(
+                    data["code"].tolist(),
+                    data["region"].tolist(),
+                )
+            ],
+        )
+
+        result = await session.execute(select(Stock.id, Stock.code))
+        stock_ids = pd.Series({code: id for id, code in result.all()})
+        result = await session.execute(select(Block.id, Block.code))
+        block_ids = pd.Series({code: id for id, code in result.all()})
+
+        stock_id = stock_ids.reindex(data["code"][data["stock"]]).to_numpy()
+        block_id = block_ids.reindex(data["block"]).to_numpy()
+        if len(block_id):
+            await session.execute(
+                insert(stock_block_association),
+                [
+                    {"stock_id": stock, "block_id": block}
+                    for stock, block in zip(
+                        stock_id.tolist(),
+                        block_id.tolist(),
+                    )
+                ],
+            )
+        await session.commit()
+
+
 async def infoharbor2database(
     async_session: async_sessionmaker[AsyncSession],
     data: List[Dict[str, str | List[dict]]],
@@ -150,6 +252,772 @@ async def infoharbor2database(
         await session.commit()
 
 
+AdditionStream = Iterable[AdditionBlockDict] | AsyncIterable[AdditionBlockDict]
+
+
+async def _stream(data: AdditionStream) -> AsyncIterator[AdditionBlockDict]:
+    """Iterate concept blocks from a list, a generator or a queue."""
+    if isinstance(data, AsyncIterable):
+        async for block in data:
+            yield block
+    else:
+        for block in data:
+            yield block
+
+
+async def addition2database(
+    async_session: async_sessionmaker[AsyncSession],
+    data: AdditionStream,
+) -> int:
+    """Insert streamed concept blocks of 'iter_addition' block by block.
+
+    The ids of all known stocks and blocks are read once, then every
+    block costs one bulk insert of its new stocks, one id lookup of
+    those and one bulk insert of its associations.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    data : AdditionStream
+        Concept blocks with their stock codes and regions, in a plain or
+        an asynchronous iterable.
+
+    Returns
+    -------
+    int
+        Number of inserted blocks.
+
+    """
+    n_blocks = 0
+    async with async_session() as session:
+        result = await session.execute(select(Stock.id, Stock.code))
+        stock_ids: Dict[str, int] = {code: id for id, code in result.all()}
+        result = await session.execute(select(Block.id, Block.code))
+        block_ids: Dict[str, int] = {code: id for id, code in result.all()}
+
+        async for block in _stream(data):
+            codes = [f"{code:06d}" for code in block["stocks"].tolist()]
+            new = {
+                code: region
+                for code, region in zip(codes, block["regions"].tolist())
+                if code not in stock_ids
+            }
+            if new:
+                await session.execute(
+                    insert(Stock).on_conflict_do_nothing(
+                        index_elements=[Stock.code]
+                    ),
+                    [
+                        {"code": code, "region": region}
+                        for code, region in new.items()
+                    ],
+                )
+                result = await session.execute(
+                    select(Stock.id, Stock.code).where(Stock.code.in_(new))
+                )
+                stock_ids.update({code: id for id, code in result.all()})
+
+            block_id = block_ids[block["code"]]
+            await session.execute(
+                insert(stock_block_association).on_conflict_do_nothing(),
+                [
+                    {"stock_id": stock_ids[code], "block_id": block_id}
+                    for code in dict.fromkeys(codes)
+                ],
+            )
+            n_blocks += 1
+
+        await session.commit()
+
+    return n_blocks
+
+
+def _mode_counts():
+    """Statement recomputing the counts of the mode list."""
+    return update(Mode).values(
+        count=select(func.count(stock_block_association.c.stock_id))
+        .join(Block, Block.id == stock_block_association.c.block_id)
+        .where(Block.code == Mode.code)
+        .scalar_subquery()
+    )
+
+
+def _pair_keys(stock_ids: np.ndarray, block_ids: np.ndarray) -> np.ndarray:
+    """Pack (stock id, block id) pairs into sortable int64 keys."""
+    return (stock_ids.astype(np.int64) << 32) | block_ids.astype(np.int64)
+
+
+# Low half of a packed pair key, the block id.
+_BLOCK_KEY_MASK = np.int64(0xFFFFFFFF)
+
+
+def _wanted_pairs(
+    stock_ids: pd.Series,
+    block_ids: pd.Series,
+    pair_stocks: List[str],
+    pair_blocks: List[str],
+) -> np.ndarray:
+    """Packed keys of the memberships listed in the TDX files.
+
+    Memberships of a block code missing from tdxzs3.cfg have no block id,
+    they are dropped with a warning instead of being stored with an id
+    cast from NaN.
+    """
+    stock_id = stock_ids.reindex(pair_stocks).to_numpy()
+    block_id = block_ids.reindex(pair_blocks).to_numpy()
+    known = ~(pd.isna(stock_id) | pd.isna(block_id))
+    if not known.all():
+        unknown = sorted(
+            set(np.asarray(pair_blocks, dtype=object)[~known].tolist())
+        )
+        warnings.warn(
+            f"Dropped {int((~known).sum())} memberships of unknown blocks "
+            f"{unknown}",
+            RuntimeWarning,
+            stacklevel=2,
+        )
+    return np.unique(_pair_keys(stock_id[known], block_id[known]))
+
+
+def _block_changes(
+    names: Dict[str, Optional[str]],
+    known_blocks: Dict[str, Tuple[int, Optional[str]]],
+) -> Tuple[List[dict], List[int], List[dict]]:
+    """Added, removed and renamed blocks of the TDX files."""
+    added = [
+        {"code": code, "name": name}
+        for code, name in names.items()
+        if code not in known_blocks
+    ]
+    removed = [
+        id for code, (id, _) in known_blocks.items() if code not in names
+    ]
+    renamed = [
+        {"id": known_blocks[code][0], "name": name}
+        for code, name in names.items()
+        if code in known_blocks and known_blocks[code][1] != name
+    ]
+    return added, removed, renamed
+
+
+def _stock_changes(
+    regions: Dict[str, int],
+    known_stocks: Dict[str, Tuple[int, int]],
+) -> Tuple[List[dict], List[int], List[dict]]:
+    """Added, removed and moved stocks of the TDX files."""
+    added = [
+        {"code": code, "region": region}
+        for code, region in regions.items()
+        if code not in known_stocks
+    ]
+    removed = [
+        id for code, (id, _) in known_stocks.items() if code not in regions
+    ]
+    changed = [
+        {"id": known_stocks[code][0], "region": region}
+        for code, region in regions.items()
+        if code in known_stocks and known_stocks[code][1] != region
+    ]
+    return added, removed, changed
+
+
+async def _write_entities(
+    session: AsyncSession,
+    added_blocks: List[dict],
+    renamed_blocks: List[dict],
+    added_stocks: List[dict],
+    changed_stocks: List[dict],
+) -> None:
+    """Insert and update the blocks and stocks, before the memberships."""
+    if added_blocks:
+        await session.execute(insert(Block).values(added_blocks))
+    if renamed_blocks:
+        # Core statement, the hybrid 'stock_count' of Block does not
+        # resolve in ORM bulk statements.
+        blocks_table = Block.__table__
+        await session.execute(
+            update(blocks_table)
+            .where(blocks_table.c.id == bindparam("block_id"))
+            .values(name=bindparam("block_name")),
+            [
+                {"block_id": block["id"], "block_name": block["name"]}
+                for block in renamed_blocks
+            ],
+        )
+    if added_stocks:
+        await session.execute(insert(Stock), added_stocks)
+    if changed_stocks:
+        await session.execute(update(Stock), changed_stocks)
+
+
+async def _current_pairs(
+    session: AsyncSession,
+    *where: ColumnElement[bool],
+) -> np.ndarray:
+    """Packed keys of the memberships stored in the database."""
+    result = await session.execute(
+        select(
+            stock_block_association.c.stock_id,
+            stock_block_association.c.block_id,
+        ).where(*where)
+    )
+    rows = result.all()
+    # Rows are flattened, numpy is slow to convert Row objects.
+    pairs = np.fromiter(
+        itertools.chain.from_iterable(rows),
+        dtype=np.int64,
+        count=2 * len(rows),
+    ).reshape(-1, 2)
+    return _pair_keys(pairs[:, 0], pairs[:, 1])
+
+
+async def _write_memberships(
+    session: AsyncSession,
+    added: np.ndarray,
+    removed: np.ndarray,
+) -> None:
+    """Delete and insert the memberships given as packed keys."""
+    if len(removed):
+        await session.execute(
+            delete(stock_block_association).where(
+                stock_block_association.c.stock_id == bindparam("stock"),
+                stock_block_association.c.block_id == bindparam("block"),
+            ),
+            [
+                {"stock": stock, "block": block}
+                for stock, block in zip(
+                    (removed >> 32).tolist(),
+                    (removed & _BLOCK_KEY_MASK).tolist(),
+                )
+            ],
+        )
+    if len(added):
+        await session.execute(
+            insert(stock_block_association),
+            [
+                {"stock_id": stock, "block_id": block}
+                for stock, block in zip(
+                    (added >> 32).tolist(),
+                    (added & _BLOCK_KEY_MASK).tolist(),
+                )
+            ],
+        )
+
+
+async def _remove_blocks(
+    session: AsyncSession,
+    removed_blocks: List[int],
+) -> None:
+    """Delete blocks with their mode entries, signatures and overlaps."""
+    if not removed_blocks:
+        return
+
+    await session.execute(
+        delete(Mode).where(
+            Mode.code.in_(
+                select(Block.code).where(Block.id.in_(removed_blocks))
+            )
+        )
+    )
+    await session.execute(
+        delete(BlockSignature).where(
+            BlockSignature.block_id.in_(removed_blocks)
+        )
+    )
+    await session.execute(
+        delete(BlockPairOverlap).where(
+            or_(
+                BlockPairOverlap.block_a.in_(removed_blocks),
+                BlockPairOverlap.block_b.in_(removed_blocks),
+            )
+        )
+    )
+    await session.execute(delete(Block).where(Block.id.in_(removed_blocks)))
+
+
+def _diff(
+    blocks_added: int = 0,
+    blocks_removed: int = 0,
+    blocks_renamed: int = 0,
+    stocks_added: int = 0,
+    stocks_removed: int = 0,
+    stocks_changed: int = 0,
+    memberships_added: int = 0,
+    memberships_removed: int = 0,
+    block_ids: Iterable[int] = (),
+) -> DatabaseDiffDict:
+    """'DatabaseDiffDict' of a loading stage."""
+    return {
+        "blocks_added": blocks_added,
+        "blocks_removed": blocks_removed,
+        "blocks_renamed": blocks_renamed,
+        "stocks_added": stocks_added,
+        "stocks_removed": stocks_removed,
+        "stocks_changed": stocks_changed,
+        "memberships_added": memberships_added,
+        "memberships_removed": memberships_removed,
+        "block_ids": sorted(block_ids),
+    }
+
+
+def merge_diffs(diffs: Iterable[DatabaseDiffDict]) -> DatabaseDiffDict:
+    """Sum the changes of the loading stages of one update."""
+    diffs = list(diffs)
+    counts: Dict[str, int] = {
+        key: sum(diff[key] for diff in diffs)  # type: ignore[misc]
+        for key in DatabaseDiffDict.__annotations__
+        if key != "block_ids"
+    }
+    return _diff(
+        **counts,
+        block_ids=set().union(*(diff["block_ids"] for diff in diffs)),
+    )
+
+
+def _changed_blocks(added: np.ndarray, removed: np.ndarray) -> set:
+    """Block ids of the added and removed memberships."""
+    return set((np.concatenate([added, removed]) & _BLOCK_KEY_MASK).tolist())
+
+
+async def record_addition(
+    data: AdditionStream,
+    blocks: set,
+    regions: Dict[str, int],
+) -> AsyncIterator[AdditionBlockDict]:
+    """Stream concept blocks, recording their codes and stock regions.
+
+    The first region met of a stock is kept, as 'listing_diff2database'
+    expects.
+    """
+    async for block in _stream(data):
+        blocks.add(block["code"])
+        for code, region in zip(
+            block["stocks"].tolist(), block["regions"].tolist()
+        ):
+            regions.setdefault(f"{code:06d}", region)
+        yield block
+
+
+async def block_diff2database(
+    async_session: async_sessionmaker[AsyncSession],
+    blocks: List[dict],
+) -> DatabaseDiffDict:
+    """Apply the added, removed and renamed blocks of tdxzs3.cfg.
+
+    Removed blocks are deleted with their memberships, mode entries,
+    signatures and overlaps. Added blocks have no stocks yet, they are
+    reported as changed for the later stages to fill.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    blocks : List[dict]
+        Blocks information from 'get_blocks'.
+
+    Returns
+    -------
+    DatabaseDiffDict
+        Changes of the blocks.
+
+    """
+    # Missing names are read by pandas as NaN and stored as NULL.
+    names: Dict[str, Optional[str]] = {
+        block["code"]: (
+            block["name"] if isinstance(block["name"], str) else None
+        )
+        for block in blocks
+    }
+    async with async_session() as session:
+        await session.execute(delete(SourceFile))
+        result = await session.execute(select(Block.id, Block.code, Block.name))
+        known_blocks = {code: (id, name) for id, code, name in result.all()}
+        added_blocks, removed_blocks, renamed_blocks = _block_changes(
+            names, known_blocks
+        )
+        await _write_entities(
+            session,
+            added_blocks=added_blocks,
+            renamed_blocks=renamed_blocks,
+            added_stocks=[],
+            changed_stocks=[],
+        )
+
+        removed = np.empty(0, dtype=np.int64)
+        if removed_blocks:
+            removed = await _current_pairs(
+                session,
+                stock_block_association.c.block_id.in_(removed_blocks),
+            )
+            await _write_memberships(
+                session, added=removed[:0], removed=removed
+            )
+        await _remove_blocks(session, removed_blocks)
+
+        added_ids: List[int] = []
+        if added_blocks:
+            result = await session.execute(
+                select(Block.id).where(
+                    Block.code.in_([block["code"] for block in added_blocks])
+                )
+            )
+            added_ids = list(result.scalars().all())
+        await session.commit()
+
+    return _diff(
+        blocks_added=len(added_blocks),
+        blocks_removed=len(removed_blocks),
+        blocks_renamed=len(renamed_blocks),
+        memberships_removed=len(removed),
+        block_ids=added_ids,
+    )
+
+
+async def stock_diff2database(
+    async_session: async_sessionmaker[AsyncSession],
+    stocks: StockColumnsDict,
+) -> DatabaseDiffDict:
+    """Apply the stocks of tdxhy.cfg and the memberships it lists.
+
+    New stocks are inserted and listed ones get the region of tdxhy.cfg.
+    The memberships of the blocks listed in tdxhy.cfg are made equal to
+    the file, other blocks are left to the addition and to
+    'listing_diff2database'. Memberships of blocks missing from
+    tdxzs3.cfg are dropped with a RuntimeWarning.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    stocks : StockColumnsDict
+        Stocks information from 'get_stock_columns'
+
+    Returns
+    -------
+    DatabaseDiffDict
+        Changes of the stocks and of the memberships of tdxhy.cfg.
+
+    """
+    regions: Dict[str, int] = dict(
+        zip(stocks["code"].tolist(), stocks["region"].tolist())
+    )
+    pair_blocks: List[str] = stocks["block"].tolist()
+
+    async with async_session() as session:
+        await session.execute(delete(SourceFile))
+        result = await session.execute(
+            select(Stock.id, Stock.code, Stock.region)
+        )
+        known_stocks = {code: (id, region) for id, code, region in result.all()}
+        added_stocks, _, changed_stocks = _stock_changes(regions, known_stocks)
+        await _write_entities(
+            session,
+            added_blocks=[],
+            renamed_blocks=[],
+            added_stocks=added_stocks,
+            changed_stocks=changed_stocks,
+        )
+
+        result = await session.execute(select(Stock.id, Stock.code))
+        stock_ids = pd.Series({code: id for id, code in result.all()})
+        result = await session.execute(select(Block.id, Block.code))
+        block_ids = pd.Series({code: id for id, code in result.all()})
+
+        wanted = _wanted_pairs(
+            stock_ids,
+            block_ids,
+            stocks["code"][stocks["stock"]].tolist(),
+            pair_blocks,
+        )
+        listed = block_ids.reindex(pd.unique(stocks["block"])).dropna()
+        current = await _current_pairs(
+            session,
+            stock_block_association.c.block_id.in_(
+                listed.astype(np.int64).tolist()
+            ),
+        )
+        added = np.setdiff1d(wanted, current, assume_unique=True)
+        removed = np.setdiff1d(current, wanted, assume_unique=True)
+        await _write_memberships(session, added=added, removed=removed)
+        if len(added) or len(removed):
+            await session.execute(_mode_counts())
+        await session.commit()
+
+    return _diff(
+        stocks_added=len(added_stocks),
+        stocks_changed=len(changed_stocks),
+        memberships_added=len(added),
+        memberships_removed=len(removed),
+        block_ids=_changed_blocks(added, removed),
+    )
+
+
+async def addition_diff2database(
+    async_session: async_sessionmaker[AsyncSession],
+    data: AdditionStream,
+    kept_blocks: Iterable[str] = (),
+) -> DatabaseDiffDict:
+    """Apply the memberships of streamed concept blocks block by block.
+
+    Every block costs one read of its stored stocks and the writes of
+    its differences, so the loader keeps up with the parser. New stocks
+    are inserted with the first region met, the regions of known stocks
+    are left to 'listing_diff2database'. Blocks of ``kept_blocks``, also
+    listed in tdxhy.cfg, only get stocks added. Memberships of blocks
+    missing from tdxzs3.cfg are dropped with a RuntimeWarning.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    data : AdditionStream
+        Concept blocks with their stock codes and regions, in a plain or
+        an asynchronous iterable.
+    kept_blocks : Iterable[str]
+        Codes of the blocks whose stored stocks are never removed.
+
+    Returns
+    -------
+    DatabaseDiffDict
+        Changes of the stocks and of the memberships of the addition.
+
+    """
+    kept = set(kept_blocks)
+    unknown: Dict[str, int] = {}
+    n_stocks = n_added = n_removed = 0
+    changed_blocks: set = set()
+
+    async with async_session() as session:
+        await session.execute(delete(SourceFile))
+        result = await session.execute(select(Stock.id, Stock.code))
+        stock_ids: Dict[str, int] = {code: id for id, code in result.all()}
+        result = await session.execute(select(Block.id, Block.code))
+        block_ids: Dict[str, int] = {code: id for id, code in result.all()}
+
+        async for block in _stream(data):
+            codes = [f"{code:06d}" for code in block["stocks"].tolist()]
+            if block["code"] not in block_ids:
+                unknown[block["code"]] = len(codes)
+                continue
+
+            new: Dict[str, int] = {}
+            for code, region in zip(codes, block["regions"].tolist()):
+                if code not in stock_ids:
+                    new.setdefault(code, region)
+            if new:
+                await session.execute(
+                    insert(Stock),
+                    [
+                        {"code": code, "region": region}
+                        for code, region in new.items()
+                    ],
+                )
+                result = await session.execute(
+                    select(Stock.id, Stock.code).where(Stock.code.in_(new))
+                )
+                stock_ids.update({code: id for id, code in result.all()})
+                n_stocks += len(new)
+
+            block_id = block_ids[block["code"]]
+            wanted = np.unique(
+                _pair_keys(
+                    np.array([stock_ids[code] for code in codes], np.int64),
+                    np.full(len(codes), block_id, dtype=np.int64),
+                )
+            )
+            current = await _current_pairs(
+                session,
+                stock_block_association.c.block_id == block_id,
+            )
+            added = np.setdiff1d(wanted, current, assume_unique=True)
+            removed = (
+                current[:0]
+                if block["code"] in kept
+                else np.setdiff1d(current, wanted, assume_unique=True)
+            )
+            await _write_memberships(session, added=added, removed=removed)
+            if len(added) or len(removed):
+                changed_blocks.add(block_id)
+            n_added += len(added)
+            n_removed += len(removed)
+
+        if unknown:
+            warnings.warn(
+                f"Dropped {sum(unknown.values())} memberships of unknown "
+                f"blocks {sorted(unknown)}",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+        if changed_blocks:
+            await session.execute(_mode_counts())
+        await session.commit()
+
+    return _diff(
+        stocks_added=n_stocks,
+        memberships_added=n_added,
+        memberships_removed=n_removed,
+        block_ids=changed_blocks,
+    )
+
+
+async def listing_diff2database(
+    async_session: async_sessionmaker[AsyncSession],
+    blocks: Iterable[str],
+    regions: Dict[str, int],
+) -> DatabaseDiffDict:
+    """Remove what neither tdxhy.cfg nor the addition lists any more.
+
+    Memberships of blocks listed in neither file and stocks listed in
+    neither file are deleted, and listed stocks get their region.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    blocks : Iterable[str]
+        Codes of the blocks listed in tdxhy.cfg or the addition.
+    regions : Dict[str, int]
+        Region of every listed stock, tdxhy.cfg wins over the first
+        region met in the addition.
+
+    Returns
+    -------
+    DatabaseDiffDict
+        Changes of the stocks and of the memberships.
+
+    """
+    listed = set(blocks)
+    async with async_session() as session:
+        await session.execute(delete(SourceFile))
+        result = await session.execute(select(Block.id, Block.code))
+        unlisted = [id for id, code in result.all() if code not in listed]
+        result = await session.execute(
+            select(Stock.id, Stock.code, Stock.region)
+        )
+        known_stocks = {code: (id, region) for id, code, region in result.all()}
+        _, removed_stocks, changed_stocks = _stock_changes(
+            regions, known_stocks
+        )
+
+        removed = np.union1d(
+            await _current_pairs(
+                session,
+                stock_block_association.c.block_id.in_(unlisted),
+            ),
+            await _current_pairs(
+                session,
+                stock_block_association.c.stock_id.in_(removed_stocks),
+            ),
+        )
+        await _write_memberships(session, added=removed[:0], removed=removed)
+        if changed_stocks:
+            await session.execute(update(Stock), changed_stocks)
+        if removed_stocks:
+            await session.execute(
+                delete(Stock).where(Stock.id.in_(removed_stocks))
+            )
+        if len(removed):
+            await session.execute(_mode_counts())
+        await session.commit()
+
+    return _diff(
+        stocks_removed=len(removed_stocks),
+        stocks_changed=len(changed_stocks),
+        memberships_removed=len(removed),
+        block_ids=_changed_blocks(removed[:0], removed),
+    )
+
+
+async def diff2database(
+    async_session: async_sessionmaker[AsyncSession],
+    blocks: List[dict],
+    stocks: StockColumnsDict,
+    addition: AdditionStream,
+) -> DatabaseDiffDict:
+    """Apply the difference between the TDX files and the database.
+
+    Added, removed and renamed blocks, added, removed and moved stocks
+    and added and removed memberships are computed against the current
+    tables by 'block_diff2database', 'stock_diff2database',
+    'addition_diff2database' and 'listing_diff2database', each stage in
+    its own transaction. Kept blocks and stocks keep their ids, the
+    memberships are compared as packed int64 keys. Memberships of blocks
+    missing from tdxzs3.cfg are dropped with a RuntimeWarning. Every
+    stage deletes the manifest of 'SourceFile', an interrupted update is
+    done again in full.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    blocks : List[dict]
+        Blocks information from 'get_blocks'.
+    stocks : StockColumnsDict
+        Stocks information from 'get_stock_columns'
+    addition : AdditionStream
+        Addition information streamed from 'iter_addition'
+
+    Returns
+    -------
+    DatabaseDiffDict
+        Number of changes, and the blocks whose stocks changed.
+
+    """
+    industry = set(stocks["block"].tolist())
+    concept: set = set()
+    # tdxhy.cfg wins the region of a stock listed in both files.
+    regions: Dict[str, int] = {}
+    diffs = [
+        await block_diff2database(async_session=async_session, blocks=blocks),
+        await stock_diff2database(async_session=async_session, stocks=stocks),
+        await addition_diff2database(
+            async_session=async_session,
+            data=record_addition(addition, concept, regions),
+            kept_blocks=industry,
+        ),
+    ]
+    regions.update(zip(stocks["code"].tolist(), stocks["region"].tolist()))
+    diffs.append(
+        await listing_diff2database(
+            async_session=async_session,
+            blocks=industry | concept,
+            regions=regions,
+        )
+    )
+    return merge_diffs(diffs)
+
+
+async def source_files2database(
+    async_session: async_sessionmaker[AsyncSession],
+    files: List[SourceFileDict],
+) -> None:
+    """Record the manifest of the loaded TDX files.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    files : List[SourceFileDict]
+        Size, modification time, sha256 and listing of every file.
+
+    """
+    stmt = insert(SourceFile).values(files)
+    async with async_session() as session:
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[SourceFile.name],
+                set_={
+                    "size": stmt.excluded.size,
+                    "mtime_ns": stmt.excluded.mtime_ns,
+                    "digest": stmt.excluded.digest,
+                    "content": stmt.excluded.content,
+                },
+            )
+        )
+        await session.commit()
+
+
 async def insert_block2mode(
     async_session: async_sessionmaker[AsyncSession],
     value: str,
@@ -188,10 +1056,10 @@ async def insert_block2mode(
 async def update_database(
     async_session: async_sessionmaker[AsyncSession],
     blocks: List[dict],
-    stocks: List[dict],
-    addition: List[dict],
+    stocks: StockColumnsDict,
+    addition: AdditionStream,
     is_clear: bool = True,
-) -> None:
+) -> Optional[DatabaseDiffDict]:
     """Database function used to insert or update extracted data into sqlite database.
 
     Parameters
@@ -200,32 +1068,44 @@ async def update_database(
         Asyncio version of Session.
     blocks : List[dict]
         Blocks information from 'get_blocks'.
-    stocks : List[dict]
-        Stocks information from 'get_stocks'
-    addition : List[dict]
-        Addition information from 'get_addition'
+    stocks : StockColumnsDict
+        Stocks information from 'get_stock_columns'
+    addition : AdditionStream
+        Addition information streamed from 'iter_addition'
     is_clear : bool
-        Whether to clear database before the function is execute.
+        Whether to clear database before the function is execute,
+        otherwise only the differences are applied by 'diff2database'.
 
-    """
-    # TODO: insert and update
-
-    if is_clear:
-        await clear_database(async_session=async_session)
+    Returns
+    -------
+    Optional[DatabaseDiffDict]
+        Changes applied by the incremental update, None after a reload.
 
-        await blocks2database(
-            async_session=async_session,
-            data=blocks,
-        )
-        await stocks2database(
-            async_session=async_session,
-            data=stocks,
-        )
-        await infoharbor2database(
+    """
+    if not is_clear:
+        return await diff2database(
             async_session=async_session,
-            data=addition,
+            blocks=blocks,
+            stocks=stocks,
+            addition=addition,
         )
 
+    await clear_database(async_session=async_session)
+
+    await blocks2database(
+        async_session=async_session,
+        data=blocks,
+    )
+    await stock_columns2database(
+        async_session=async_session,
+        data=stocks,
+    )
+    await addition2database(
+        async_session=async_session,
+        data=addition,
+    )
+    return None
+
 
 async def mode2database(
     async_session: async_sessionmaker[AsyncSession],
@@ -282,6 +1162,56 @@ async def result2database(
         await session.commit()
 
 
+async def block_best2database(
+    async_session: async_sessionmaker[AsyncSession],
+    result: List[BlockBestDict],
+) -> None:
+    async with async_session() as session:
+        await session.execute(delete(BlockBest))
+        await session.commit()
+
+    if not result:
+        return
+
+    async with async_session() as session:
+        await session.execute(insert(BlockBest).values(result))
+        await session.commit()
+
+
+async def equivalents2database(
+    async_session: async_sessionmaker[AsyncSession],
+    equivalents: Dict[str, List[str]],
+) -> None:
+    """Replace the blocks with equal stock sets of the calculation result.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    equivalents : Dict[str, List[str]]
+        Every block code of the result standing for others, mapped to all
+        codes of its group.
+
+    """
+    async with async_session() as session:
+        await session.execute(delete(CalcEquivalent))
+        await session.commit()
+
+    if not equivalents:
+        return
+
+    async with async_session() as session:
+        await session.execute(
+            insert(CalcEquivalent).values(
+                [
+                    {"block": block, "codes": codes}
+                    for block, codes in equivalents.items()
+                ]
+            )
+        )
+        await session.commit()
+
+
 async def insert_block2database(
     async_session: async_sessionmaker[AsyncSession],
     block_id: int,
@@ -325,3 +1255,231 @@ async def insert_block2database(
 
         await session.execute(stmt_asso)
         await session.commit()
+
+
+async def bump_dataset_version(
+    async_session: async_sessionmaker[AsyncSession],
+) -> int:
+    """Increase the dataset version after blocks, stocks or associations change.
+
+    The incremental calculation states, built on the previous version, are
+    dropped.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+
+    Returns
+    -------
+    int
+        The new dataset version.
+
+    """
+    version = await helpers.get_dataset_version(async_session=async_session) + 1
+    async with async_session() as session:
+        stmt = insert(Meta).values(key="dataset_version", value=str(version))
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[Meta.key],
+                set_={"value": stmt.excluded.value},
+            )
+        )
+        # Incremental states only apply to the version they were built on.
+        await session.execute(delete(CalcRankingState))
+        await session.commit()
+
+    return version
+
+
+async def overlaps2database(
+    async_session: async_sessionmaker[AsyncSession],
+    block_ids: Optional[List[int]] = None,
+) -> None:
+    """Compute the pair overlaps of the given or all blocks in SQLite.
+
+    'stock_block_association' is self-joined on the stock id and grouped
+    by block pair, pairs without a common stock have no row.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    block_ids : Optional[List[int]]
+        Blocks whose pairs are recomputed, the whole table is rebuilt
+        when omitted.
+
+    """
+    a = stock_block_association.alias("a")
+    b = stock_block_association.alias("b")
+    condition = a.c.block_id <= b.c.block_id
+    stale = delete(BlockPairOverlap)
+    if block_ids is not None:
+        condition = and_(
+            condition,
+            or_(a.c.block_id.in_(block_ids), b.c.block_id.in_(block_ids)),
+        )
+        stale = stale.where(
+            or_(
+                BlockPairOverlap.block_a.in_(block_ids),
+                BlockPairOverlap.block_b.in_(block_ids),
+            )
+        )
+
+    pairs = (
+        select(a.c.block_id, b.c.block_id, func.count())
+        .select_from(a.join(b, a.c.stock_id == b.c.stock_id))
+        .where(condition)
+        .group_by(a.c.block_id, b.c.block_id)
+    )
+    async with async_session() as session:
+        await session.execute(stale)
+        await session.execute(
+            insert(BlockPairOverlap).from_select(
+                ["block_a", "block_b", "overlap"],
+                pairs,
+            )
+        )
+        await session.commit()
+
+
+async def cache2database(
+    async_session: async_sessionmaker[AsyncSession],
+    key: str,
+    result: CachedResultDict,
+    max_size: int,
+) -> None:
+    """Store a calculation result in the cache and evict least recently used entries.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    key : str
+        Content address from 'helpers.calc_cache_key'.
+    result : CachedResultDict
+        Calculation result to cache.
+    max_size : int
+        Upper bound of the summed size of cached results, in bytes.
+
+    """
+    size = len(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+    async with async_session() as session:
+        stmt = insert(CalcCache).values(
+            key=key,
+            result=result,
+            size=size,
+            accessed_at=datetime.now(),
+        )
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[CalcCache.key],
+                set_={
+                    "result": stmt.excluded.result,
+                    "size": stmt.excluded.size,
+                    "accessed_at": stmt.excluded.accessed_at,
+                },
+            )
+        )
+
+        entries = await session.execute(
+            select(CalcCache.key, CalcCache.size).order_by(
+                CalcCache.accessed_at.desc()
+            )
+        )
+        total = 0
+        evicted: List[str] = []
+        for entry_key, entry_size in entries.all():
+            total += entry_size
+            if total > max_size:
+                evicted.append(entry_key)
+
+        if evicted:
+            await session.execute(
+                delete(CalcCache).where(CalcCache.key.in_(evicted))
+            )
+        await session.commit()
+
+
+async def state2database(
+    async_session: async_sessionmaker[AsyncSession],
+    key: str,
+    state: CalcStateDict,
+    max_count: int,
+) -> None:
+    """Store an incremental calculation state and evict least recently used ones.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    key : str
+        Content address of the parameters the state depends on.
+    state : CalcStateDict
+        Ranking of the calculation.
+    max_count : int
+        Upper bound of the number of stored states.
+
+    """
+    async with async_session() as session:
+        stmt = insert(CalcRankingState).values(
+            key=key,
+            state=state,
+            accessed_at=datetime.now(),
+        )
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[CalcRankingState.key],
+                set_={
+                    "state": stmt.excluded.state,
+                    "accessed_at": stmt.excluded.accessed_at,
+                },
+            )
+        )
+
+        kept = (
+            select(CalcRankingState.key)
+            .order_by(CalcRankingState.accessed_at.desc())
+            .limit(max_count)
+        )
+        await session.execute(
+            delete(CalcRankingState).where(CalcRankingState.key.not_in(kept))
+        )
+        await session.commit()
+
+
+async def signatures2database(
+    async_session: async_sessionmaker[AsyncSession],
+    signatures: Dict[int, bytes],
+    clear: bool = False,
+) -> None:
+    """Upsert the MinHash signatures of blocks.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    signatures : Dict[int, bytes]
+        Packed signature of every block id.
+    clear : bool
+        Delete the signatures of every other block first.
+
+    """
+    async with async_session() as session:
+        if clear:
+            await session.execute(delete(BlockSignature))
+
+        if signatures:
+            stmt = insert(BlockSignature).values(
+                [
+                    {"block_id": block_id, "signature": signature}
+                    for block_id, signature in signatures.items()
+                ]
+            )
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[BlockSignature.block_id],
+                    set_={"signature": stmt.excluded.signature},
+                )
+            )
+        await session.commit()
@@ -1,57 +1,346 @@
+import asyncio
+import csv
+import io
 import os
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import aiofiles
+import numpy as np
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from src.core.database import CalcResult
-from src.utils.types import Response
+from src.core.calc import (
+    BlockIndex,
+    get_stock_labels,
+    iter_ranking,
+    load_block_index,
+)
+from src.core.database import BlockBest, CalcEquivalent, CalcResult, Mode
+from src.utils.types import (
+    CombinationResultDict,
+    RankingFormat,
+    Response,
+    StockFilterDict,
+)
+
+
+# Number of ranking rows written to a Parquet file per row group.
+ROW_GROUP_SIZE: int = 65_536
+
+
+async def write_blk_files(
+    path: str | os.PathLike[str],
+    results: List[CombinationResultDict],
+) -> None:
+    """Write every combination to "ZH{rank}.blk" in ``path``, blocks first."""
+    for index, result in enumerate(results):
+        save_name: str = os.path.join(path, f"ZH{index + 1}.blk")
+
+        async with aiofiles.open(save_name, "w") as f:
+            for block in result["blocks"]:
+                await f.write(f"1{str(block)}" + "\n")
+
+            for stock in result["stocks"]:
+                await f.write(str(stock) + "\n")
+
+
+async def write_equivalents_file(
+    path: str | os.PathLike[str],
+    equivalents: Dict[str, List[str]],
+) -> None:
+    """Write the blocks of a collapsed result standing for others.
+
+    Every row of "equivalents.csv" holds a block of the result and all
+    blocks with the same stocks. Nothing is written without such blocks.
+    """
+    if not equivalents:
+        return
+
+    save_name: str = os.path.join(path, "equivalents.csv")
+    async with aiofiles.open(save_name, "w", newline="", encoding="utf-8") as f:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["block", "equivalents"])
+        for block, codes in sorted(equivalents.items()):
+            writer.writerow([block, " ".join(codes)])
+        await f.write(buffer.getvalue())
 
 
 async def export_combinations(
     path: str | os.PathLike[str],
     async_session: async_sessionmaker[AsyncSession],
 ) -> Response:
-    NAME: List[str] = ["ZH1.blk", "ZH2.blk", "ZH3.blk"]
-
     try:
         async with async_session() as session:
-            result = await session.execute(select(CalcResult))
+            result = await session.execute(
+                select(CalcResult).order_by(CalcResult.id)
+            )
+            equivalents = await session.execute(
+                select(CalcEquivalent.block, CalcEquivalent.codes)
+            )
 
         ret = []
         if result:
             ret = [calc_result for (calc_result,) in result.all()]
 
-        if len(ret) != 3:
+        if not ret:
             return Response(
                 code=500,
                 message="组合计算结果个数错误",
                 data=None,
             )
 
-        for index, calc_result in enumerate(ret):
-            save_name: str = os.path.join(path, NAME[index])
+        await write_blk_files(
+            path=path,
+            results=[
+                {
+                    "blocks": calc_result.blocks,
+                    "stocks": calc_result.stocks,
+                    "count": calc_result.count,
+                }
+                for calc_result in ret
+            ],
+        )
+        await write_equivalents_file(
+            path=path,
+            equivalents=dict(equivalents.all()),
+        )
 
-            blocks: List[str] = calc_result.blocks
-            stocks: List[str] = calc_result.stocks
+        return Response(
+            code=200,
+            message="SUCCESS",
+            data=None,
+        )
 
-            async with aiofiles.open(save_name, "w") as f:
-                for block in blocks:
-                    await f.write(f"1{str(block)}" + "\n")
+    except Exception as e:
+        return Response(
+            code=501,
+            message=f"导出计算结果错误 {e}",
+            data=None,
+        )
+
+
+async def export_block_best(
+    path: str | os.PathLike[str],
+    async_session: async_sessionmaker[AsyncSession],
+) -> Response:
+    """Export the best combination of every block to "block_best.csv".
+
+    Parameters
+    ----------
+    path : str | os.PathLike[str]
+        Directory the file is written to.
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+
+    Returns
+    -------
+    Response
+        data holds the file path and the number of rows written.
+
+    """
+    try:
+        async with async_session() as session:
+            result = await session.execute(
+                select(BlockBest).order_by(BlockBest.id)
+            )
+            rows = [block_best for (block_best,) in result.all()]
+
+        if not rows:
+            return Response(
+                code=500,
+                message="各板块最优组合结果为空，请先计算",
+                data=None,
+            )
 
-                for stock in stocks:
-                    await f.write(str(stock) + "\n")
+        save_name: str = os.path.join(path, "block_best.csv")
+        async with aiofiles.open(
+            save_name, "w", newline="", encoding="utf-8"
+        ) as f:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(["block", "blocks", "count", "stocks"])
+            for row in rows:
+                writer.writerow(
+                    [
+                        row.block,
+                        " ".join(row.blocks),
+                        row.count,
+                        " ".join(row.stocks),
+                    ]
+                )
+            await f.write(buffer.getvalue())
 
         return Response(
             code=200,
             message="SUCCESS",
+            data={"path": save_name, "rows": len(rows)},
+        )
+
+    except Exception as e:
+        return Response(
+            code=501,
+            message=f"导出各板块最优组合错误 {e}",
             data=None,
         )
 
+
+def _iter_rows(
+    index: BlockIndex,
+    k: int,
+    labels: Optional[np.ndarray],
+) -> Iterator[Tuple[List[str], int, Optional[str]]]:
+    for combo, count in iter_ranking(index, k):
+        stocks = None
+        if labels is not None:
+            stocks = " ".join(sorted(labels[index.common_positions(combo)]))
+        yield [index.codes[i] for i in combo], count, stocks
+
+
+def _write_csv(
+    save_name: str,
+    index: BlockIndex,
+    k: int,
+    labels: Optional[np.ndarray],
+) -> int:
+    rows = 0
+    with open(save_name, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        header = [f"block{i + 1}" for i in range(k)] + ["count"]
+        writer.writerow(header + (["stocks"] if labels is not None else []))
+        for blocks, count, stocks in _iter_rows(index, k, labels):
+            writer.writerow(
+                blocks + [count] + ([stocks] if stocks is not None else [])
+            )
+            rows += 1
+
+    return rows
+
+
+def _write_parquet(
+    save_name: str,
+    index: BlockIndex,
+    k: int,
+    labels: Optional[np.ndarray],
+) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = [pa.field(f"block{i + 1}", pa.string()) for i in range(k)]
+    fields.append(pa.field("count", pa.int64()))
+    if labels is not None:
+        fields.append(pa.field("stocks", pa.string()))
+    schema = pa.schema(fields)
+
+    rows = 0
+    with pq.ParquetWriter(save_name, schema) as writer:
+        columns: List[list] = [[] for _ in fields]
+
+        def flush() -> None:
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            for column in columns:
+                column.clear()
+
+        for blocks, count, stocks in _iter_rows(index, k, labels):
+            for column, value in zip(columns, blocks + [count, stocks]):
+                column.append(value)
+            rows += 1
+            if len(columns[0]) >= ROW_GROUP_SIZE:
+                flush()
+
+        if columns[0]:
+            flush()
+
+    return rows
+
+
+async def export_ranking(
+    path: str | os.PathLike[str],
+    async_session: async_sessionmaker[AsyncSession],
+    k: int = 3,
+    fmt: RankingFormat = "csv",
+    with_stocks: bool = False,
+    stock_filter: Optional[StockFilterDict] = None,
+) -> Response:
+    """Export the complete ranking of every k-block combination of the mode list.
+
+    The ranking is streamed to the file, so memory stays bounded whatever
+    the number of combinations.
+
+    Parameters
+    ----------
+    path : str | os.PathLike[str]
+        Directory the ranking file is written to.
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    k : int
+        Number of blocks of a combination.
+    fmt : RankingFormat
+        "csv", or "parquet" which needs the "parquet" extra (pyarrow).
+    with_stocks : bool
+        Add the space separated common stocks of every combination.
+    stock_filter : Optional[StockFilterDict]
+        Stocks left out of every count, like in 'get_combination_count'.
+
+    Returns
+    -------
+    Response
+        data holds the file path and the number of rows written.
+
+    """
+    writers = {"csv": _write_csv, "parquet": _write_parquet}
+    if fmt not in writers:
+        return Response(
+            code=502,
+            message=f"不支持的导出格式 {fmt}",
+            data=None,
+        )
+
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return Response(
+                code=502,
+                message="导出Parquet需要安装pyarrow",
+                data=None,
+            )
+
+    try:
+        async with async_session() as session:
+            result = await session.execute(select(Mode.code))
+            blocks: List[str] = [code for (code,) in result.all()]
+
+        if len(blocks) < k:
+            return Response(
+                code=500,
+                message="模式板块个数错误",
+                data=None,
+            )
+
+        index = await load_block_index(
+            async_session=async_session,
+            blocks=blocks,
+            stock_filter=stock_filter,
+        )
+        labels = None
+        if with_stocks:
+            labels = await get_stock_labels(async_session, index.stock_ids)
+
+        save_name: str = os.path.join(path, f"ranking_k{k}.{fmt}")
+        rows = await asyncio.to_thread(
+            writers[fmt], save_name, index, k, labels
+        )
+
+        return Response(
+            code=200,
+            message="SUCCESS",
+            data={"path": save_name, "rows": rows},
+        )
+
     except Exception as e:
         return Response(
             code=501,
-            message=f"导出计算结果错误 {e}",
+            message=f"导出组合排名错误 {e}",
             data=None,
         )
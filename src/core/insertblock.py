@@ -3,8 +3,13 @@ import os
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from src.core.calc import build_signatures
 from src.core.database.models import Block
-from src.core.database.populate_database import insert_block2database
+from src.core.database.populate_database import (
+    bump_dataset_version,
+    insert_block2database,
+    overlaps2database,
+)
 from src.utils.types import Response
 
 
@@ -46,6 +51,15 @@ async def insert_block(
                     block_id=block_id,
                     data=data,
                 )
+                await bump_dataset_version(async_session=async_session)
+                await build_signatures(
+                    async_session=async_session,
+                    block_ids=[block_id],
+                )
+                await overlaps2database(
+                    async_session=async_session,
+                    block_ids=[block_id],
+                )
 
                 return Response(
                     code=200,
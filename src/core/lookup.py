@@ -0,0 +1,119 @@
+from typing import List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.calc import (
+    StockLookup,
+    load_block_index,
+    load_lookup,
+    save_lookup,
+)
+from src.core.database import CalcResult, Mode, Stock, helpers
+from src.utils.types import Response, StockLookupDict
+
+
+async def lookup_stock(
+    async_session: async_sessionmaker[AsyncSession],
+    code: str,
+    top_n: int = 3,
+    k: int = 3,
+) -> Response:
+    """List the mode blocks and block combinations containing a stock.
+
+    The answer comes from the stock to block bitmask index built by the
+    last calculation, which is rebuilt here when the mode list or the
+    data changed since.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    code : str
+        Stock code, with or without its region prefix.
+    top_n : int
+        Number of ranked combinations containing the stock.
+    k : int
+        Number of blocks of a combination.
+
+    Returns
+    -------
+    Response
+        data is a StockLookupDict: the mode blocks containing the stock,
+        the 1-based ranks of the current calculation results containing
+        it and its own top combinations.
+
+    """
+    try:
+        async with async_session() as session:
+            stock_id = await session.scalar(
+                select(Stock.id).where(Stock.code == code)
+            )
+            if stock_id is None and len(code) > 1 and code[0].isdigit():
+                stock_id = await session.scalar(
+                    select(Stock.id).where(
+                        Stock.code == code[1:],
+                        Stock.region == int(code[0]),
+                    )
+                )
+            if stock_id is None:
+                return Response(
+                    code=701,
+                    message=f"股票 {code} 不存在",
+                    data=None,
+                )
+
+            result = await session.execute(select(Mode.code))
+            blocks: List[str] = [block for (block,) in result.all()]
+
+            result = await session.execute(
+                select(CalcResult.blocks).order_by(CalcResult.id)
+            )
+            results: List[List[str]] = [row for (row,) in result.all()]
+
+        version = await helpers.get_dataset_version(
+            async_session=async_session,
+        )
+        lookup = load_lookup(version=version, codes=blocks)
+        if lookup is None:
+            lookup = StockLookup(
+                index=await load_block_index(
+                    async_session=async_session,
+                    blocks=blocks,
+                ),
+                version=version,
+            )
+            save_lookup(lookup)
+
+        codes = lookup.index.codes
+        position = {block: i for i, block in enumerate(codes)}
+        data: StockLookupDict = {
+            "code": code,
+            "blocks": [codes[i] for i in lookup.blocks(stock_id)],
+            "results": [
+                rank + 1
+                for rank, combo in enumerate(results)
+                if all(block in position for block in combo)
+                and lookup.contains(
+                    stock_id,
+                    [position[block] for block in combo],
+                )
+            ],
+            "ranking": [
+                {"blocks": [codes[i] for i in combo], "count": count}
+                for combo, count in lookup.ranking(stock_id, top_n, k)
+            ],
+        }
+
+        return Response(
+            code=200,
+            message="SUCCESS",
+            data=data,
+        )
+
+    except Exception as e:
+        return Response(
+            code=700,
+            message=f"查询股票所属板块错误 {e}",
+            data=None,
+        )
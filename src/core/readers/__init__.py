@@ -1,14 +1,16 @@
 from . import helpers
-from .addition import get_addition
+from .addition import get_addition, iter_addition
 from .blocks import get_blocks
 from .modes import get_modes
-from .stocks import get_stocks
+from .stocks import get_stock_columns, get_stocks
 
 
 __all__: list[str] = [
     "get_blocks",
     "get_stocks",
+    "get_stock_columns",
     "get_addition",
+    "iter_addition",
     "get_modes",
     "helpers",
 ]
@@ -1,6 +1,18 @@
+import mmap
 import os
 import re
-from typing import Dict, List, Pattern
+from typing import Dict, Iterator, List, Pattern, Tuple
+
+import numpy as np
+
+from src.utils.types import AdditionBlockDict
+
+
+# Digits of a stock code, which follows the "#" after its region.
+CODE_DIGITS: int = 6
+
+_PLACES = 10 ** np.arange(CODE_DIGITS - 1, -1, -1, dtype=np.int32)
+_ZERO, _HASH = ord("0"), ord("#")
 
 
 def get_addition(path: str | os.PathLike[str]) -> List[dict]:
@@ -78,3 +90,79 @@ def get_addition(path: str | os.PathLike[str]) -> List[dict]:
             )
 
     return addition
+
+
+def _parse_stocks(data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Parse the "{region}#{code}" entries of the stock lines of one block."""
+    digits = data.astype(np.int32) - _ZERO
+    is_digit = (digits >= 0) & (digits <= 9)
+
+    hashes = np.flatnonzero(data == _HASH)
+    hashes = hashes[(hashes > 0) & (hashes + CODE_DIGITS < len(data))]
+    window = hashes[:, None] + np.arange(1, CODE_DIGITS + 1)
+    # The region is the one or two digits before the "#".
+    valid = is_digit[window].all(axis=1) & is_digit[hashes - 1]
+    hashes, window = hashes[valid], window[valid]
+
+    stocks = (digits[window] * _PLACES).sum(axis=1, dtype=np.int32)
+    regions = digits[hashes - 1]
+    tens = hashes - 2
+    two_digits = (tens >= 0) & is_digit[np.maximum(tens, 0)]
+    regions = regions + 10 * np.where(two_digits, digits[tens], 0)
+    return stocks, regions.astype(np.uint8)
+
+
+def iter_addition(path: str | os.PathLike[str]) -> Iterator[AdditionBlockDict]:
+    """Stream the concept blocks of INFOHARBOR_PATH from a memory map.
+
+    Only the header line of every block is decoded, the stock lines are
+    parsed as bytes with numpy, so memory stays bounded by one block
+    whatever the size of the file. Stock codes are the six digit A-share
+    codes and are yielded as numbers.
+
+    Parameters
+    ----------
+    path : str | os.PathLike[str]
+         Path of TDX addition file, which is always fixed as "infoharbor_block.dat".
+
+    Yields
+    ------
+    AdditionBlockDict
+        Code, name, stock codes and regions of a block with stocks.
+
+    """
+    block_start_pattern: Pattern[str] = re.compile(r"#[a-zA-Z]+_([^,]+)")
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            # Every block starts with a "#" header at the start of a line.
+            start = 0 if mm[:1] == b"#" else mm.find(b"\n#") + 1
+            while 0 < start < size or (start == 0 and mm[:1] == b"#"):
+                header_end = mm.find(b"\n", start)
+                header_end = size if header_end == -1 else header_end
+                end = mm.find(b"\n#", header_end)
+                end = size if end == -1 else end + 1
+
+                header = mm[start:header_end].decode("gbk").strip()
+                match = block_start_pattern.match(header)
+                parts = header.split(",")
+                code = parts[2].strip() if len(parts) > 2 else ""
+
+                if match and code:
+                    stocks, regions = _parse_stocks(
+                        np.frombuffer(mm[header_end:end], dtype=np.uint8)
+                    )
+                    name = match.group(1).strip()
+                    if name and len(stocks):
+                        yield {
+                            "code": code,
+                            "name": name,
+                            "stocks": stocks,
+                            "regions": regions,
+                        }
+
+                start = end if end < size else -1
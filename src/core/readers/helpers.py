@@ -1,10 +1,14 @@
-from typing import Dict, List
+import hashlib
+import os
+from typing import Dict, List, Optional
 
 import pandas as pd
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import aliased
 
-from src.core.database.models import Mode
+from src.core.database.models import Block, BlockPairOverlap, Mode
+from src.utils.types import SourceFileDict
 
 
 def get_re_code_relationship(blocks: pd.DataFrame) -> Dict[str, str] | dict:
@@ -12,6 +16,56 @@ def get_re_code_relationship(blocks: pd.DataFrame) -> Dict[str, str] | dict:
     return mappings
 
 
+def get_source_file(
+    path: str | os.PathLike[str],
+    name: str,
+    known: Optional[SourceFileDict] = None,
+) -> SourceFileDict:
+    """Size, modification time and sha256 of a TDX file.
+
+    The file is only hashed when its size or modification time differs
+    from the ``known`` entry, whose digest is reused otherwise. The
+    listing of the ``known`` entry is kept while the digest is the same.
+
+    Parameters
+    ----------
+    path : str | os.PathLike[str]
+        Path of the file.
+    name : str
+        Name of the file in the manifest.
+    known : Optional[SourceFileDict]
+        Manifest entry recorded at the last update.
+
+    Returns
+    -------
+    SourceFileDict
+        Manifest entry of the file.
+
+    """
+    stat = os.stat(path)
+    if (
+        known is not None
+        and known["size"] == stat.st_size
+        and known["mtime_ns"] == stat.st_mtime_ns
+    ):
+        digest = known["digest"]
+    else:
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+
+    return {
+        "name": name,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "digest": digest,
+        "content": (
+            known["content"]
+            if known is not None and known["digest"] == digest
+            else None
+        ),
+    }
+
+
 async def get_mode_data(
     async_session: async_sessionmaker[AsyncSession],
 ) -> List[Dict[str, str | int]]:
@@ -31,3 +85,74 @@ async def get_mode_data(
         )
 
     return data
+
+
+async def get_related_blocks(
+    async_session: async_sessionmaker[AsyncSession],
+    code: str,
+    top_n: int = 10,
+) -> List[Dict[str, str | int | float]]:
+    """Return the blocks sharing the most stocks with a block.
+
+    The overlaps are read from 'BlockPairOverlap', whose diagonal holds
+    the block sizes the Jaccard similarity is computed from.
+
+    Parameters
+    ----------
+    async_session : async_sessionmaker[AsyncSession]
+        Asyncio version of Session.
+    code : str
+        Block code.
+    top_n : int
+        Number of related blocks to return.
+
+    Returns
+    -------
+    List[Dict[str, str | int | float]]
+        Code, name, overlap and jaccard of the related blocks, by
+        overlap descending.
+
+    """
+    async with async_session() as session:
+        block_id = await session.scalar(
+            select(Block.id).where(Block.code == code)
+        )
+        pairs = select(BlockPairOverlap).where(
+            (BlockPairOverlap.block_a == block_id)
+            | (BlockPairOverlap.block_b == block_id)
+        )
+        result = await session.execute(pairs)
+        overlaps: Dict[int, int] = {}
+        for (pair,) in result.all():
+            other = pair.block_b if pair.block_a == block_id else pair.block_a
+            overlaps[other] = pair.overlap
+
+        size = overlaps.pop(block_id, 0)
+        related = sorted(overlaps, key=lambda id: (-overlaps[id], id))[:top_n]
+        sizes = aliased(BlockPairOverlap)
+        result = await session.execute(
+            select(Block.id, Block.code, Block.name, sizes.overlap)
+            .join(
+                sizes,
+                (sizes.block_a == Block.id) & (sizes.block_b == Block.id),
+            )
+            .where(Block.id.in_(related))
+        )
+        blocks = {
+            id: (code, name, count) for id, code, name, count in result.all()
+        }
+
+    data: List[Dict[str, str | int | float]] = []
+    for id in related:
+        other_code, name, other_size = blocks[id]
+        overlap = overlaps[id]
+        data.append(
+            {
+                "code": other_code,
+                "name": name,
+                "overlap": overlap,
+                "jaccard": overlap / (size + other_size - overlap),
+            }
+        )
+
+    return data
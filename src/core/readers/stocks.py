@@ -1,8 +1,25 @@
 import os
 from typing import Dict, List
 
+import numpy as np
 import pandas as pd
 
+from src.utils.types import StockColumnsDict
+
+
+BLOCK_COLUMNS: List[str] = ["code1", "code2", "code3", "code4"]
+
+
+def _read_tdxhy(path: str | os.PathLike[str]) -> pd.DataFrame:
+    df = pd.read_csv(
+        path,
+        sep="|",
+        header=None,
+        names=["region", "code", *BLOCK_COLUMNS],
+        dtype={"code": str},
+    )
+    return df.dropna(subset=BLOCK_COLUMNS, how="all")
+
 
 def get_stocks(
     path: str | os.PathLike[str], mappings: Dict[str, str]
@@ -22,21 +39,11 @@ def get_stocks(
         A dict contains information in TDXHY_PATH.
 
     """
-    df = pd.read_csv(
-        path,
-        sep="|",
-        header=None,
-        names=["region", "code", "code1", "code2", "code3", "code4"],
-        dtype={"code": str},
-    )
-    df = df.dropna(
-        subset=["code1", "code2", "code3", "code4"],
-        how="all",
-    )
+    df = _read_tdxhy(path)
 
     df["blocks"] = [
         [item for item in row if pd.notna(item)]
-        for row in df[["code1", "code2", "code3", "code4"]].values
+        for row in df[BLOCK_COLUMNS].values
     ]
     stocks: pd.DataFrame = df[["code", "region", "blocks"]].copy()
 
@@ -44,3 +51,48 @@ def get_stocks(
         lambda lst: [mappings[code] for code in lst if code in mappings]
     )
     return stocks.to_dict("records")
+
+
+def get_stock_columns(
+    path: str | os.PathLike[str],
+    mappings: Dict[str, str],
+) -> StockColumnsDict:
+    """Columnar version of 'get_stocks' for bulk loading.
+
+    The four block columns are melted into one long stock to re_code
+    frame, mapped to block codes with a vectorized lookup, so no Python
+    object is built per stock.
+
+    Parameters
+    ----------
+    path : str | os.PathLike[str]
+         Path of TDX stock file, which is always fixed as tdxhy.cfg.
+    mappings : Dict[str, str]
+         Dict retried from 'get_blocks' fuction.
+
+    Returns
+    -------
+    StockColumnsDict
+        Stock codes and regions, and the (stock position, block code)
+        association pairs in file order.
+
+    """
+    df = _read_tdxhy(path).reset_index(drop=True)
+
+    pairs = df[BLOCK_COLUMNS].melt(ignore_index=False, value_name="re_code")
+    pairs["block"] = pairs["re_code"].map(mappings)
+    pairs = (
+        pairs.dropna(subset=["block"])
+        .rename_axis("stock")
+        .reset_index()
+        # melt stacks the columns, restore the order of every row.
+        .sort_values("stock", kind="stable")
+        .drop_duplicates(subset=["stock", "block"])
+    )
+
+    return {
+        "code": df["code"].to_numpy(dtype=object),
+        "region": df["region"].to_numpy(dtype=np.int64),
+        "stock": pairs["stock"].to_numpy(dtype=np.int64),
+        "block": pairs["block"].to_numpy(dtype=object),
+    }
@@ -1,11 +1,339 @@
-import concurrent.futures
+import asyncio
+import contextlib
 import os
+import threading
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    cast,
+)
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from src.core.database import update_database
-from src.core.readers import get_addition, get_blocks, get_stocks
-from src.utils.types import Response
+from src.core.calc import build_signatures
+from src.core.database import (
+    bump_dataset_version,
+    overlaps2database,
+    source_files2database,
+)
+from src.core.database.helpers import get_source_files
+from src.core.database.populate_database import (
+    addition2database,
+    addition_diff2database,
+    block_diff2database,
+    blocks2database,
+    clear_database,
+    listing_diff2database,
+    merge_diffs,
+    record_addition,
+    stock_columns2database,
+    stock_diff2database,
+)
+from src.core.readers import get_blocks, get_stock_columns, iter_addition
+from src.core.readers.helpers import get_source_file
+from src.utils.types import (
+    AdditionBlockDict,
+    DatabaseDiffDict,
+    Response,
+    SourceFileDict,
+    SourceListingDict,
+    StockColumnsDict,
+    UpdateResultDict,
+)
+
+
+# Number of parsed concept blocks waiting to be loaded, the parser waits
+# when the loader falls behind.
+ADDITION_QUEUE_SIZE: int = 64
+
+# Seconds between two drains of the queue while a parser is stopping.
+PARSER_POLL_INTERVAL: float = 0.05
+
+T = TypeVar("T")
+
+_END = object()
+
+
+@contextlib.contextmanager
+def _stage(timings: Dict[str, float], name: str) -> Iterator[None]:
+    """Record the wall time of a stage in ``timings``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - start, 3)
+
+
+def _run_stage(
+    timings: Dict[str, float],
+    name: str,
+    func: Callable[..., T],
+    **kwargs: Any,
+) -> T:
+    """Run a parsing stage in its thread, see '_stage'."""
+    with _stage(timings, name):
+        return func(**kwargs)
+
+
+def _produce(
+    records: Iterator[AdditionBlockDict],
+    queue: asyncio.Queue,
+    loop: asyncio.AbstractEventLoop,
+    stop: threading.Event,
+) -> None:
+    """Feed the records of a parser thread into a bounded queue.
+
+    Every put waits for a free slot, an error of the parser is put
+    instead of the end marker, and the parser gives up once ``stop`` is
+    set by the loader.
+    """
+
+    def put(item: object) -> None:
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    try:
+        for record in records:
+            if stop.is_set():
+                return
+            put(record)
+    except Exception as e:
+        put(e)
+    else:
+        put(_END)
+
+
+async def _consume(queue: asyncio.Queue) -> AsyncIterator[AdditionBlockDict]:
+    """Yield the records put by '_produce' until the end, at least one."""
+    empty = True
+    while (item := await queue.get()) is not _END:
+        if isinstance(item, Exception):
+            raise item
+        empty = False
+        yield item
+    if empty:
+        raise RuntimeError("Dataframe empty")
+
+
+async def _wait_stocks(
+    task: "asyncio.Task[StockColumnsDict]",
+) -> StockColumnsDict:
+    """Wait for the parsing stage of tdxhy.cfg and check its result."""
+    stocks = await task
+    if not len(stocks["code"]):
+        raise RuntimeError("Dataframe empty")
+    return stocks
+
+
+async def _stop_parsers(
+    tasks: List["asyncio.Task[Any]"],
+    queue: asyncio.Queue,
+    stop: threading.Event,
+) -> None:
+    """Wait for the parser threads, releasing a producer on a full queue.
+
+    Errors of parsers whose result was not needed any more are retrieved
+    here, threads can not be cancelled so they are always awaited.
+    """
+    stop.set()
+    pending = {task for task in tasks if not task.done()}
+    while pending:
+        while not queue.empty():
+            queue.get_nowait()
+        _, pending = await asyncio.wait(pending, timeout=PARSER_POLL_INTERVAL)
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _check_manifest(
+    async_session: async_sessionmaker[AsyncSession],
+    paths: Dict[str, str],
+) -> Tuple[List[SourceFileDict], Set[str]]:
+    """Return the manifest of the TDX files and the names of changed ones."""
+    known = await get_source_files(async_session=async_session)
+    files = [
+        get_source_file(path=path, name=name, known=known.get(name))
+        for name, path in paths.items()
+    ]
+    changed = {
+        file["name"]
+        for file in files
+        if file["name"] not in known
+        or known[file["name"]]["digest"] != file["digest"]
+    }
+    return files, changed
+
+
+def _stock_listing(stocks: StockColumnsDict) -> SourceListingDict:
+    """Blocks and stock regions listed in tdxhy.cfg, for the manifest."""
+    return {
+        "blocks": sorted(set(stocks["block"].tolist())),
+        "stocks": dict(zip(stocks["code"].tolist(), stocks["region"].tolist())),
+    }
+
+
+async def _reload(
+    async_session: async_sessionmaker[AsyncSession],
+    timings: Dict[str, float],
+    blocks: List[dict],
+    stocks_task: "asyncio.Task[StockColumnsDict]",
+    addition: AsyncIterator[AdditionBlockDict],
+    stock_file: SourceFileDict,
+    addition_file: SourceFileDict,
+) -> None:
+    """Clear and reload everything, the blocks while tdxhy.cfg is parsed."""
+    with _stage(timings, "load_blocks"):
+        await clear_database(async_session=async_session)
+        await blocks2database(
+            async_session=async_session,
+            data=blocks,
+        )
+    stocks = await _wait_stocks(stocks_task)
+    with _stage(timings, "load_stocks"):
+        await stock_columns2database(
+            async_session=async_session,
+            data=stocks,
+        )
+    stock_file["content"] = _stock_listing(stocks)
+    concept: Set[str] = set()
+    regions: Dict[str, int] = {}
+    with _stage(timings, "load_addition"):
+        await addition2database(
+            async_session=async_session,
+            data=record_addition(addition, concept, regions),
+        )
+    addition_file["content"] = {"blocks": sorted(concept), "stocks": regions}
+
+
+async def _diff(
+    async_session: async_sessionmaker[AsyncSession],
+    timings: Dict[str, float],
+    blocks: Optional[List[dict]],
+    stocks_task: Optional["asyncio.Task[StockColumnsDict]"],
+    addition: Optional[AsyncIterator[AdditionBlockDict]],
+    stock_file: SourceFileDict,
+    addition_file: SourceFileDict,
+) -> DatabaseDiffDict:
+    """Apply the differences of the parsed files, as 'diff2database'."""
+    diffs: List[DatabaseDiffDict] = []
+    if blocks is not None:
+        with _stage(timings, "load_blocks"):
+            diffs.append(
+                await block_diff2database(
+                    async_session=async_session,
+                    blocks=blocks,
+                )
+            )
+    if stocks_task is not None:
+        stocks = await _wait_stocks(stocks_task)
+        with _stage(timings, "load_stocks"):
+            diffs.append(
+                await stock_diff2database(
+                    async_session=async_session,
+                    stocks=stocks,
+                )
+            )
+        stock_file["content"] = _stock_listing(stocks)
+    industry = cast(SourceListingDict, stock_file["content"])
+    if addition is not None:
+        concept: Set[str] = set()
+        regions: Dict[str, int] = {}
+        with _stage(timings, "load_addition"):
+            diffs.append(
+                await addition_diff2database(
+                    async_session=async_session,
+                    data=record_addition(addition, concept, regions),
+                    kept_blocks=industry["blocks"],
+                )
+            )
+        addition_file["content"] = {
+            "blocks": sorted(concept),
+            "stocks": regions,
+        }
+    listing = cast(SourceListingDict, addition_file["content"])
+    with _stage(timings, "load_listing"):
+        diffs.append(
+            await listing_diff2database(
+                async_session=async_session,
+                blocks=set(industry["blocks"]) | set(listing["blocks"]),
+                # tdxhy.cfg wins the region of a stock listed in both.
+                regions={**listing["stocks"], **industry["stocks"]},
+            )
+        )
+    return merge_diffs(diffs)
+
+
+async def _load(
+    async_session: async_sessionmaker[AsyncSession],
+    timings: Dict[str, float],
+    blocks: Optional[List[dict]],
+    stocks_task: Optional["asyncio.Task[StockColumnsDict]"],
+    addition: Optional[AsyncIterator[AdditionBlockDict]],
+    stock_file: SourceFileDict,
+    addition_file: SourceFileDict,
+    is_clear: bool,
+) -> Optional[DatabaseDiffDict]:
+    """Write the parsed files and record their listings, see 'update_data'.
+
+    ``blocks`` is given when everything is loaded, ``stocks_task`` and
+    ``addition`` when their file is parsed. A file that is not parsed
+    stands by the listing of its manifest entry.
+    """
+    if is_clear and blocks is not None:
+        await _reload(
+            async_session,
+            timings,
+            blocks,
+            cast("asyncio.Task[StockColumnsDict]", stocks_task),
+            cast(AsyncIterator[AdditionBlockDict], addition),
+            stock_file,
+            addition_file,
+        )
+        return None
+
+    return await _diff(
+        async_session,
+        timings,
+        blocks,
+        stocks_task,
+        addition,
+        stock_file,
+        addition_file,
+    )
+
+
+async def _refresh_derived(
+    async_session: async_sessionmaker[AsyncSession],
+    timings: Dict[str, float],
+    diff: Optional[DatabaseDiffDict],
+) -> None:
+    """Bump the dataset version and rebuild signatures and overlaps."""
+    block_ids = None if diff is None else diff["block_ids"]
+    # An unchanged dataset keeps its version, and so its caches.
+    if diff is None or any(
+        value for key, value in diff.items() if key != "block_ids"
+    ):
+        await bump_dataset_version(async_session=async_session)
+    if block_ids is not None and not block_ids:
+        return
+
+    with _stage(timings, "signatures"):
+        await build_signatures(
+            async_session=async_session,
+            block_ids=block_ids,
+        )
+    with _stage(timings, "overlaps"):
+        await overlaps2database(
+            async_session=async_session,
+            block_ids=block_ids,
+        )
 
 
 async def update_data(
@@ -18,6 +346,23 @@ async def update_data(
 ) -> Response:
     """action function for updating TDX data from cache.
 
+    The size, modification time and sha256 of the three files are kept
+    in 'SourceFile', with the blocks and stocks listed by tdxhy.cfg and
+    infoharbor_block.dat. When none of them changed since the last
+    update the database is left untouched. When tdxzs3.cfg changed all
+    files are parsed and the differences are applied, or everything is
+    reloaded when ``is_clear`` is set. Otherwise only the changed files
+    are parsed and only the stocks and memberships they list are
+    refreshed, against the listing of the unchanged file. tdxzs3.cfg is
+    then parsed only for the re codes of a changed tdxhy.cfg.
+
+    The files are parsed in threads while the database is loaded, in
+    both ways: the blocks are written as soon as tdxzs3.cfg is parsed,
+    while tdxhy.cfg and infoharbor_block.dat are parsed, then the stocks
+    of tdxhy.cfg, and only then the concept blocks are taken from a
+    queue of ADDITION_QUEUE_SIZE blocks, each written as it arrives. The
+    data is an 'UpdateResultDict'.
+
     Parameters
     ----------
     async_session : async_sessionmaker[AsyncSession]
@@ -32,7 +377,9 @@ async def update_data(
         Path of TDX addition file, which is always fixed as infoharbor_block.dat.
         Exactly, the file contains concept block informations mainly.
     is_clear : bool
-        Whether to clear database before excute the action.
+        Whether to clear database and reload everything when tdxzs3.cfg
+        changed, otherwise only the differences are applied and the ids
+        are kept.
 
     Returns
     -------
@@ -44,38 +391,113 @@ async def update_data(
     TDXHY_PATH: str = os.path.join(TDX_CACHE_DIR, STOCK_PATH)
     INFOHARBOR_PATH: str = os.path.join(TDX_CACHE_DIR, ADDITIONAL_PATH)
 
-    try:
-        blocks, mappings = get_blocks(path=TDXZS_PATH)
+    timings: Dict[str, float] = {}
+    queue: asyncio.Queue = asyncio.Queue(maxsize=ADDITION_QUEUE_SIZE)
+    stop = threading.Event()
+    tasks: List["asyncio.Task[Any]"] = []
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-            future_stocks = executor.submit(
-                get_stocks,
-                TDXHY_PATH,
-                mappings,
+    try:
+        with _stage(timings, "manifest"):
+            files, changed = await _check_manifest(
+                async_session=async_session,
+                paths={
+                    str(BLOCK_PATH): TDXZS_PATH,
+                    str(STOCK_PATH): TDXHY_PATH,
+                    str(ADDITIONAL_PATH): INFOHARBOR_PATH,
+                },
+            )
+        if not changed:
+            # Touched files keep their content, only their times move.
+            await source_files2database(
+                async_session=async_session,
+                files=files,
             )
-            future_addition = executor.submit(
-                get_addition,
-                INFOHARBOR_PATH,
+            return Response(
+                code=200,
+                message="数据未发生变化",
+                data=UpdateResultDict(diff=None, timings=timings),
+            )
+
+        entries = {file["name"]: file for file in files}
+        stock_file = entries[str(STOCK_PATH)]
+        addition_file = entries[str(ADDITIONAL_PATH)]
+        # tdxhy.cfg names its blocks by the re codes of tdxzs3.cfg, and a
+        # file is diffed alone against the listing of the other one.
+        full = str(BLOCK_PATH) in changed or any(
+            file["content"] is None
+            for file in (stock_file, addition_file)
+            if file["name"] not in changed
+        )
+
+        addition: Optional[AsyncIterator[AdditionBlockDict]] = None
+        if full or addition_file["name"] in changed:
+            tasks.append(
+                asyncio.create_task(
+                    asyncio.to_thread(
+                        _run_stage,
+                        timings,
+                        "parse_addition",
+                        _produce,
+                        records=iter_addition(path=INFOHARBOR_PATH),
+                        queue=queue,
+                        loop=asyncio.get_running_loop(),
+                        stop=stop,
+                    )
+                )
             )
+            addition = _consume(queue)
 
-            stocks = future_stocks.result()
-            addition = future_addition.result()
+        blocks: Optional[List[dict]] = None
+        stocks_task: Optional["asyncio.Task[StockColumnsDict]"] = None
+        if full or stock_file["name"] in changed:
+            parsed, mappings = await asyncio.to_thread(
+                _run_stage,
+                timings,
+                "parse_blocks",
+                get_blocks,
+                path=TDXZS_PATH,
+            )
+            if not parsed:
+                raise RuntimeError("Dataframe empty")
+            if full:
+                blocks = parsed
 
-        if not blocks or not stocks or not addition:
-            raise RuntimeError("Dataframe empty")
+            stocks_task = asyncio.create_task(
+                asyncio.to_thread(
+                    _run_stage,
+                    timings,
+                    "parse_stocks",
+                    get_stock_columns,
+                    path=TDXHY_PATH,
+                    mappings=mappings,
+                )
+            )
+            tasks.append(stocks_task)
 
-        await update_database(
+        diff = await _load(
             async_session=async_session,
+            timings=timings,
             blocks=blocks,
-            stocks=stocks,
+            stocks_task=stocks_task,
             addition=addition,
+            stock_file=stock_file,
+            addition_file=addition_file,
             is_clear=is_clear,
         )
+        await _refresh_derived(
+            async_session=async_session,
+            timings=timings,
+            diff=diff,
+        )
+        await source_files2database(
+            async_session=async_session,
+            files=files,
+        )
 
         return Response(
             code=200,
             message="Success",
-            data=None,
+            data=UpdateResultDict(diff=diff, timings=timings),
         )
 
     except Exception as e:
@@ -84,3 +506,6 @@ async def update_data(
             message=f"更新数据中出现问题: {e}",
             data=None,
         )
+
+    finally:
+        await _stop_parsers(tasks, queue, stop)
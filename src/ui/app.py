@@ -31,7 +31,7 @@ class App(ft.Container):
             cfg=cfg,
         )
         self.mode = ModeView(async_session=async_session)
-        self.calc = CalcView(async_session=async_session)
+        self.calc = CalcView(async_session=async_session, cfg=cfg)
         self.content = ft.Column(
             controls=[
                 ft.Row(
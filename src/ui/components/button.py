@@ -1,3 +1,4 @@
+import asyncio
 import os
 from typing import List, Optional, cast
 
@@ -6,16 +7,33 @@ from omegaconf import DictConfig, OmegaConf
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from src.core import (
+    batch_combination_count,
+    export_block_best,
     export_combinations,
+    export_ranking,
     get_combination_count,
     import_mode_list,
     insert_mode_item,
     update_data,
 )
+from src.core.calc import CalcProgress
 from src.core.insertblock import insert_block
-from src.core.readers import get_modes
+from src.core.readers import get_modes, helpers
 from src.utils import CONFIG_PATH
-from src.utils.types import Response
+from src.utils.types import CalcProgressDict, Response, StockFilterDict
+
+
+def get_stock_filter(cfg: DictConfig) -> StockFilterDict:
+    """Read the stock filter rules of the calculation from the config."""
+    return {
+        "regions": [
+            int(region) for region in cfg.get("STOCK_EXCLUDE_REGIONS") or []
+        ],
+        "prefixes": [
+            str(prefix) for prefix in cfg.get("STOCK_EXCLUDE_PREFIXES") or []
+        ],
+        "codes": [str(code) for code in cfg.get("STOCK_EXCLUDE_CODES") or []],
+    }
 
 
 @ft.control
@@ -149,7 +167,7 @@ class UpdateDataButton(ft.FilledButton):
             BLOCK_PATH=self.cfg["BLOCK_PATH"],
             STOCK_PATH=self.cfg["STOCK_PATH"],
             ADDITIONAL_PATH=self.cfg["ADDITIONAL_PATH"],
-            is_clear=True,
+            is_clear=bool(self.cfg.get("UPDATE_CLEAR", False)),
         )
         if response["code"] != 200:
             self.alertDialog.content = ft.Text(
@@ -209,12 +227,15 @@ class CalcButton(ft.FilledButton):
     def __init__(
         self,
         async_session: async_sessionmaker[AsyncSession],
+        cfg: DictConfig,
     ):
         super().__init__(
             content="计算",
             icon=ft.Icons.CALCULATE_ROUNDED,
         )
+        self.cfg = cfg
         self.async_session = async_session
+        self.progress: Optional[CalcProgress] = None
         self.on_click = self.button_clicked
         self.calcAlertDialog = ft.AlertDialog(
             modal=True,
@@ -227,16 +248,60 @@ class CalcButton(ft.FilledButton):
             ],
         )
 
+    def cancel(self) -> None:
+        if self.progress is not None:
+            self.progress.cancel()
+
     async def button_clicked(self, __e__: ft.Event[ft.Button]) -> None:
-        ft.context.page.pubsub.send_all_on_topic(
+        if self.progress is not None:
+            return
+
+        page = ft.context.page
+        loop = asyncio.get_running_loop()
+
+        def publish(report: CalcProgressDict) -> None:
+            # Called from the calculation thread.
+            loop.call_soon_threadsafe(
+                lambda: page.pubsub.send_all_on_topic(
+                    topic="calc",
+                    message=report,
+                )
+            )
+
+        self.progress = CalcProgress(callback=publish)
+        page.pubsub.send_all_on_topic(
             topic="calc",
             message="start",
         )
-        response = await get_combination_count(
-            async_session=self.async_session,
-            top_n=3,
-        )
-        if response["code"] != 200:
+        try:
+            response = await get_combination_count(
+                async_session=self.async_session,
+                top_n=3,
+                engine=self.cfg.get("CALC_ENGINE", "bnb"),
+                workers=self.cfg.get("CALC_WORKERS", None),
+                budget=self.cfg.get("CALC_BUDGET", None),
+                required=[
+                    str(code) for code in self.cfg.get("CALC_REQUIRED") or []
+                ],
+                excluded=[
+                    str(code) for code in self.cfg.get("CALC_EXCLUDED") or []
+                ],
+                max_shared=self.cfg.get("CALC_MAX_SHARED", None),
+                max_jaccard=self.cfg.get("CALC_MAX_JACCARD", None),
+                collapse=bool(self.cfg.get("CALC_COLLAPSE", False)),
+                per_block=bool(self.cfg.get("CALC_PER_BLOCK", False)),
+                stock_filter=get_stock_filter(self.cfg),
+                progress=self.progress,
+            )
+        finally:
+            self.progress = None
+
+        if response["code"] == 403:
+            page.pubsub.send_all_on_topic(
+                topic="calc",
+                message="cancelled",
+            )
+        elif response["code"] != 200:
             self.calcAlertDialog.content = ft.Text(response["message"])
             ft.context.page.show_dialog(self.calcAlertDialog)
             ft.context.page.pubsub.send_all_on_topic(
@@ -250,6 +315,74 @@ class CalcButton(ft.FilledButton):
             )
 
 
+@ft.control
+class CancelCalcButton(ft.Button):
+    def __init__(
+        self,
+        calc_button: CalcButton,
+    ):
+        super().__init__(
+            content="取消计算",
+            icon=ft.Icons.CANCEL_OUTLINED,
+        )
+        self.calc_button = calc_button
+        self.on_click = self.button_clicked
+
+    async def button_clicked(self, __e__: ft.Event[ft.Button]) -> None:
+        self.calc_button.cancel()
+
+
+@ft.control
+class BatchCalcButton(ft.Button):
+    def __init__(
+        self,
+        async_session: async_sessionmaker[AsyncSession],
+        cfg: DictConfig,
+    ):
+        super().__init__(
+            content="批量计算",
+            icon=ft.Icons.LIBRARY_BOOKS_OUTLINED,
+        )
+        self.cfg = cfg
+        self.async_session = async_session
+        self.on_click = self.button_clicked
+        self.alertDialog = ft.AlertDialog(
+            modal=True,
+            icon=ft.Icon(ft.Icons.ERROR_OUTLINED, color=ft.Colors.ERROR),
+            alignment=ft.Alignment.CENTER,
+            actions=[
+                ft.TextButton(
+                    "确定", on_click=lambda __e__: ft.context.page.pop_dialog()
+                ),
+            ],
+        )
+
+    async def button_clicked(self, __e__: ft.Event[ft.Button]) -> None:
+        selected_files: List[ft.FilePickerFile] = await cast(
+            ft.FilePickerFile,
+            ft.FilePicker().pick_files(
+                allow_multiple=True,
+            ),
+        )
+        if not selected_files:
+            return
+
+        saved_dir: Optional[str] = await ft.FilePicker().get_directory_path()
+        if not saved_dir:
+            return
+
+        response = await batch_combination_count(
+            async_session=self.async_session,
+            mode_files=[cast(str, file.path) for file in selected_files],
+            path=saved_dir,
+            stock_filter=get_stock_filter(self.cfg),
+        )
+
+        if response["code"] != 200:
+            self.alertDialog.content = ft.Text(response["message"])
+            ft.context.page.show_dialog(self.alertDialog)
+
+
 @ft.control
 class ExportResultButton(ft.Button):
     def __init__(
@@ -289,6 +422,88 @@ class ExportResultButton(ft.Button):
             ft.context.page.show_dialog(self.alertDialog)
 
 
+@ft.control
+class ExportRankingButton(ft.Button):
+    def __init__(
+        self,
+        async_session: async_sessionmaker[AsyncSession],
+        cfg: DictConfig,
+    ):
+        super().__init__(
+            content="导出完整排名",
+            icon=ft.Icons.SORT_ROUNDED,
+        )
+        self.async_session = async_session
+        self.cfg = cfg
+        self.on_click = self.button_clicked
+        self.alertDialog = ft.AlertDialog(
+            modal=True,
+            icon=ft.Icon(ft.Icons.ERROR_OUTLINED, color=ft.Colors.ERROR),
+            alignment=ft.Alignment.CENTER,
+            actions=[
+                ft.TextButton(
+                    "确定", on_click=lambda __e__: ft.context.page.pop_dialog()
+                ),
+            ],
+        )
+
+    async def button_clicked(self, __e__: ft.Event[ft.Button]) -> None:
+        saved_dir: Optional[str] = await ft.FilePicker().get_directory_path()
+        if not saved_dir:
+            return
+
+        response = await export_ranking(
+            async_session=self.async_session,
+            path=saved_dir,
+            k=int(self.cfg.get("EXPORT_RANKING_K") or 3),
+            fmt=self.cfg.get("EXPORT_RANKING_FORMAT") or "csv",
+            with_stocks=bool(self.cfg.get("EXPORT_RANKING_STOCKS", False)),
+            stock_filter=get_stock_filter(self.cfg),
+        )
+
+        if response["code"] != 200:
+            self.alertDialog.content = ft.Text(response["message"])
+            ft.context.page.show_dialog(self.alertDialog)
+
+
+@ft.control
+class ExportBlockBestButton(ft.Button):
+    def __init__(
+        self,
+        async_session: async_sessionmaker[AsyncSession],
+    ):
+        super().__init__(
+            content="导出各板块最优组合",
+            icon=ft.Icons.TABLE_ROWS_OUTLINED,
+        )
+        self.async_session = async_session
+        self.on_click = self.button_clicked
+        self.alertDialog = ft.AlertDialog(
+            modal=True,
+            icon=ft.Icon(ft.Icons.ERROR_OUTLINED, color=ft.Colors.ERROR),
+            alignment=ft.Alignment.CENTER,
+            actions=[
+                ft.TextButton(
+                    "确定", on_click=lambda __e__: ft.context.page.pop_dialog()
+                ),
+            ],
+        )
+
+    async def button_clicked(self, __e__: ft.Event[ft.Button]) -> None:
+        saved_dir: Optional[str] = await ft.FilePicker().get_directory_path()
+        if not saved_dir:
+            return
+
+        response = await export_block_best(
+            async_session=self.async_session,
+            path=saved_dir,
+        )
+
+        if response["code"] != 200:
+            self.alertDialog.content = ft.Text(response["message"])
+            ft.context.page.show_dialog(self.alertDialog)
+
+
 @ft.control
 class InsertBlockButton(ft.Button):
     def __init__(
@@ -335,3 +550,54 @@ class InsertBlockButton(ft.Button):
 
             else:
                 ft.context.page.pubsub.send_all("block_inserted")
+
+
+@ft.control
+class RelatedBlocksButton(ft.Button):
+    def __init__(
+        self,
+        async_session: async_sessionmaker[AsyncSession],
+        dropdown_ref: ft.Dropdown,
+    ) -> None:
+        super().__init__(
+            content="相关板块",
+            icon=ft.Icons.HUB_OUTLINED,
+            expand=False,
+        )
+        self.async_session = async_session
+        self.dropdown_ref = dropdown_ref
+        self.on_click = self.button_clicked
+        self.relatedDialog = ft.AlertDialog(
+            modal=True,
+            alignment=ft.Alignment.CENTER,
+            actions=[
+                ft.TextButton(
+                    "确定", on_click=lambda __e__: ft.context.page.pop_dialog()
+                ),
+            ],
+        )
+
+    async def button_clicked(self, __e__: ft.Event[ft.Button]) -> None:
+        if not self.dropdown_ref.value:
+            return
+
+        related = await helpers.get_related_blocks(
+            async_session=self.async_session,
+            code=self.dropdown_ref.value,
+        )
+        self.relatedDialog.title = ft.Text(
+            f"{self.dropdown_ref.value} 相关板块"
+        )
+        self.relatedDialog.content = ft.Column(
+            controls=[
+                ft.Text(
+                    f"{row['code']} {row['name']} "
+                    f"共同股票 {row['overlap']} "
+                    f"相似度 {row['jaccard']:.2f}"
+                )
+                for row in related
+            ]
+            or [ft.Text("暂无数据，请先更新数据")],
+            tight=True,
+        )
+        ft.context.page.show_dialog(self.relatedDialog)
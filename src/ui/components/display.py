@@ -1,12 +1,12 @@
 import os
-from typing import Optional
+from typing import Any, Optional
 
 import flet as ft
 from omegaconf import DictConfig
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 import src.core.database.helpers as helpers
-from src.utils.types import Status
+from src.utils.types import CalcProgressDict, Status
 
 
 @ft.control
@@ -66,6 +66,7 @@ class DataInformationDisplay(ft.Card):
 
         self.expand = True
         self.async_session = async_session
+        self.progress: Optional[CalcProgressDict] = None
 
         self.elevation = 2
         self.shadow_color = ft.Colors.with_opacity(0.3, ft.Colors.BLACK)
@@ -78,17 +79,23 @@ class DataInformationDisplay(ft.Card):
         )
         ft.context.page.run_task(self._load_inital_status)
 
-    async def _subscriber_calc(self, topic: str, msg: str) -> None:
+    async def _subscriber_calc(self, topic: str, msg: Any) -> None:
         if topic == "calc":
+            if isinstance(msg, dict):
+                self.progress = msg  # pyright: ignore
+                ft.context.page.run_task(self._handle_refresh)
             if msg == "start":
                 ft.context.page.run_task(self.calc_start)
             if msg == "error":
                 ft.context.page.run_task(self.calc_error)
             if msg == "end":
                 ft.context.page.run_task(self.calc_end)
+            if msg == "cancelled":
+                ft.context.page.run_task(self.calc_cancelled)
 
     async def calc_start(self):
         self.status["calc"] = 1
+        self.progress = None
         await self._handle_refresh()
 
     async def calc_error(self):
@@ -99,6 +106,10 @@ class DataInformationDisplay(ft.Card):
         self.status["calc"] = 3
         await self._handle_refresh()
 
+    async def calc_cancelled(self):
+        self.status["calc"] = 4
+        await self._handle_refresh()
+
     async def _subscriber(self, msg: str) -> None:
         if msg == "data_before_update":
             ft.context.page.run_task(self.data_before_update)
@@ -233,12 +244,14 @@ class DataInformationDisplay(ft.Card):
             1: "开始",
             2: "错误",
             3: "结束",
+            4: "已取消",
         }
         calc_color = {
             0: ft.Colors.BLACK,
             1: ft.Colors.BLUE,
             2: ft.Colors.RED,
             3: ft.Colors.ORANGE,
+            4: ft.Colors.GREY,
         }
 
         calc_row = ft.Row(
@@ -261,6 +274,28 @@ class DataInformationDisplay(ft.Card):
             alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
         )
 
+        progress_text = "-"
+        if self.progress is not None and self.status["calc"] == 1:
+            eta = self.progress["eta"]
+            progress_text = (
+                f"{self.progress['done']}/{self.progress['total']} "
+                f"{self.progress['rate']:.0f}/s "
+                f"剩余 {'-' if eta is None else f'{eta:.0f}s'} "
+                f"最佳 {self.progress['best']}"
+            )
+
+        progress_row = ft.Row(
+            controls=[
+                ft.Text("计算进度:", size=14),
+                ft.Text(
+                    progress_text,
+                    size=14,
+                    text_align=ft.TextAlign.RIGHT,
+                ),
+            ],
+            alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+        )
+
         self.content = ft.Container(
             content=ft.Column(
                 controls=[
@@ -272,6 +307,7 @@ class DataInformationDisplay(ft.Card):
                     update_row,
                     ft.Divider(height=1, thickness=1, color=ft.Colors.BLACK12),
                     calc_row,
+                    progress_row,
                 ],
                 spacing=12,
                 tight=True,
@@ -0,0 +1,62 @@
+import flet as ft
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core import lookup_stock
+
+
+@ft.control
+class StockLookupField(ft.TextField):
+    def __init__(
+        self,
+        async_session: async_sessionmaker[AsyncSession],
+    ) -> None:
+        super().__init__(
+            label="股票代码",
+            hint_text="查询所属板块及组合",
+            width=200,
+            expand=False,
+            prefix_icon=ft.Icons.SEARCH,
+            on_submit=self.field_submitted,
+        )
+        self.async_session = async_session
+        self.lookupDialog = ft.AlertDialog(
+            modal=True,
+            alignment=ft.Alignment.CENTER,
+            actions=[
+                ft.TextButton(
+                    "确定", on_click=lambda __e__: ft.context.page.pop_dialog()
+                ),
+            ],
+        )
+
+    async def field_submitted(self, __e__: ft.Event[ft.TextField]) -> None:
+        code = (self.value or "").strip()
+        if not code:
+            return
+
+        response = await lookup_stock(
+            async_session=self.async_session,
+            code=code,
+        )
+        self.lookupDialog.title = ft.Text(f"{code} 查询结果")
+        if response["code"] != 200:
+            self.lookupDialog.content = ft.Text(response["message"])
+        else:
+            data = response["data"]
+            blocks = " ".join(data["blocks"])
+            ranks = "、".join(f"ZH{rank}" for rank in data["results"])
+            self.lookupDialog.content = ft.Column(
+                controls=[
+                    ft.Text(f"所属模式板块: {blocks or '无'}"),
+                    ft.Text(f"所在计算结果: {ranks or '无'}"),
+                    ft.Text("包含该股票的最优组合:"),
+                    *[
+                        ft.Text(
+                            f"{' '.join(row['blocks'])} 共同股票 {row['count']}"
+                        )
+                        for row in data["ranking"]
+                    ],
+                ],
+                tight=True,
+            )
+        ft.context.page.show_dialog(self.lookupDialog)
@@ -1,7 +1,16 @@
 import flet as ft
+from omegaconf import DictConfig
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from src.ui.components.button import CalcButton, ExportResultButton
+from src.ui.components.button import (
+    BatchCalcButton,
+    CalcButton,
+    CancelCalcButton,
+    ExportBlockBestButton,
+    ExportRankingButton,
+    ExportResultButton,
+)
+from src.ui.components.textfield import StockLookupField
 
 
 @ft.control
@@ -9,16 +18,35 @@ class CalcView(ft.Container):
     def __init__(
         self,
         async_session: async_sessionmaker[AsyncSession],
+        cfg: DictConfig,
     ):
         super().__init__()
-        self.calcButton = CalcButton(async_session=async_session)
+        self.calcButton = CalcButton(async_session=async_session, cfg=cfg)
+        self.cancelCalcButton = CancelCalcButton(calc_button=self.calcButton)
+        self.batchCalcButton = BatchCalcButton(
+            async_session=async_session,
+            cfg=cfg,
+        )
         self.exportResultButton = ExportResultButton(
             async_session=async_session
         )
+        self.exportRankingButton = ExportRankingButton(
+            async_session=async_session,
+            cfg=cfg,
+        )
+        self.exportBlockBestButton = ExportBlockBestButton(
+            async_session=async_session
+        )
+        self.stockLookupField = StockLookupField(async_session=async_session)
         self.content = ft.Row(
             controls=[
                 self.calcButton,
+                self.cancelCalcButton,
+                self.batchCalcButton,
                 self.exportResultButton,
+                self.exportRankingButton,
+                self.exportBlockBestButton,
+                self.stockLookupField,
             ],
             spacing=10,
             alignment=ft.MainAxisAlignment.START,
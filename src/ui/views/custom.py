@@ -1,7 +1,7 @@
 import flet as ft
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from src.ui.components.button import InsertBlockButton
+from src.ui.components.button import InsertBlockButton, RelatedBlocksButton
 from src.ui.components.dropdown import BlocksDropdown
 
 
@@ -18,10 +18,16 @@ class CustomBlockView(ft.Container):
             dropdown_ref=self.blocksDropdown,
         )
 
+        self.relatedBlocksButton = RelatedBlocksButton(
+            async_session=async_session,
+            dropdown_ref=self.blocksDropdown,
+        )
+
         self.content = ft.Row(
             controls=[
                 self.blocksDropdown,
                 self.insertBlockButton,
+                self.relatedBlocksButton,
             ],
             spacing=10,
             alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
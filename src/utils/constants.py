@@ -7,3 +7,5 @@ dirs = PlatformDirs(appname="tdx-combine")
 CONFIG_PATH = os.path.join(dirs.user_data_dir, "config.yaml")
 DATABASE_PATH = os.path.join(dirs.user_data_dir, "model.db")
 DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+CALC_CACHE_MAX_SIZE = 16 * 1024 * 1024
+CALC_STATE_MAX_COUNT = 8
@@ -1,5 +1,20 @@
 from datetime import datetime
-from typing import Any, List, Optional, TypedDict
+from typing import Any, Dict, List, Literal, Optional, Tuple, TypedDict
+
+import numpy as np
+
+
+CalcEngine = Literal[
+    "bnb",
+    "parallel",
+    "matrix",
+    "bitset",
+    "minhash",
+    "sql_join",
+    "sql",
+]
+
+RankingFormat = Literal["csv", "parquet"]
 
 
 class CombinationResultDict(TypedDict):
@@ -8,17 +23,142 @@ class CombinationResultDict(TypedDict):
     count: int
 
 
+class CalcStateDict(TypedDict):
+    """Ranking kept for the incremental calculation, see 'CalcState'."""
+
+    version: int
+    k: int
+    codes: List[str]
+    ranking: List[Tuple[List[str], int]]
+    complete: bool
+
+
+class CachedResultDict(TypedDict):
+    """Cached calculation, the result rows and the blocks standing for others."""
+
+    result: List[CombinationResultDict]
+    equivalents: Dict[str, List[str]]
+
+
+class BlockBestDict(TypedDict):
+    block: str
+    blocks: List[str]
+    stocks: List[str]
+    count: int
+
+
+class CombinationCountDict(TypedDict):
+    blocks: List[str]
+    count: int
+
+
+class StockLookupDict(TypedDict):
+    code: str
+    blocks: List[str]
+    results: List[int]
+    ranking: List[CombinationCountDict]
+
+
+class CalcProgressDict(TypedDict):
+    done: int
+    total: int
+    rate: float
+    eta: Optional[float]
+    best: int
+
+
+class StockFilterDict(TypedDict, total=False):
+    regions: List[int]
+    prefixes: List[str]
+    codes: List[str]
+
+
 class StockDict(TypedDict):
     code: str
     region: int
 
 
+class StockColumnsDict(TypedDict):
+    """Columnar stocks of 'get_stock_columns'.
+
+    ``code`` and ``region`` hold one entry per stock, ``stock`` and
+    ``block`` one entry per association: the position of the stock in
+    ``code`` and the code of the block.
+    """
+
+    code: np.ndarray
+    region: np.ndarray
+    stock: np.ndarray
+    block: np.ndarray
+
+
+class DatabaseDiffDict(TypedDict):
+    """Changes applied by an incremental update.
+
+    ``block_ids`` holds the kept or added blocks whose stocks changed.
+    """
+
+    blocks_added: int
+    blocks_removed: int
+    blocks_renamed: int
+    stocks_added: int
+    stocks_removed: int
+    stocks_changed: int
+    memberships_added: int
+    memberships_removed: int
+    block_ids: List[int]
+
+
+class UpdateResultDict(TypedDict):
+    """Data of an update, with the wall time of every stage in seconds.
+
+    The parsing stages run in threads and overlap the loading stages.
+    """
+
+    diff: Optional[DatabaseDiffDict]
+    timings: Dict[str, float]
+
+
+class SourceListingDict(TypedDict):
+    """Blocks whose stocks a TDX file lists, and the region of its stocks."""
+
+    blocks: List[str]
+    stocks: Dict[str, int]
+
+
+class SourceFileDict(TypedDict):
+    """Manifest entry of a TDX file.
+
+    ``content`` is the listing of tdxhy.cfg or infoharbor_block.dat,
+    None for tdxzs3.cfg and for a file not loaded yet.
+    """
+
+    name: str
+    size: int
+    mtime_ns: int
+    digest: str
+    content: Optional[SourceListingDict]
+
+
 class InfoharborDataDict(TypedDict):
     code: str
     name: str
     stocks: List[StockDict]
 
 
+class AdditionBlockDict(TypedDict):
+    """Concept block of 'iter_addition'.
+
+    ``stocks`` holds the int32 stock codes and ``regions`` the uint8
+    region of every stock.
+    """
+
+    code: str
+    name: str
+    stocks: np.ndarray
+    regions: np.ndarray
+
+
 class Response(TypedDict):
     code: int
     message: str
@@ -0,0 +1,39 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, TypeVar
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.database import create_async_session
+
+
+T = TypeVar("T")
+
+Run = Callable[
+    [Callable[[async_sessionmaker[AsyncSession]], Awaitable[T]]],
+    T,
+]
+
+
+@pytest.fixture
+def run(tmp_path) -> Run:
+    """Run a coroutine function on a fresh database in its own event loop.
+
+    Every call gets a new database file, engines are bound to the loop
+    they were created in so the session factory never outlives the call.
+    """
+    calls = iter(range(1_000))
+
+    def run(main):
+        url = (
+            f"sqlite+aiosqlite:///{os.path.join(tmp_path, f'{next(calls)}.db')}"
+        )
+
+        async def wrapper():
+            async_session = await create_async_session(url)
+            return await main(async_session)
+
+        return asyncio.run(wrapper())
+
+    return run
@@ -0,0 +1,312 @@
+import itertools
+from math import comb
+
+import numpy as np
+import pytest
+from sqlalchemy import insert, literal, select
+
+from src.core.calc import BlockIndex, diverse_top_combinations, select_diverse
+from src.core.calc.benchmark import populate_synthetic
+from src.core.calc.index import pack_membership
+from src.core.calc.minhash import minhash_top_combinations
+from src.core.calc.parallel import parallel_top_combinations
+from src.core.calc.progress import CalcCancelled, CalcProgress
+from src.core.calc.search import (
+    anytime_top_combinations,
+    bnb_top_combinations,
+    iter_top_combinations,
+)
+from src.core.combine import get_combination_count
+from src.core.database import (
+    Block,
+    CalcEquivalent,
+    CalcResult,
+    Mode,
+    Stock,
+    stock_block_association,
+)
+
+
+def random_index(seed: int, n_blocks: int = 30, n_stocks: int = 200):
+    """Random mode list with a few equal blocks and many equal counts."""
+    rng = np.random.default_rng(seed)
+    member = rng.random((n_blocks, n_stocks)) < rng.uniform(
+        0.1, 0.6, size=(n_blocks, 1)
+    )
+    member[1::7] = member[0]
+    block_pos, stock_pos = np.nonzero(member)
+    return BlockIndex(
+        codes=[f"88{i:04d}" for i in range(n_blocks)],
+        stock_ids=np.arange(n_stocks, dtype=np.int64),
+        bits=pack_membership(stock_pos, block_pos, n_blocks, n_stocks),
+    )
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+@pytest.mark.parametrize("k", [2, 4])
+def test_parallel_matches_bnb(seed, k):
+    index = random_index(seed)
+    expected = bnb_top_combinations(index, top_n=10, k=k)
+
+    progress = CalcProgress()
+    progress.start(comb(index.n_blocks, k))
+    assert (
+        parallel_top_combinations(
+            index,
+            top_n=10,
+            k=k,
+            workers=2,
+            progress=progress,
+        )
+        == expected
+    )
+    assert progress.done == progress.total
+
+
+def test_parallel_cancel_stops_the_workers():
+    progress = CalcProgress()
+    progress.cancel()
+    with pytest.raises(CalcCancelled):
+        parallel_top_combinations(
+            random_index(2, n_blocks=80),
+            top_n=10,
+            k=5,
+            workers=2,
+            progress=progress,
+        )
+
+
+def full_ranking(index, k, required=(), excluded=()):
+    """Every combination with the required blocks and no excluded one."""
+    ranking = [
+        (combo, len(index.intersection(combo)))
+        for combo in itertools.combinations(range(index.n_blocks), k)
+        if set(required) <= set(combo) and not set(excluded) & set(combo)
+    ]
+    return sorted(ranking, key=lambda item: (-item[1], item[0]))
+
+
+@pytest.mark.parametrize(
+    "k, required, excluded",
+    [
+        (3, (), ()),
+        (4, (), (0, 5)),
+        (3, (2,), (1,)),
+        (3, (2, 9), ()),
+        (2, (2, 9), ()),
+    ],
+)
+@pytest.mark.parametrize(
+    "max_shared, max_jaccard", [(0, None), (1, 0.3), (None, 0.1)]
+)
+def test_diverse_matches_full_ranking(
+    k, required, excluded, max_shared, max_jaccard
+):
+    index = random_index(3, n_blocks=16, n_stocks=60)
+    ranking = full_ranking(index, k, required, excluded)
+
+    progress = CalcProgress()
+    progress.start(len(ranking))
+    assert diverse_top_combinations(
+        index,
+        top_n=5,
+        k=k,
+        max_shared=max_shared,
+        max_jaccard=max_jaccard,
+        required=required,
+        excluded=excluded,
+        progress=progress,
+    ) == select_diverse(
+        ranking,
+        index,
+        top_n=5,
+        max_shared=max_shared,
+        max_jaccard=max_jaccard,
+    )
+    assert progress.done == progress.total
+
+
+@pytest.mark.parametrize(
+    "k, required, excluded", [(3, (), ()), (4, (2,), (1,)), (2, (2, 9), ())]
+)
+def test_iter_top_combinations_matches_full_ranking(k, required, excluded):
+    # Rounds of one, two, four... combinations cut through every tie.
+    index = random_index(4, n_blocks=14, n_stocks=40)
+    ranking = iter_top_combinations(
+        index, k, depth=1, required=required, excluded=excluded
+    )
+    assert list(ranking) == full_ranking(index, k, required, excluded)
+
+
+async def calc_results(async_session, **params):
+    response = await get_combination_count(
+        async_session=async_session,
+        cache=False,
+        incremental=False,
+        **params,
+    )
+    assert response["code"] == 200
+    async with async_session() as session:
+        rows = await session.execute(
+            select(CalcResult.blocks, CalcResult.count).order_by(CalcResult.id)
+        )
+    return [tuple(row) for row in rows.all()], response["data"]["optimal"]
+
+
+@pytest.mark.parametrize(
+    "engine, k",
+    [
+        ("bnb", 2),
+        ("bnb", 3),
+        ("matrix", 3),
+        ("bitset", 3),
+        ("parallel", 3),
+        ("sql_join", 2),
+        ("sql_join", 3),
+    ],
+)
+def test_engine_matches_sql_reference(run, engine, k):
+    async def main(async_session):
+        await populate_synthetic(async_session, 16, 120, seed=4)
+        return (
+            await calc_results(async_session, engine=engine, k=k, top_n=5),
+            await calc_results(async_session, engine="sql", k=k, top_n=5),
+        )
+
+    (result, optimal), (expected, _) = run(main)
+    assert result == expected
+    assert optimal
+
+
+@pytest.mark.parametrize("engine", ["bnb", "sql_join"])
+@pytest.mark.parametrize("k", [2, 3])
+def test_engine_pads_zero_counts(run, engine, k):
+    # Only the first three blocks share stocks.
+    members = {1: [1, 2, 3], 2: [2, 3], 3: [3, 4], 4: [5], 5: [6]}
+
+    async def main(async_session):
+        async with async_session() as session:
+            await session.execute(
+                insert(Block.__table__),
+                [
+                    {"id": block, "code": f"88{block:04d}", "name": "板块"}
+                    for block in members
+                ],
+            )
+            await session.execute(
+                insert(Stock.__table__),
+                [
+                    {"id": stock, "code": f"{stock:06d}", "region": 0}
+                    for stock in range(1, 7)
+                ],
+            )
+            await session.execute(
+                insert(stock_block_association),
+                [
+                    {"stock_id": stock, "block_id": block}
+                    for block, stocks in members.items()
+                    for stock in stocks
+                ],
+            )
+            await session.execute(
+                insert(Mode.__table__),
+                [
+                    {"code": f"88{block:04d}", "name": "板块", "count": 0}
+                    for block in members
+                ],
+            )
+            await session.commit()
+
+        return (
+            await calc_results(async_session, engine=engine, k=k, top_n=6),
+            await calc_results(async_session, engine="sql", k=k, top_n=6),
+        )
+
+    (result, _), (expected, _) = run(main)
+    assert result == expected
+    assert len(result) == 6
+
+
+def test_minhash_counts_are_exact(run):
+    async def main(async_session):
+        await populate_synthetic(async_session, 16, 120, seed=4)
+        return (
+            await calc_results(async_session, engine="minhash", top_n=5),
+            await calc_results(async_session, engine="sql", top_n=5),
+        )
+
+    (result, optimal), (expected, _) = run(main)
+    # The ranking is approximate, the counts of its combinations are not.
+    assert not optimal
+    assert len(result) == len(expected)
+    for (_, count), (_, best) in zip(result, expected):
+        assert count <= best
+
+
+def test_minhash_reports_progress():
+    reports = []
+    progress = CalcProgress(callback=reports.append, interval=0)
+    index = random_index(1)
+    progress.start(comb(index.n_blocks, 3))
+    ranking = minhash_top_combinations(index, top_n=5, k=3, progress=progress)
+
+    # The pairs, then the shortlisted pairs extended by one block.
+    assert progress.done > comb(index.n_blocks, 2)
+    assert reports[-1]["best"] == ranking[0][1]
+
+
+def test_anytime_reports_whether_optimal():
+    index = random_index(5)
+    ranking, optimal = anytime_top_combinations(index, top_n=5, k=3, budget=60)
+    assert optimal
+    assert ranking == bnb_top_combinations(index, top_n=5, k=3)
+
+    ranking, optimal = anytime_top_combinations(
+        random_index(5, n_blocks=120, n_stocks=2_000),
+        top_n=5,
+        k=4,
+        budget=0,
+    )
+    assert not optimal
+    assert len(ranking) == 5
+
+
+def test_collapse_keeps_the_required_code(run):
+    async def main(async_session):
+        await populate_synthetic(async_session, 16, 120, seed=4)
+        # 880016 holds the same stocks as 880003, which stands for both.
+        async with async_session() as session:
+            await session.execute(
+                insert(Block).values(id=17, code="880016", name="dup")
+            )
+            await session.execute(
+                insert(stock_block_association).from_select(
+                    ["stock_id", "block_id"],
+                    select(
+                        stock_block_association.c.stock_id, literal(17)
+                    ).where(stock_block_association.c.block_id == 4),
+                )
+            )
+            await session.execute(
+                insert(Mode).values(code="880016", name="dup", count=0)
+            )
+            await session.commit()
+
+        await get_combination_count(
+            async_session=async_session,
+            cache=False,
+            required=["880016"],
+            collapse=True,
+        )
+        async with async_session() as session:
+            rows = await session.scalars(select(CalcResult.blocks))
+            equivalents = await session.execute(
+                select(CalcEquivalent.block, CalcEquivalent.codes)
+            )
+            return rows.all(), dict(equivalents.all())
+
+    rows, equivalents = run(main)
+    assert rows
+    for blocks in rows:
+        assert "880016" in blocks and "880003" not in blocks
+    assert equivalents == {"880016": ["880003", "880016"]}
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+from sqlalchemy import delete, insert, select
+
+from src.core.calc import BlockIndex
+from src.core.calc.benchmark import populate_synthetic
+from src.core.calc.incremental import CalcState, update_state
+from src.core.calc.index import pack_membership
+from src.core.calc.search import bnb_top_combinations
+from src.core.combine import get_combination_count
+from src.core.database import (
+    CalcRankingState,
+    CalcResult,
+    Mode,
+    bump_dataset_version,
+)
+
+
+def tied_index(seed: int, rows) -> BlockIndex:
+    """Blocks over a few stocks, so many combinations count the same."""
+    rng = np.random.default_rng(seed)
+    member = rng.random((14, 12)) < 0.6
+    block_pos, stock_pos = np.nonzero(member[list(rows)])
+    return BlockIndex(
+        codes=[f"88{i:04d}" for i in rows],
+        stock_ids=np.arange(12, dtype=np.int64),
+        bits=pack_membership(stock_pos, block_pos, len(rows), 12),
+    )
+
+
+@pytest.mark.parametrize("seed", range(24))
+def test_update_state_matches_full_search(seed):
+    # Removed, added and moved blocks, ties are broken by the new order.
+    before = tied_index(seed, range(12))
+    after = tied_index(seed, [0, 2, 3, 5, 6, 7, 8, 9, 10, 11, 12, 13, 1])
+
+    state = CalcState.from_ranking(
+        version=0,
+        k=3,
+        index=before,
+        ranking=bnb_top_combinations(before, top_n=6, k=3),
+        depth=6,
+    )
+    updated = update_state(state, after, top_n=3, depth=6)
+    assert updated is None or updated.positions(after)[:3] == (
+        bnb_top_combinations(after, top_n=3, k=3)
+    )
+
+
+async def results(async_session):
+    async with async_session() as session:
+        rows = await session.execute(
+            select(CalcResult.blocks, CalcResult.count).order_by(CalcResult.id)
+        )
+    return [tuple(row) for row in rows.all()]
+
+
+async def set_mode(async_session, codes):
+    async with async_session() as session:
+        await session.execute(delete(Mode))
+        await session.execute(
+            insert(Mode),
+            [{"code": code, "name": code, "count": 0} for code in codes],
+        )
+        await session.commit()
+
+
+def test_incremental_matches_full_recalc(run):
+    codes = [f"88{i:04d}" for i in range(24)]
+    steps = [
+        codes[:20],
+        codes[:20] + codes[20:],
+        codes[2:10] + codes[12:],
+        codes[2:10] + codes[12:] + codes[:2],
+    ]
+
+    async def main(async_session):
+        await populate_synthetic(async_session, 24, 60, seed=1)
+        ranked = []
+        for step in steps:
+            await set_mode(async_session, step)
+            ranking = []
+            for incremental in (True, False):
+                response = await get_combination_count(
+                    async_session=async_session,
+                    top_n=5,
+                    cache=False,
+                    incremental=incremental,
+                )
+                assert response["code"] == 200
+                ranking.append(await results(async_session))
+            ranked.append(ranking)
+
+        async with async_session() as session:
+            stored = len(
+                (await session.scalars(select(CalcRankingState))).all()
+            )
+        await bump_dataset_version(async_session=async_session)
+        async with async_session() as session:
+            dropped = not (
+                await session.scalars(select(CalcRankingState))
+            ).all()
+        return ranked, stored, dropped
+
+    ranked, stored, dropped = run(main)
+    for incremental, full in ranked:
+        assert incremental == full
+    assert stored == 1
+    assert dropped
@@ -0,0 +1,351 @@
+import asyncio
+import gc
+import threading
+from typing import List
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+import src.core.update
+from src.core.database import (
+    Block,
+    Stock,
+    stock_block_association,
+    update_database,
+)
+from src.core.update import update_data
+from src.utils.types import AdditionBlockDict, StockColumnsDict
+
+
+def tdx_data(seed: int, n_blocks: int = 12, n_stocks: int = 80):
+    """Random TDX inputs: blocks, tdxhy.cfg columns and concept blocks."""
+    rng = np.random.default_rng(seed)
+    blocks = [
+        {"code": f"88{i:04d}", "name": f"板块{i}{seed if i % 4 else ''}"}
+        for i in range(n_blocks)
+        if rng.random() > 0.1
+    ]
+    codes = [block["code"] for block in blocks]
+    industry, concept = codes[: len(codes) // 2], codes[len(codes) // 2 :]
+
+    listed = np.flatnonzero(rng.random(n_stocks) > 0.15)
+    stock_pos, block_pos = np.nonzero(
+        rng.random((len(listed), len(industry))) < 0.3
+    )
+    stocks: StockColumnsDict = {
+        "code": np.array([f"{i:06d}" for i in listed], dtype=object),
+        "region": rng.integers(0, 2, size=len(listed)),
+        "stock": stock_pos.astype(np.int64),
+        "block": np.array(industry, dtype=object)[block_pos],
+    }
+    addition: List[AdditionBlockDict] = []
+    for code in concept:
+        members = np.flatnonzero(rng.random(n_stocks) < 0.3)
+        addition.append(
+            {
+                "code": code,
+                "name": code,
+                "stocks": members.astype(np.int32),
+                "regions": np.full(len(members), 2, dtype=np.uint8),
+            }
+        )
+    return blocks, stocks, addition
+
+
+async def snapshot(async_session):
+    async with async_session() as session:
+        blocks = (await session.execute(select(Block.code, Block.name))).all()
+        stocks = (await session.execute(select(Stock.code, Stock.region))).all()
+        pairs = (
+            await session.execute(
+                select(Stock.code, Block.code)
+                .join(
+                    stock_block_association,
+                    stock_block_association.c.stock_id == Stock.id,
+                )
+                .join(Block, Block.id == stock_block_association.c.block_id)
+            )
+        ).all()
+    return set(blocks), set(stocks), set(pairs)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_diff_update_matches_clear_reload(run, seed):
+    old, new = tdx_data(seed), tdx_data(seed + 100)
+
+    async def diffed(async_session):
+        await update_database(async_session, *old, is_clear=True)
+        diff = await update_database(async_session, *new, is_clear=False)
+        return diff, await snapshot(async_session)
+
+    async def reloaded(async_session):
+        await update_database(async_session, *new, is_clear=True)
+        return await snapshot(async_session)
+
+    diff, tables = run(diffed)
+    assert tables == run(reloaded)
+    assert diff is not None and diff["memberships_added"] > 0
+
+
+def test_diff_update_without_changes_is_empty(run):
+    data = tdx_data(7)
+
+    async def main(async_session):
+        await update_database(async_session, *data, is_clear=True)
+        return await update_database(async_session, *data, is_clear=False)
+
+    diff = run(main)
+    assert diff is not None
+    assert diff["block_ids"] == []
+    assert not any(value for key, value in diff.items() if key != "block_ids")
+
+
+def test_diff_update_drops_unknown_blocks(run):
+    blocks, stocks, addition = tdx_data(4)
+    unknown: AdditionBlockDict = {
+        "code": "889999",
+        "name": "未知",
+        "stocks": np.array([1, 2, 3], dtype=np.int32),
+        "regions": np.zeros(3, dtype=np.uint8),
+    }
+
+    async def main(async_session):
+        with pytest.warns(RuntimeWarning, match="889999"):
+            await update_database(
+                async_session,
+                blocks,
+                stocks,
+                addition + [unknown],
+                is_clear=False,
+            )
+        async with async_session() as session:
+            block_ids = set(
+                (await session.execute(select(Block.id))).scalars().all()
+            )
+            pairs = (
+                await session.execute(
+                    select(stock_block_association.c.block_id)
+                )
+            ).scalars()
+            return block_ids, set(pairs.all())
+
+    block_ids, used = run(main)
+    assert used and used <= block_ids
+
+
+def write_tdx_files(path, blocks, stocks, addition) -> None:
+    """Write the inputs of 'tdx_data' as the three TDX cache files."""
+    with open(path / "tdxzs3.cfg", "w", encoding="gbk") as f:
+        for i, block in enumerate(blocks):
+            f.write(f"{block['name']}|{block['code']}|2|1|0|T{i:04d}\n")
+    re_codes = {block["code"]: f"T{i:04d}" for i, block in enumerate(blocks)}
+
+    memberships: dict = {}
+    for stock, block in zip(stocks["stock"], stocks["block"]):
+        memberships.setdefault(int(stock), []).append(re_codes[block])
+    with open(path / "tdxhy.cfg", "w", encoding="gbk") as f:
+        for i, (code, region) in enumerate(
+            zip(stocks["code"], stocks["region"])
+        ):
+            columns = (memberships.get(i, []) + [""] * 4)[:4]
+            if any(columns):
+                f.write(f"{region}|{code}|{'|'.join(columns)}\n")
+
+    with open(path / "infoharbor_block.dat", "w", encoding="gbk") as f:
+        for block in addition:
+            f.write(
+                f"#GN_{block['name']},{len(block['stocks'])},{block['code']}\n"
+            )
+            f.write(
+                ",".join(
+                    f"{region}#{code:06d}"
+                    for code, region in zip(block["stocks"], block["regions"])
+                )
+                + "\n"
+            )
+
+
+def update(async_session, path, is_clear):
+    return update_data(
+        async_session=async_session,
+        TDX_CACHE_DIR=path,
+        BLOCK_PATH="tdxzs3.cfg",
+        STOCK_PATH="tdxhy.cfg",
+        ADDITIONAL_PATH="infoharbor_block.dat",
+        is_clear=is_clear,
+    )
+
+
+def without_stocks(data, n: int):
+    """``data`` of 'tdx_data' without its first ``n`` stocks, same blocks."""
+    blocks, stocks, addition = data
+    kept = stocks["stock"] >= n
+    removed = {int(code) for code in stocks["code"][:n]}
+    return (
+        blocks,
+        {
+            "code": stocks["code"][n:],
+            "region": stocks["region"][n:],
+            "stock": stocks["stock"][kept] - n,
+            "block": stocks["block"][kept],
+        },
+        [
+            {
+                **block,
+                "stocks": block["stocks"][keep],
+                "regions": block["regions"][keep],
+            }
+            for block in addition
+            for keep in [~np.isin(block["stocks"], list(removed))]
+        ],
+    )
+
+
+def other_addition(data, seed: int):
+    """``data`` of 'tdx_data' with new concept blocks, the first dropped."""
+    blocks, stocks, addition = data
+    rng = np.random.default_rng(seed)
+    concept = []
+    for block in addition[1:]:
+        members = np.flatnonzero(rng.random(80) < 0.3)
+        concept.append(
+            {
+                **block,
+                "stocks": members.astype(np.int32),
+                "regions": np.full(len(members), 2, dtype=np.uint8),
+            }
+        )
+    return blocks, stocks, concept
+
+
+def other_stocks(data, n: int):
+    """``data`` of 'tdx_data' whose tdxhy.cfg lost ``n`` stocks and moved."""
+    blocks, stocks, addition = data
+    kept = stocks["stock"] >= n
+    return (
+        blocks,
+        {
+            "code": stocks["code"][n:],
+            "region": 1 - stocks["region"][n:],
+            "stock": stocks["stock"][kept] - n,
+            "block": stocks["block"][kept],
+        },
+        addition,
+    )
+
+
+@pytest.mark.parametrize("is_clear", [False, True])
+@pytest.mark.parametrize(
+    "new_data",
+    [
+        tdx_data(6),
+        without_stocks(tdx_data(5), 10),
+        other_addition(tdx_data(5), 6),
+        other_stocks(tdx_data(5), 10),
+    ],
+    ids=["all_files", "stocks_removed", "addition_only", "stocks_only"],
+)
+def test_update_data_matches_clear_reload(run, tmp_path, is_clear, new_data):
+    old, new = tmp_path / "old", tmp_path / "new"
+    old.mkdir()
+    new.mkdir()
+    write_tdx_files(old, *tdx_data(5))
+    write_tdx_files(new, *new_data)
+
+    async def updated(async_session):
+        first = await update(async_session, old, is_clear=True)
+        second = await update(async_session, new, is_clear=is_clear)
+        unchanged = await update(async_session, new, is_clear=is_clear)
+        assert (first["code"], second["code"]) == (200, 200), second
+        assert unchanged["message"] == "数据未发生变化"
+        return await snapshot(async_session)
+
+    async def reloaded(async_session):
+        response = await update(async_session, new, is_clear=True)
+        assert response["code"] == 200, response
+        return await snapshot(async_session)
+
+    assert run(updated) == run(reloaded)
+
+
+@pytest.mark.parametrize(
+    "new_data, parsed",
+    [
+        (other_addition(tdx_data(5), 6), {"parse_addition"}),
+        (other_stocks(tdx_data(5), 10), {"parse_blocks", "parse_stocks"}),
+    ],
+    ids=["addition_only", "stocks_only"],
+)
+def test_update_data_parses_only_changed_files(run, tmp_path, new_data, parsed):
+    old, new = tmp_path / "old", tmp_path / "new"
+    old.mkdir()
+    new.mkdir()
+    write_tdx_files(old, *tdx_data(5))
+    write_tdx_files(new, *new_data)
+
+    async def main(async_session):
+        await update(async_session, old, is_clear=True)
+        return await update(async_session, new, is_clear=False)
+
+    response = run(main)
+    assert response["code"] == 200, response
+    timings = response["data"]["timings"]
+    assert {key for key in timings if key.startswith("parse_")} == parsed
+    assert "load_blocks" not in timings
+
+
+def test_update_data_retrieves_parser_errors(run, tmp_path):
+    write_tdx_files(tmp_path, *tdx_data(8))
+    # The addition fails on its first header while the long tdxhy.cfg is
+    # still parsed, which then fails too.
+    (tmp_path / "infoharbor_block.dat").write_bytes(b"#GN_\xff\xff,1,X\n")
+    with open(tmp_path / "tdxhy.cfg", "a") as f:
+        f.write("0|000001|T0000|||\n" * 200_000 + "0|1|2|3|4|5|6|7\n")
+    errors: list = []
+
+    async def main(async_session):
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda loop, context: errors.append(context))
+        response = await update(async_session, tmp_path, is_clear=False)
+        pending = asyncio.all_tasks() - {asyncio.current_task()}
+        gc.collect()
+        return response, pending
+
+    response, pending = run(main)
+    assert response["code"] == 300
+    assert not pending
+    assert not errors
+
+
+@pytest.mark.parametrize("is_clear", [False, True])
+def test_update_data_loads_stocks_before_the_addition(
+    run, tmp_path, monkeypatch, is_clear
+):
+    write_tdx_files(tmp_path, *tdx_data(9))
+    loaded = threading.Event()
+    for name in ["stock_diff2database", "stock_columns2database"]:
+        loader = getattr(src.core.update, name)
+
+        async def signal(*args, loader=loader, **kwargs):
+            result = await loader(*args, **kwargs)
+            loaded.set()
+            return result
+
+        monkeypatch.setattr(src.core.update, name, signal)
+
+    iter_addition = src.core.update.iter_addition
+
+    def held(path):
+        # The addition is parsed only once the stocks are written.
+        if not loaded.wait(timeout=10):
+            raise TimeoutError("the stocks wait for the addition")
+        yield from iter_addition(path=path)
+
+    monkeypatch.setattr(src.core.update, "iter_addition", held)
+
+    async def main(async_session):
+        return await update(async_session, tmp_path, is_clear=is_clear)
+
+    response = run(main)
+    assert response["code"] == 200, response